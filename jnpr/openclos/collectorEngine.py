@@ -0,0 +1,198 @@
+'''
+Created on Oct 18, 2026
+'''
+import sys
+import time
+import threading
+import logging
+import collections
+import concurrent.futures
+
+from common import SingletonBase
+from propLoader import OpenClosProperty, loadLoggingConfig
+
+moduleName = 'collectorEngine'
+loadLoggingConfig(appName = moduleName)
+logger = logging.getLogger(moduleName)
+
+DEFAULT_MAX_IN_FLIGHT = 200
+
+class CollectorEngine(SingletonBase):
+    '''
+    Runs device collectors (L2DataCollector.startL2Report, L3DataCollector.startL3Report,
+    HealthDataCollector.startHealthReport, TwoStageConfigurator.start2StageConfiguration)
+    with bounded concurrency. junos-eznc sessions are blocking, a device session
+    spends nearly all of its time waiting on the network, so the engine keeps up to
+    maxInFlight sessions in flight, shared by all reports of the process. Each task
+    runs on its own thread, started when a slot is free.
+    - deviceTimeout: NETCONF rpc timeout (sec) of each device session, also bounds
+      how long runAll waits for a device from the time it started. A device running
+      longer is reported as timed out, its thread keeps the slot until it returns
+      (the rpc timeout ends it), so no more than maxInFlight sessions are ever open.
+      Devices of runAll not started within deviceTimeout per round of maxInFlight
+      devices are cancelled.
+    - cancel()/shutdown(): devices not yet started are cancelled
+    Use CollectorEngine.getInstance() for the shared engine, TrapReceiver creates
+    its own engine as 2-stage configuration waits for long on each device.
+    '''
+    def __init__(self, conf = None):
+        if conf is None:
+            conf = (OpenClosProperty().getProperties() or {}).get('report') or {}
+        # threadCount: older name of maxInFlight
+        self.maxInFlight = conf.get('maxInFlight') or conf.get('threadCount') or DEFAULT_MAX_IN_FLIGHT
+        self.deviceTimeout = conf.get('deviceTimeout')
+        self._lock = threading.Lock()
+        # (future, task, args, kwargs) waiting for a slot
+        self._queue = collections.deque()
+        # future -> (start time, thread) of tasks holding a slot
+        self._running = {}
+        # futures of _running given up by runAll, still holding their slot
+        self._timedOut = set()
+        self._shutdown = False
+        logger.info('Collector engine, maxInFlight: %d, deviceTimeout: %s' % (self.maxInFlight, self.deviceTimeout))
+
+    def __del__(self):
+        self.shutdown(wait = False)
+
+    def submit(self, task, *args, **kwargs):
+        '''
+        :returns concurrent.futures.Future:
+        '''
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new tasks after shutdown')
+            self._queue.append((future, task, args, kwargs))
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        '''
+        Starts queued tasks while slots are free
+        '''
+        with self._lock:
+            while self._queue and len(self._running) < self.maxInFlight:
+                future, task, args, kwargs = self._queue.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                thread = threading.Thread(target = self._run, args = (future, task, args, kwargs), name = moduleName)
+                thread.daemon = True
+                self._running[future] = (time.time(), thread)
+                thread.start()
+
+    def _run(self, future, task, args, kwargs):
+        try:
+            result = task(*args, **kwargs)
+        except BaseException:
+            self._release(future)
+            future.set_exception_info(*sys.exc_info()[1:])
+        else:
+            self._release(future)
+            future.set_result(result)
+
+    def _release(self, future):
+        '''
+        Frees the slot of a finished task
+        '''
+        with self._lock:
+            self._running.pop(future, None)
+            self._timedOut.discard(future)
+        self._dispatch()
+
+    def runAll(self, tasks):
+        '''
+        Runs all tasks and waits for them. Devices still running deviceTimeout
+        after they started are reported as timed out and not waited for (junos-eznc
+        rpc timeout ends them), devices that did not get a slot in time are cancelled.
+        :param list tasks: (name, callable) tuples, name is used for logging
+        :returns dict: count of 'done', 'failed', 'timedOut', 'cancelled'
+        '''
+        futures = {}
+        for name, task in tasks:
+            futures[self.submit(task)] = name
+
+        start = time.time()
+        queueDeadline = None
+        if self.deviceTimeout and len(futures) > 0:
+            # devices are started in rounds of maxInFlight
+            rounds = (len(futures) + self.maxInFlight - 1) / self.maxInFlight
+            queueDeadline = start + self.deviceTimeout * rounds
+
+        result = {'done': 0, 'failed': 0, 'timedOut': 0, 'cancelled': 0}
+        notDone = set(futures.keys())
+        while notDone:
+            timeout = self._nextTimeout(notDone)
+            if queueDeadline is not None:
+                timeout = max(0, min(timeout, queueDeadline - time.time()))
+            done, notDone = concurrent.futures.wait(notDone, timeout, concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    result['cancelled'] += 1
+                elif future.exception() is not None:
+                    result['failed'] += 1
+                    logger.debug('%s failed, %s' % (futures[future], future.exception()))
+                else:
+                    result['done'] += 1
+            for future in self._expired(notDone):
+                notDone.discard(future)
+                result['timedOut'] += 1
+                logger.error('%s did not finish in %s seconds' % (futures[future], self.deviceTimeout))
+            if queueDeadline is not None and time.time() >= queueDeadline:
+                for future in list(notDone):
+                    # only devices not started yet can be cancelled
+                    if future.cancel():
+                        notDone.discard(future)
+                        result['cancelled'] += 1
+                        logger.error('%s did not get a slot in %s seconds' % (futures[future], queueDeadline - start))
+        logger.info('Collected %d devices in %.2f sec, %s' % (len(futures), time.time() - start, result))
+        return result
+
+    def _nextTimeout(self, futures):
+        '''
+        :returns float: seconds until first of the running futures times out,
+        deviceTimeout when none is running yet, None without deviceTimeout
+        '''
+        if not self.deviceTimeout:
+            return None
+        with self._lock:
+            starts = [self._running[future][0] for future in futures if future in self._running and future not in self._timedOut]
+        if not starts:
+            return self.deviceTimeout
+        return max(0, min(starts) + self.deviceTimeout - time.time())
+
+    def _expired(self, futures):
+        '''
+        Marks running futures older than deviceTimeout as timed out, they keep their slot
+        :returns list: futures timed out now
+        '''
+        if not self.deviceTimeout:
+            return []
+        now = time.time()
+        with self._lock:
+            expired = [future for future in futures if future in self._running and future not in self._timedOut and
+                       now - self._running[future][0] >= self.deviceTimeout]
+            self._timedOut.update(expired)
+        return expired
+
+    def cancel(self):
+        '''
+        Cancels tasks not yet started, running tasks are not interrupted
+        :returns int: number of cancelled tasks
+        '''
+        with self._lock:
+            queued = self._queue
+            self._queue = collections.deque()
+        cancelled = len([item for item in queued if item[0].cancel()])
+        if cancelled > 0:
+            logger.info('Cancelled %d pending device tasks' % (cancelled))
+        return cancelled
+
+    def shutdown(self, wait = True):
+        with self._lock:
+            self._shutdown = True
+        self.cancel()
+        if wait:
+            with self._lock:
+                threads = [thread for start, thread in self._running.values()]
+            for thread in threads:
+                thread.join()
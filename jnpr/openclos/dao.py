@@ -4,20 +4,39 @@ Created on Aug 26, 2014
 @author: moloyc
 '''
 import sqlalchemy
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker, scoped_session, class_mapper, selectinload, load_only
 from sqlalchemy.orm import exc
+from sqlalchemy.sql.expression import bindparam, and_, or_
+from netaddr import IPAddress
 import logging 
 import contextlib
+import threading
 
-from model import Base, Device, InterfaceDefinition, LeafSetting
+from model import Base, Pod, Device, InterfaceDefinition, LeafSetting
 from common import SingletonBase
 from propLoader import loadLoggingConfig
 from exception import InvalidConfiguration
+from statusSink import StatusSink
 
 moduleName = 'dao'
 loadLoggingConfig(appName = moduleName)
 logger = logging.getLogger(moduleName)
 
+leafSettingSummaryColumns = ['deviceFamily', 'junosImage']
+deviceSummaryColumns = ['id', 'name', 'role', 'family', 'macAddress', 'managementIp', 'serialNumber', 
+                        'deployStatus', 'configStatus', 'l2Status', 'l3Status', 'pod_id']
+# Named loading profiles of REST GET endpoints, query options of the profile.
+# Related objects are loaded with one query per relationship (selectinload) instead
+# of one query per object, columns the endpoint does not return are not loaded.
+# Built on use, Pod.devices is a backref, defined once mappers are configured.
+loadProfiles = {
+    # pod list, LeafSetting generic config is not loaded
+    'podSummary': lambda: [load_only('id', 'name', 'spineDeviceType', 'spineCount', 'leafCount', 'topologyType', 'encryptedPassword'),
+                           selectinload(Pod.leafSettings).load_only(*leafSettingSummaryColumns)],
+    # single pod, all pod columns
+    'podDetail': lambda: [selectinload(Pod.leafSettings).load_only(*leafSettingSummaryColumns)],
+}
+
 
 class AbstractDao(SingletonBase):
     def __init__(self):
@@ -27,6 +46,8 @@ class AbstractDao(SingletonBase):
             
         self.__engine = None
         self.__sessionFactory = None
+        self.__statusSink = None
+        self.__statusSinkLock = threading.Lock()
         dbUrl = self._getDbUrl()
         
         if 'sqlite:' in dbUrl:
@@ -39,10 +60,49 @@ class AbstractDao(SingletonBase):
             raise InvalidConfiguration('Unsupported DB dialect: %s' % dbUrl)
         
         Base.metadata.create_all(self.__engine) 
+        self._upgradeSchema()
         self.__sessionFactory = sessionmaker(bind=self.__engine)
+        self._backfillManagementIpRange()
         logger.debug('Dao is initialized with Engine')
 
+    def _upgradeSchema(self):
+        '''
+        create_all() only creates missing tables, columns and indexes added to
+        existing tables since the db was created are added here, new columns are
+        nullable and start as NULL
+        '''
+        inspector = sqlalchemy.inspect(self.__engine)
+        existingTables = inspector.get_table_names()
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existingTables:
+                continue
+            existingColumns = set([column['name'] for column in inspector.get_columns(table.name)])
+            for column in table.columns:
+                if column.name not in existingColumns:
+                    columnType = column.type.compile(dialect = self.__engine.dialect)
+                    logger.info('Upgrading db, adding column %s.%s %s' % (table.name, column.name, columnType))
+                    self.__engine.execute('ALTER TABLE %s ADD COLUMN %s %s' % (table.name, column.name, columnType))
+            existingIndexes = set([index['name'] for index in inspector.get_indexes(table.name)])
+            for index in table.indexes:
+                if index.name not in existingIndexes:
+                    logger.info('Upgrading db, creating index %s on %s' % (index.name, table.name))
+                    index.create(self.__engine)
+
+    def _backfillManagementIpRange(self):
+        '''
+        Pods created before managementIpStart/End were added have no range and
+        would never be found by getPodByManagementIp, range of their devices is set
+        '''
+        with self.getReadWriteSession() as session:
+            pods = session.query(Pod).filter(Pod.managementIpStart == None).filter(Pod.managementPrefix != None).all()
+            for pod in pods:
+                pod.updateManagementIpRange(session.query(Device).filter(Device.pod_id == pod.id).count())
+                if pod.managementIpStart is not None:
+                    logger.info("Pod[id='%s', name='%s']: management ip range set" % (pod.id, pod.name))
+
     def __del__(self):
+        if self.__statusSink:
+            self.__statusSink.stop()
         if self.__engine:
             self.__sessionFactory.close_all()
             self.__engine.dispose()
@@ -71,6 +131,34 @@ class AbstractDao(SingletonBase):
         finally:
             session.remove()
     
+    def getStatusSink(self):
+        '''
+        Write-behind sink for device status updates of collectors, see StatusSink
+        '''
+        with self.__statusSinkLock:
+            if self.__statusSink is None:
+                self.__statusSink = self._createStatusSink()
+            return self.__statusSink
+
+    def _createStatusSink(self):
+        return StatusSink(self)
+
+    def dispose(self):
+        '''
+        Closes pooled db connections, call before fork so that no connection
+        is shared by parent and child processes
+        '''
+        self.__engine.dispose()
+
+    def afterFork(self):
+        '''
+        Call in forked child process, drops connection pool and status sink
+        copied from parent, the sink's thread does not exist in the child
+        '''
+        self.__engine.dispose()
+        self.__statusSink = None
+        self.__statusSinkLock = threading.Lock()
+
     def _getRawSession(self):
         return scoped_session(self.__sessionFactory)
     
@@ -89,6 +177,67 @@ class AbstractDao(SingletonBase):
             session.rollback()
             #raise
 
+    def bulkInsert(self, session, objectType, mappings):
+        '''
+        Inserts plain dict rows using one executemany per table, bypassing the ORM
+        unit of work. For joined table inheritance (Interface) every table of the 
+        hierarchy is written, base table first, and the polymorphic identity is
+        filled in. Missing/None values fall back to the column's scalar default.
+        Caller is responsible to flush the session if rows refer to pending objects.
+        '''
+        if not mappings:
+            return
+        
+        mapper = class_mapper(objectType)
+        fixedValues = {}
+        if mapper.polymorphic_on is not None:
+            fixedValues[mapper.polymorphic_on.key] = mapper.polymorphic_identity
+
+        for tableMapper in reversed(list(mapper.iterate_to_root())):
+            table = tableMapper.local_table
+            defaults = {}
+            for column in table.columns:
+                if column.default is not None and column.default.is_scalar:
+                    defaults[column.key] = column.default.arg
+                else:
+                    defaults[column.key] = None
+            
+            rows = []
+            for mapping in mappings:
+                row = {}
+                for key, default in defaults.iteritems():
+                    value = fixedValues.get(key, mapping.get(key))
+                    row[key] = value if value is not None else default
+                rows.append(row)
+            session.execute(table.insert(), rows)
+
+    def bulkUpdate(self, session, objectType, mappings):
+        '''
+        Updates columns of objectType's own table using one executemany, 
+        each mapping must contain the primary key and the columns to update,
+        all mappings must have same set of keys.
+        '''
+        if not mappings:
+            return
+        
+        table = class_mapper(objectType).local_table
+        primaryKeys = [column.key for column in table.primary_key.columns]
+        whereClause = None
+        for key in primaryKeys:
+            clause = table.c[key] == bindparam('pk_' + key)
+            whereClause = clause if whereClause is None else whereClause & clause
+        
+        valueKeys = [key for key in mappings[0].keys() if key not in primaryKeys]
+        statement = table.update().where(whereClause).values(dict((key, bindparam(key)) for key in valueKeys))
+        
+        rows = []
+        for mapping in mappings:
+            row = dict((key, mapping[key]) for key in valueKeys)
+            for key in primaryKeys:
+                row['pk_' + key] = mapping[key]
+            rows.append(row)
+        session.execute(statement, rows)
+
     def deleteObject(self, session, obj):
         session.delete(obj)
 
@@ -110,11 +259,47 @@ class AbstractDao(SingletonBase):
             session.rollback()
             #raise
 
-    def getAll(self, session, objectType):
-        return session.query(objectType).order_by(objectType.name).all()
+    def getAll(self, session, objectType, loadProfile = None):
+        '''
+        :param str loadProfile: name of the loading profile, see loadProfiles
+        '''
+        return self._query(session, objectType, loadProfile).order_by(objectType.name).all()
     
-    def getObjectById(self, session, objectType, id):
-        return session.query(objectType).filter_by(id = id).one()
+    def getObjectById(self, session, objectType, id, loadProfile = None):
+        return self._query(session, objectType, loadProfile).filter_by(id = id).one()
+
+    def _query(self, session, objectType, loadProfile):
+        query = session.query(objectType)
+        if loadProfile is not None:
+            query = query.options(*loadProfiles[loadProfile]())
+        return query
+
+    def getDeviceCount(self, session, podId, filters = None):
+        return self._filterDevices(session.query(Device), podId, filters).count()
+
+    def getDevices(self, session, podId, filters = None, after = None, limit = None, columns = None):
+        '''
+        Devices of the pod ordered by name, one page of keyset pagination
+        :param dict filters: column -> list of accepted values
+        :param str after: name of the last device of previous page
+        :param int limit: page size, None for all devices
+        :param list columns: columns to load, None for all columns
+        '''
+        query = self._filterDevices(session.query(Device), podId, filters)
+        if columns is not None:
+            query = query.options(load_only(*columns))
+        if after is not None:
+            query = query.filter(Device.name > after)
+        query = query.order_by(Device.name)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    def _filterDevices(self, query, podId, filters):
+        query = query.filter(Device.pod_id == podId)
+        for column, values in (filters or {}).iteritems():
+            query = query.filter(getattr(Device, column).in_(values))
+        return query
 
     def getUniqueObjectByName(self, session, objectType, name):
         try:
@@ -127,11 +312,46 @@ class AbstractDao(SingletonBase):
 
     def getIfdByDeviceNamePortName(self, session, deviceName, portName):
         try:
-            device = session.query(Device).filter_by(name = deviceName).one()
-            return session.query(InterfaceDefinition).filter_by(device_id = device.id).filter_by(name = portName).one()
+            return session.query(InterfaceDefinition).join(Device, InterfaceDefinition.device_id == Device.id)\
+                .filter(Device.name == deviceName).filter(InterfaceDefinition.name == portName).one()
         except (exc.NoResultFound, exc.MultipleResultsFound) as ex:
             logger.info(str(ex))
 
+    def getIfdsByDeviceNamePortNames(self, session, deviceNamePortNames):
+        '''
+        Batch variant of getIfdByDeviceNamePortName, one query for all pairs
+        :param list deviceNamePortNames: (deviceName, portName) tuples
+        :returns dict: (deviceName, portName) -> IFD, pairs not found or 
+        found on more than one device (same device name in many pods) are left out
+        '''
+        pairs = set(deviceNamePortNames)
+        if not pairs:
+            return {}
+        
+        rows = session.query(Device.name, InterfaceDefinition).join(Device, InterfaceDefinition.device_id == Device.id)\
+            .filter(or_(*[and_(Device.name == deviceName, InterfaceDefinition.name == portName) for deviceName, portName in pairs])).all()
+        
+        ifds = {}
+        duplicates = set()
+        for deviceName, ifd in rows:
+            key = (deviceName, ifd.name)
+            if key in ifds:
+                duplicates.add(key)
+            ifds[key] = ifd
+        for key in duplicates:
+            logger.info('Multiple IFDs found for deviceName: %s, portName: %s' % key)
+            del ifds[key]
+        return ifds
+
+    def getPodByManagementIp(self, session, ip):
+        '''
+        Finds pod whose device management ip range has the ip, see Pod.updateManagementIpRange
+        :param str ip: ip address without prefix length
+        '''
+        value = int(IPAddress(ip))
+        return session.query(Pod).filter(Pod.managementIpStart <= value).filter(Pod.managementIpEnd >= value)\
+            .order_by(Pod.name).first()
+
     def getLeafSetting(self, session, podId, deviceFamily):
         try:
             return session.query(LeafSetting).filter_by(pod_id = podId).filter_by(deviceFamily = deviceFamily).one()
@@ -0,0 +1,232 @@
+'''
+Created on Oct 18, 2026
+'''
+import time
+import threading
+import traceback
+import logging
+
+from jnpr.junos import Device as DeviceConnection
+from jnpr.junos.exception import ConnectError
+
+from exception import DeviceConnectFailed
+from common import SingletonBase
+from propLoader import OpenClosProperty, loadLoggingConfig
+
+moduleName = 'deviceConnectionPool'
+loadLoggingConfig(appName = moduleName)
+logger = logging.getLogger(moduleName)
+
+defaultPoolSettings = {'enabled': True, 'maxPerHost': 2, 'idleTimeout': 300, 'reapInterval': 60, 'healthCheckIdle': 30, 'borrowTimeout': 60}
+
+class PooledConnection(object):
+    def __init__(self, key, connection):
+        self.key = key
+        self.connection = connection
+        self.lastUsed = time.time()
+
+class DeviceConnectionPool(SingletonBase):
+    '''
+    Process-wide pool of NETCONF (junos-eznc) sessions keyed by management ip and
+    credentials. Collectors borrow a session and release it after use, so that
+    back-to-back L2/L3 reports reuse the SSH session and facts of each device.
+    - idleTimeout: idle sessions older than this (sec) are closed, checked on borrow and
+      every reapInterval (sec) by a background thread running while sessions are idle
+    - healthCheckIdle: sessions idle longer than this (sec) are probed with a cheap rpc
+      before being handed out, broken ones are closed and replaced
+    - maxPerHost: max sessions (borrowed + idle) per device, borrowers wait up to
+      borrowTimeout (sec) for a session to be released
+    '''
+    def __init__(self, conf = None):
+        if conf is None:
+            conf = (OpenClosProperty().getProperties() or {}).get('netconfConnectionPool') or {}
+        settings = dict(defaultPoolSettings)
+        settings.update(conf)
+        self.enabled = settings['enabled']
+        self.maxPerHost = settings['maxPerHost']
+        self.idleTimeout = settings['idleTimeout']
+        self.reapInterval = settings['reapInterval']
+        self.healthCheckIdle = settings['healthCheckIdle']
+        self.borrowTimeout = settings['borrowTimeout']
+
+        self._condition = threading.Condition(threading.Lock())
+        self._idle = {}
+        self._hostCount = {}
+        self._borrowed = {}
+        self._reaper = None
+        self.opened = 0
+        self.reused = 0
+        self.closed = 0
+
+    def __del__(self):
+        self.closeAll()
+
+    def borrow(self, host, username, password, port = 22):
+        '''
+        :returns Device: open junos-eznc connection, must be given back with release()
+        :raises DeviceConnectFailed:
+        '''
+        key = (host, port, username, password)
+        if not self.enabled:
+            return self._open(key)
+
+        deadline = time.time() + self.borrowTimeout
+        with self._condition:
+            expired = self._evictExpired()
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    pooled = idle.pop()
+                    break
+                if self._hostCount.get(key, 0) < self.maxPerHost:
+                    pooled = None
+                    # reserve the slot, connection is opened outside of the lock
+                    self._hostCount[key] = self._hostCount.get(key, 0) + 1
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    pooled = False
+                    break
+                self._condition.wait(remaining)
+
+        for expiredPooled in expired:
+            self._close(expiredPooled.connection)
+        if pooled is False:
+            raise DeviceConnectFailed('%s, all %d connections are in use' % (host, self.maxPerHost))
+
+        if pooled is not None:
+            if time.time() - pooled.lastUsed < self.healthCheckIdle or self._isHealthy(pooled.connection):
+                with self._condition:
+                    self._borrowed[id(pooled.connection)] = pooled
+                    self.reused += 1
+                logger.debug('Reusing connection to %s' % (host))
+                return pooled.connection
+            # broken connection, replace it keeping the slot
+            self._close(pooled.connection)
+
+        try:
+            connection = self._open(key)
+        except:
+            with self._condition:
+                self._releaseSlot(key)
+            raise
+        with self._condition:
+            self._borrowed[id(connection)] = PooledConnection(key, connection)
+        return connection
+
+    def release(self, connection, reusable = True):
+        '''
+        Gives back connection obtained by borrow(). When reusable is False or the
+        connection is no longer connected, it is closed instead of kept idle.
+        '''
+        if connection is None:
+            return
+        with self._condition:
+            pooled = self._borrowed.pop(id(connection), None)
+            if pooled is not None:
+                if reusable and connection.connected:
+                    pooled.lastUsed = time.time()
+                    self._idle.setdefault(pooled.key, []).append(pooled)
+                    self._condition.notify_all()
+                    if self._reaper is None:
+                        self._reaper = threading.Thread(target = self._reap, name = moduleName)
+                        self._reaper.daemon = True
+                        self._reaper.start()
+                    return
+                self._releaseSlot(pooled.key)
+        self._close(connection)
+
+    def closeAll(self):
+        with self._condition:
+            idle = [pooled for pooledList in self._idle.values() for pooled in pooledList]
+            for pooled in idle:
+                self._releaseSlot(pooled.key)
+            self._idle = {}
+        for pooled in idle:
+            self._close(pooled.connection)
+
+    def getStats(self):
+        with self._condition:
+            return {'opened': self.opened, 'reused': self.reused, 'closed': self.closed,
+                    'idle': sum([len(pooledList) for pooledList in self._idle.values()]), 'borrowed': len(self._borrowed)}
+
+    def _open(self, key):
+        host, port, username, password = key
+        try:
+            connection = DeviceConnection(host=host, user=username, password=password, port=port)
+            connection.open()
+            logger.debug('Connected to device: %s' % (host))
+            with self._condition:
+                self.opened += 1
+            return connection
+        except ConnectError as exc:
+            logger.error('Device connection failure, %s' % (exc))
+            raise DeviceConnectFailed(host, exc)
+        except Exception as exc:
+            logger.error('Unknown error, %s' % (exc))
+            logger.debug('StackTrace: %s' % (traceback.format_exc()))
+            raise DeviceConnectFailed(host, exc)
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception as exc:
+            logger.debug('Error closing connection, %s' % (exc))
+        with self._condition:
+            self.closed += 1
+
+    def _isHealthy(self, connection):
+        if not connection.connected:
+            return False
+        try:
+            connection.rpc.get_system_uptime_information()
+            return True
+        except Exception as exc:
+            logger.debug('Health check failed for %s, %s' % (connection.hostname, exc))
+            return False
+
+    def _releaseSlot(self, key):
+        '''called with lock held'''
+        count = self._hostCount.get(key, 0) - 1
+        if count > 0:
+            self._hostCount[key] = count
+        else:
+            self._hostCount.pop(key, None)
+        self._condition.notify_all()
+
+    def _reap(self):
+        '''
+        Closes expired idle connections every reapInterval, exits when no connection is idle
+        '''
+        while True:
+            with self._condition:
+                if self._idle:
+                    self._condition.wait(self.reapInterval)
+                expired = self._evictExpired()
+                done = not self._idle
+                if done:
+                    self._reaper = None
+            for pooled in expired:
+                self._close(pooled.connection)
+            if done:
+                return
+
+    def _evictExpired(self):
+        '''
+        called with lock held
+        :returns list: expired idle connections, caller closes them after releasing the lock
+        '''
+        now = time.time()
+        expired = []
+        for key, pooledList in self._idle.items():
+            alive = [pooled for pooled in pooledList if now - pooled.lastUsed < self.idleTimeout]
+            expired += [pooled for pooled in pooledList if now - pooled.lastUsed >= self.idleTimeout]
+            if alive:
+                self._idle[key] = alive
+            else:
+                del self._idle[key]
+        for pooled in expired:
+            self._releaseSlot(pooled.key)
+        if expired:
+            logger.debug('Closing %d idle connections' % (len(expired)))
+        return expired
@@ -13,16 +13,19 @@ from jnpr.junos import Device as DeviceConnection
 from jnpr.junos.factory import loadyaml
 from jnpr.junos.exception import ConnectError, RpcError, CommitError, LockError
 from jnpr.junos.utils.config import Config
+from sqlalchemy.orm.attributes import set_committed_value
 
 from dao import Dao
-from model import Pod, Device, InterfaceDefinition, AdditionalLink, BgpLink
-from exception import DeviceConnectFailed, DeviceRpcFailed, L2DataCollectionFailed, L3DataCollectionFailed, TwoStageConfigurationFailed
+from model import Device, InterfaceDefinition, AdditionalLink, BgpLink
+from exception import DeviceConnectFailed, DeviceRpcFailed, L2DataCollectionFailed, L3DataCollectionFailed, HealthDataCollectionFailed, TwoStageConfigurationFailed
 from common import SingletonBase
+from deviceConnectionPool import DeviceConnectionPool
+from statusSink import UPDATE, UPDATE_WHERE, REPLACE
 from l3Clos import L3ClosMediation
 from propLoader import OpenClosProperty, DeviceSku, loadLoggingConfig
 import util
 
-from netaddr import IPAddress, IPNetwork
+from netaddr import IPNetwork
 from jnpr.openclos.exception import SkipCommit
 
 moduleName = 'devicePlugin'
@@ -30,6 +33,27 @@ loadLoggingConfig(appName = moduleName)
 logger = logging.getLogger(moduleName)
 
 junosEzTableLocation = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conf', 'junosEznc')
+junosEzTables = {}
+junosEzTablesLock = RLock()
+
+def getJunosEzTable(fileName, tableName):
+    '''
+    junos-eznc table/view classes are built from yaml once per process and shared
+    by all collections, the classes hold no device state.
+    :param str fileName: file in conf/junosEznc, example 'lldp.yaml'
+    :param str tableName: example 'LLDPNeighborTable'
+    '''
+    key = (fileName, tableName)
+    table = junosEzTables.get(key)
+    if table is None:
+        with junosEzTablesLock:
+            table = junosEzTables.get(key)
+            if table is None:
+                # loadyaml returns all tables/views of the file
+                for name, factory in loadyaml(os.path.join(junosEzTableLocation, fileName)).items():
+                    junosEzTables[(fileName, name)] = factory
+                table = junosEzTables[key]
+    return table
 
 class DeviceOperationInProgressCache(SingletonBase):
     def __init__(self):
@@ -76,6 +100,13 @@ class DeviceDataCollectorNetconf(object):
         self.pod = None
         self.deviceId = deviceId
         self.deviceConnectionHandle = None
+        # None: connection is opened per collector run and closed at the end
+        self.connectionPool = None
+        self.deviceConnectionReusable = True
+        # status updates of this run, written by Dao's StatusSink, see submitStatusUpdates
+        self.statusUpdates = []
+        # NETCONF rpc timeout (sec) of the device session, None: junos-eznc default
+        self.rpcTimeout = None
         self.deviceSku = DeviceSku()
 
 
@@ -100,11 +131,19 @@ class DeviceDataCollectorNetconf(object):
         if self.device.encryptedPassword == None:
             raise DeviceConnectFailed('Device: %s, , ip: %s, password is None' % (self.device.id, self.device.managementIp))
         
+        deviceIp = self.device.managementIp.split('/')[0]
+        devicePassword = self.device.getCleartextPassword()
+        if self.connectionPool is not None:
+            self.deviceConnectionHandle = self.connectionPool.borrow(deviceIp, self.device.username, devicePassword)
+            if self.rpcTimeout is not None:
+                self.deviceConnectionHandle.timeout = self.rpcTimeout
+            return self.deviceConnectionHandle
+
         try:
-            deviceIp = self.device.managementIp.split('/')[0]
-            devicePassword = self.device.getCleartextPassword()
             deviceConnection = DeviceConnection(host=deviceIp, user=self.device.username, password=devicePassword, port=22)
             deviceConnection.open()
+            if self.rpcTimeout is not None:
+                deviceConnection.timeout = self.rpcTimeout
             logger.debug('Connected to device: %s' % (self.device.managementIp))
             self.deviceConnectionHandle = deviceConnection
             return deviceConnection
@@ -118,6 +157,43 @@ class DeviceDataCollectorNetconf(object):
             self.deviceConnectionHandle = None
             raise DeviceConnectFailed(self.device.managementIp, exc)
 
+    def releaseDeviceConnection(self):
+        '''
+        Gives the connection back to the pool, or closes it when not pooled.
+        Connection that failed with non-rpc error is closed as well.
+        '''
+        if self.deviceConnectionHandle is None:
+            return
+        if self.connectionPool is not None:
+            self.connectionPool.release(self.deviceConnectionHandle, self.deviceConnectionReusable)
+        else:
+            self.deviceConnectionHandle.close()
+        self.deviceConnectionHandle = None
+
+    def updateStatus(self, obj, **values):
+        '''
+        Sets status columns of obj without making it dirty, the row is updated
+        by the status sink after submitStatusUpdates
+        '''
+        for key, value in values.iteritems():
+            set_committed_value(obj, key, value)
+        self.statusUpdates.append((UPDATE, type(obj), obj.id, values))
+
+    def updateStatusWhere(self, objectType, column, value, values):
+        self.statusUpdates.append((UPDATE_WHERE, objectType, column, value, values))
+
+    def replaceStatusRows(self, objectType, column, value, objects):
+        self.statusUpdates.append((REPLACE, objectType, column, value, objects))
+
+    def submitStatusUpdates(self):
+        '''
+        Hands status updates over to the status sink, all updates submitted
+        together are written in the same transaction
+        '''
+        if len(self.statusUpdates) > 0:
+            self._dao.getStatusSink().submit(self.statusUpdates)
+            self.statusUpdates = []
+
 class L2DataCollector(DeviceDataCollectorNetconf):
     '''
     In most of the cases collector would execute in multi-tread env, so cannot use
@@ -128,6 +204,7 @@ class L2DataCollector(DeviceDataCollectorNetconf):
     def __init__(self, deviceId, conf = {}, daoClass = Dao):
         self.collectionInProgressCache = L2DataCollectorInProgressCache.getInstance()
         super(L2DataCollector, self).__init__(deviceId, conf, daoClass)
+        self.connectionPool = DeviceConnectionPool.getInstance()
 
     def manualInit(self):
         super(L2DataCollector, self).manualInit()
@@ -140,11 +217,11 @@ class L2DataCollector(DeviceDataCollectorNetconf):
             logger.error('L2 data collection failed for %s, %s' % (self.deviceId, exc))
             raise L2DataCollectionFailed(self.deviceId, exc)
         finally:
+            self.submitStatusUpdates()
             if self._session:
                 self._session.commit()
                 self._session.remove()
-            if self.deviceConnectionHandle:
-                self.deviceConnectionHandle.close()
+            self.releaseDeviceConnection()
     
     def startCollectAndProcessLldp(self):
         if (self.collectionInProgressCache.checkAndAddDevice(self.device.id)):
@@ -152,6 +229,8 @@ class L2DataCollector(DeviceDataCollectorNetconf):
             try:
                 if self.device.managementIp is not None:
                     self.updateDeviceL2Status('processing')
+                    # make 'processing' visible while collecting
+                    self.submitStatusUpdates()
                     # use device level password for leaves that already went through staged configuration
                     self.connectToDevice()
                     lldpData = self.collectLldpFromDevice()
@@ -200,7 +279,7 @@ class L2DataCollector(DeviceDataCollectorNetconf):
         logger.debug('Start LLDP data collector for %s' % (self.deviceLogStr))
 
         try:
-            lldpTable = loadyaml(os.path.join(junosEzTableLocation, 'lldp.yaml'))['LLDPNeighborTable'] 
+            lldpTable = getJunosEzTable('lldp.yaml', 'LLDPNeighborTable')
             table = lldpTable(self.deviceConnectionHandle)
             lldpData = table.get()
             links = {}
@@ -216,40 +295,32 @@ class L2DataCollector(DeviceDataCollectorNetconf):
         except Exception as exc:
             logger.error('Unknown error, %s' % (exc))
             logger.debug('StackTrace: %s' % (traceback.format_exc()))
+            self.deviceConnectionReusable = False
             raise DeviceRpcFailed("device '%s': LLDPNeighborTable" % (self.deviceId), exc)
 
     def updateDeviceL2Status(self, status, reason = None, error = None):
         '''Possible status values are  'processing', 'good', 'error' '''
         if error is None:
-            self.device.l2Status = status
-            self.device.l2StatusReason = reason
+            self.updateStatus(self.device, l2Status = status, l2StatusReason = reason)
         else:
-            self.device.l2Status = 'error'
-            self.device.l2StatusReason = str(error.cause)
-        self._dao.updateObjectsAndCommitNow(self._session, [self.device])
+            self.updateStatus(self.device, l2Status = 'error', l2StatusReason = str(error.cause))
 
     def updateDeviceConfigStatus(self, status, reason = None, error = None):
         '''Possible status values are  'processing', 'good', 'error' '''
         if error is None:
-            self.device.configStatus = status
-            self.device.configStatusReason = reason
+            self.updateStatus(self.device, configStatus = status, configStatusReason = reason)
         else:
-            self.device.configStatus = 'error'
-            self.device.configStatusReason = str(error.cause)
-        self._dao.updateObjectsAndCommitNow(self._session, [self.device])
+            self.updateStatus(self.device, configStatus = 'error', configStatusReason = str(error.cause))
         
     def updateSpineStatusFromLldpData(self, spineIfds):
         devicesToBeUpdated = set()
         for spineIfd in spineIfds:
             spineDevice = spineIfd.device
             if spineDevice is not None and spineDevice.role == 'spine':
-                spineDevice.deployStatus = 'deploy'
-                spineDevice.l2Status = 'good'
-                spineDevice.configStatus = 'good'
                 devicesToBeUpdated.add(spineDevice)
 
-        if len(devicesToBeUpdated) > 0:
-            self._dao.updateObjectsAndCommitNow(self._session, devicesToBeUpdated)
+        for spineDevice in devicesToBeUpdated:
+            self.updateStatus(spineDevice, deployStatus = 'deploy', l2Status = 'good', configStatus = 'good')
 
     def getAllocatedConnectedUplinkIfds(self):
         uplinkIfds = self._session.query(InterfaceDefinition).filter(InterfaceDefinition.device_id == self.device.id).\
@@ -279,9 +350,9 @@ class L2DataCollector(DeviceDataCollectorNetconf):
         if not lldpData:
             return lldpData
         
-        uplinkNames = self.deviceSku.getPortNamesForDeviceFamily(deviceFamily, 'leaf')['uplinkPorts']
+        uplinkNames = self.deviceSku.getPortNamesForDeviceFamily(deviceFamily, 'leaf')['uplinkPortSet']
 
-        filteredNames = set(uplinkNames).intersection(set(lldpData.keys()))
+        filteredNames = uplinkNames.intersection(lldpData.keys())
         filteredUplinks = {name:lldpData[name] for name in filteredNames}
         logger.debug('Number of uplink IFDs found from LLDP data is %d' % (len(filteredUplinks)))
         return filteredUplinks
@@ -341,25 +412,17 @@ class L2DataCollector(DeviceDataCollectorNetconf):
         return {'goodUplinkCount': len(goodIfds), 'badUplinkCount': len(badIfds), 'additionalLinkCount': len(additional)};
 
     def updateGoodIfdStatus(self, ifds):
-        modifiedObjects = []
         goodSpines = []
         for ifd in ifds:
-            ifd.status = 'good'
-            ifd.peer.status = 'good'
+            self.updateStatus(ifd, status = 'good')
+            self.updateStatus(ifd.peer, status = 'good')
             goodSpines.append(ifd.peer)
-            modifiedObjects.append(ifd)
-            modifiedObjects.append(ifd.peer)
 
-        self._dao.updateObjectsAndCommitNow(self._session, modifiedObjects)
         self.updateSpineStatusFromLldpData(goodSpines)
     
     def updateIfdStatus(self, ifds, status):
-        modifiedObjects = []
         for ifd in ifds:
-            ifd.status = status
-            modifiedObjects.append(ifd)
-
-        self._dao.updateObjectsAndCommitNow(self._session, modifiedObjects)
+            self.updateStatus(ifd, status = status)
 
     def updateBadIfdStatus(self, ifds):
         self.updateIfdStatus(ifds, 'error')
@@ -371,11 +434,10 @@ class L2DataCollector(DeviceDataCollectorNetconf):
         '''
         lldp has this port but cabling plan does not have this port.
         '''
-        self._session.query(AdditionalLink).filter(AdditionalLink.device1 == self.device.name).delete()
         additionalLinks = []
         for link in links:
             additionalLinks.append(AdditionalLink(self.device.name, link['port1'], link['device2'], link['port2'], 'error'))
-        self._dao.createObjectsAndCommitNow(self._session, additionalLinks)
+        self.replaceStatusRows(AdditionalLink, 'device1', self.device.name, additionalLinks)
 
 class L3DataCollector(DeviceDataCollectorNetconf):
     '''
@@ -388,6 +450,7 @@ class L3DataCollector(DeviceDataCollectorNetconf):
         self.collectionInProgressCache = L3DataCollectorInProgressCache.getInstance()
         self.deviceAsn2NameMap = deviceAsn2NameMap
         super(L3DataCollector, self).__init__(deviceId, conf, daoClass)
+        self.connectionPool = DeviceConnectionPool.getInstance()
 
     def manualInit(self):
         super(L3DataCollector, self).manualInit()
@@ -400,11 +463,11 @@ class L3DataCollector(DeviceDataCollectorNetconf):
             logger.error('L3 data collection failed for %s, %s' % (self.deviceId, exc))
             raise L3DataCollectionFailed(self.deviceId, exc)
         finally:
+            self.submitStatusUpdates()
             if self._session:
                 self._session.commit()
                 self._session.remove()
-            if self.deviceConnectionHandle:
-                self.deviceConnectionHandle.close()
+            self.releaseDeviceConnection()
 
     def startCollectAndProcessBgp(self):
         if (self.collectionInProgressCache.checkAndAddDevice(self.device.id)):
@@ -412,6 +475,8 @@ class L3DataCollector(DeviceDataCollectorNetconf):
             try:
                 if self.device.managementIp is not None:
                     self.updateDeviceL3Status('processing')
+                    # make 'processing' visible while collecting
+                    self.submitStatusUpdates()
                     # use device level password for leaves that already went through staged configuration
                     self.connectToDevice()
                     bgpLinks = self.collectBgpFromDevice()
@@ -449,7 +514,7 @@ class L3DataCollector(DeviceDataCollectorNetconf):
         logger.debug('Start BGP data collector for %s' % (self.deviceLogStr))
 
         try:
-            bgpTable = loadyaml(os.path.join(junosEzTableLocation, 'BGP.yaml'))['BGPNeighborTable']
+            bgpTable = getJunosEzTable('BGP.yaml', 'BGPNeighborTable')
             table = bgpTable(self.deviceConnectionHandle)
             bgpData = table.get()
             links = []
@@ -479,6 +544,7 @@ class L3DataCollector(DeviceDataCollectorNetconf):
         except Exception as exc:
             logger.error('Unknown error, %s' % (exc))
             logger.debug('StackTrace: %s' % (traceback.format_exc()))
+            self.deviceConnectionReusable = False
             raise DeviceRpcFailed("device '%s': BGPNeighborTable" % (self.deviceId), exc)
 
     def processBgpData(self, bgpLinks):
@@ -487,36 +553,159 @@ class L3DataCollector(DeviceDataCollectorNetconf):
         
     def persistBgpLinks(self, bgpLinks):
         # storing bgp data into database
-        self._session.query(BgpLink).filter(BgpLink.device_id == self.device.id).delete()
         bgpObjects = []
         for link in bgpLinks:
             bgpObjects.append(BgpLink(self.device.pod.id, self.device.id, link))
-        self._dao.createObjectsAndCommitNow(self._session, bgpObjects)
+        self.replaceStatusRows(BgpLink, 'device_id', self.device.id, bgpObjects)
 
     def updateSpineStatusFromBgpData(self, bgpLinks):
         devicesToBeUpdated = set()
         for link in bgpLinks:
             device2 = link.get('device2Obj')
             if device2 is not None and device2.role == 'spine':
-                device2.l3Status = 'good'
-                device2.l3StatusReason = None
                 devicesToBeUpdated.add(device2)
                 
-        if len(devicesToBeUpdated) > 0:
-            self._dao.updateObjectsAndCommitNow(self._session, devicesToBeUpdated)
+        for device2 in devicesToBeUpdated:
+            self.updateStatus(device2, l3Status = 'good', l3StatusReason = None)
             
     def updateDeviceL3Status(self, status, reason = None, error = None):
         '''Possible status values are  'processing', 'good', 'error' '''
         if error is None:
-            self.device.l3Status = status
-            self.device.l3StatusReason = reason
+            self.updateStatus(self.device, l3Status = status, l3StatusReason = reason)
         else:
-            self.device.l3Status = 'error'
-            self.device.l3StatusReason = str(error.cause)
-        self._dao.updateObjectsAndCommitNow(self._session, [self.device])
+            self.updateStatus(self.device, l3Status = 'error', l3StatusReason = str(error.cause))
 
     def updateBgpLinkStatus(self, status):
-        self._session.query(BgpLink).filter(BgpLink.device_id == self.device.id).update({'link_state': status})
+        self.updateStatusWhere(BgpLink, 'device_id', self.device.id, {'link_state': status})
+
+class HealthDataCollector(DeviceDataCollectorNetconf):
+    '''
+    Collects L2 (LLDP) and L3 (BGP) data of a leaf over a single connection and
+    submits both results to the status sink together. Processing is delegated to an
+    L2DataCollector and an L3DataCollector that share this collector's session,
+    device and connection.
+    Perform manual "init" from startHealthReport to make sure it is done
+    from child thread's context.
+    '''
+    def __init__(self, deviceId, conf = {}, daoClass = Dao, deviceAsn2NameMap = {}):
+        super(HealthDataCollector, self).__init__(deviceId, conf, daoClass)
+        self.connectionPool = DeviceConnectionPool.getInstance()
+        self.l2DataCollector = L2DataCollector(deviceId, conf, daoClass)
+        self.l3DataCollector = L3DataCollector(deviceId, conf, daoClass, deviceAsn2NameMap)
+
+    def manualInit(self):
+        super(HealthDataCollector, self).manualInit()
+        for collector in (self.l2DataCollector, self.l3DataCollector):
+            collector._dao = self._dao
+            collector._session = self._session
+            collector.device = self.device
+            collector.deviceLogStr = self.deviceLogStr
+            collector.pod = self.pod
+
+    def submitStatusUpdates(self):
+        for collector in (self.l2DataCollector, self.l3DataCollector):
+            self.statusUpdates.extend(collector.statusUpdates)
+            collector.statusUpdates = []
+        super(HealthDataCollector, self).submitStatusUpdates()
+
+    def startHealthReport(self):
+        try:
+            self.manualInit()
+            self.startCollectAndProcessHealth()
+        except Exception as exc:
+            logger.error('Health data collection failed for %s, %s' % (self.deviceId, exc))
+            raise HealthDataCollectionFailed(self.deviceId, exc)
+        finally:
+            self.submitStatusUpdates()
+            if self._session:
+                self._session.commit()
+                self._session.remove()
+            self.releaseDeviceConnection()
+
+    def startCollectAndProcessHealth(self):
+        l2DataCollector = self.l2DataCollector
+        l3DataCollector = self.l3DataCollector
+        if not l2DataCollector.collectionInProgressCache.checkAndAddDevice(self.device.id):
+            logger.debug('L2 data collection is already in progress for %s', (self.deviceLogStr))
+            return
+        if not l3DataCollector.collectionInProgressCache.checkAndAddDevice(self.device.id):
+            l2DataCollector.collectionInProgressCache.doneDevice(self.deviceId)
+            logger.debug('L3 data collection is already in progress for %s', (self.deviceLogStr))
+            return
+
+        logger.debug('Started health data collection for %s' % (self.deviceLogStr))
+        try:
+            if self.device.managementIp is None:
+                # for some reason, we can't match the plug-n-play leaf to our inventory. so inventory doesn't have
+                # ip address for this leaf. in this case the leaf and all its links should be marked 'unknown'
+                l2DataCollector.updateDeviceL2Status('unknown')
+                l2DataCollector.updateUnknownIfdStatus(self.device.interfaces)
+                l3DataCollector.updateDeviceL3Status('unknown')
+                l3DataCollector.updateBgpLinkStatus('unknown')
+                return
+
+            l2DataCollector.updateDeviceL2Status('processing')
+            l3DataCollector.updateDeviceL3Status('processing')
+            # make 'processing' visible while collecting
+            self.submitStatusUpdates()
+
+            try:
+                self.connectToDevice()
+            except DeviceConnectFailed as exc:
+                logger.error('Encountered device connect error for %s, %s' % (self.deviceLogStr, exc))
+                # when we can't connect, mark the links 'unknown' because it is possible the data network is 
+                # still working so we can't mark the links 'error'
+                l2DataCollector.updateDeviceL2Status(None, error = exc)
+                l2DataCollector.updateUnknownIfdStatus(self.device.interfaces)
+                l3DataCollector.updateDeviceL3Status(None, error = exc)
+                l3DataCollector.updateBgpLinkStatus('unknown')
+                raise
+
+            l2DataCollector.deviceConnectionHandle = self.deviceConnectionHandle
+            l3DataCollector.deviceConnectionHandle = self.deviceConnectionHandle
+            # L2 and L3 are independent, failure of one does not skip the other
+            l2Error = self.collectAndProcessLldp()
+            l3Error = self.collectAndProcessBgp()
+            self.deviceConnectionReusable = l2DataCollector.deviceConnectionReusable and l3DataCollector.deviceConnectionReusable
+            if l2Error is not None:
+                raise l2Error
+            if l3Error is not None:
+                raise l3Error
+        finally:
+            l2DataCollector.collectionInProgressCache.doneDevice(self.deviceId)
+            l3DataCollector.collectionInProgressCache.doneDevice(self.deviceId)
+            logger.debug('Ended health data collection for %s' % (self.deviceLogStr))
+
+    def collectAndProcessLldp(self):
+        '''
+        :returns Exception: error, if any, after updating L2 status
+        '''
+        l2DataCollector = self.l2DataCollector
+        try:
+            lldpData = l2DataCollector.collectLldpFromDevice()
+            uplinkLdpData = l2DataCollector.filterUplinkFromLldpData(lldpData, self.device.family)
+            goodBadCount = l2DataCollector.processLlDpData(uplinkLdpData, l2DataCollector.getAllocatedConnectedUplinkIfds())
+            l2DataCollector.validateDeviceL2Status(goodBadCount)
+        except Exception as exc:
+            logger.error('Collect LLDP data failed for %s, %s' % (self.deviceLogStr, exc))
+            l2DataCollector.updateDeviceL2Status('error', str(exc))
+            l2DataCollector.updateBadIfdStatus(self.device.interfaces)
+            return exc
+
+    def collectAndProcessBgp(self):
+        '''
+        :returns Exception: error, if any, after updating L3 status
+        '''
+        l3DataCollector = self.l3DataCollector
+        try:
+            bgpLinks = l3DataCollector.collectBgpFromDevice()
+            l3DataCollector.processBgpData(bgpLinks)
+            l3DataCollector.updateDeviceL3Status('good')
+        except Exception as exc:
+            logger.error('Collect BGP data failed for %s, %s' % (self.deviceLogStr, exc))
+            l3DataCollector.updateDeviceL3Status('error', str(exc))
+            l3DataCollector.updateBgpLinkStatus('bad')
+            return exc
 
 class TwoStageConfigurator(L2DataCollector):
     '''
@@ -528,6 +717,8 @@ class TwoStageConfigurator(L2DataCollector):
     def __init__(self, deviceIp, conf = {}, daoClass = Dao, stopEvent = None):
         self.configurationInProgressCache = TwoStageConfigInProgressCache.getInstance()
         super(TwoStageConfigurator, self).__init__(None, conf, daoClass)
+        # device configuration (and credentials) change during 2-stage configuration, don't pool
+        self.connectionPool = None
         self.deviceIp = deviceIp
         self.deviceLogStr = 'device ip: %s' % (self.deviceIp)
         # at this point self._conf is initialized
@@ -583,26 +774,18 @@ class TwoStageConfigurator(L2DataCollector):
             logger.error('Two stage configuration failed for %s, %s' % (self.deviceIp, exc))
             raise TwoStageConfigurationFailed(self.deviceId, exc)
         finally:
+            self.submitStatusUpdates()
             if self._session:
                 self._session.commit()
                 self._session.remove()
-            if self.deviceConnectionHandle:
-                self.deviceConnectionHandle.close()
+            self.releaseDeviceConnection()
             
     def findPodByMgmtIp(self, deviceIp):
         logger.debug("Checking all pods for ip %s" % (deviceIp))
-        pods = self._dao.getAll(self._session, Pod)
-        for pod in pods:
-            logger.debug("Checking pod[id='%s', name='%s']: %s" % (pod.id, pod.name, pod.managementPrefix))
-            ipNetwork = IPNetwork(pod.managementPrefix)
-            ipNetworkList = list(ipNetwork)
-            start = ipNetworkList.index(ipNetwork.ip)
-            end = start + len(pod.devices)
-            ipList = ipNetworkList[start:end]
-            deviceIpAddr = IPAddress(deviceIp)
-            if deviceIpAddr in ipList:
-                logger.debug("Found pod[id='%s', name='%s']" % (pod.id, pod.name))
-                return pod
+        pod = self._dao.getPodByManagementIp(self._session, deviceIp)
+        if pod is not None:
+            logger.debug("Found pod[id='%s', name='%s']" % (pod.id, pod.name))
+        return pod
         
     def filterUplinkAppendRemotePortIfd(self, lldpData, deviceFamily):
         ''' 
@@ -619,15 +802,16 @@ class TwoStageConfigurator(L2DataCollector):
             logger.debug('NO LLDP data found for device: %s' % (self.deviceIp))
             return lldpData
 
-        uplinkNames = self.deviceSku.getPortNamesForDeviceFamily(deviceFamily, 'leaf')['uplinkPorts']
+        uplinkNames = self.deviceSku.getPortNamesForDeviceFamily(deviceFamily, 'leaf')['uplinkPortSet']
+        lldpUplinks = [link for link in lldpData.values() if link['port1'] in uplinkNames]
+        remoteIfds = self._dao.getIfdsByDeviceNamePortNames(self._session, [(link['device2'], link['port2']) for link in lldpUplinks])
         upLinks = []
-        for link in lldpData.values():
-            if link['port1'] in uplinkNames:
-                ifd2 = self._dao.getIfdByDeviceNamePortName(self._session, link['device2'], link['port2'])
-                if ifd2 is not None:
-                    link['ifd2'] = ifd2
-                    upLinks.append(link)
-                    logger.debug('Found IFD deviceName: %s, portName: %s' % (link['device2'], link['port2']))
+        for link in lldpUplinks:
+            ifd2 = remoteIfds.get((link['device2'], link['port2']))
+            if ifd2 is not None:
+                link['ifd2'] = ifd2
+                upLinks.append(link)
+                logger.debug('Found IFD deviceName: %s, portName: %s' % (link['device2'], link['port2']))
         logger.debug('Number of uplink IFDs found from LLDP data is %d' % (len(upLinks)))
         return upLinks
 
@@ -770,7 +954,7 @@ class TwoStageConfigurator(L2DataCollector):
             return
 
         updateList = []
-        uplinkNamesBasedOnDeviceFamily = self.deviceSku.getPortNamesForDeviceFamily(device.family, 'leaf')['uplinkPorts']
+        uplinkNamesBasedOnDeviceFamily = list(self.deviceSku.getPortNamesForDeviceFamily(device.family, 'leaf')['uplinkPorts'])
         # hack :( needed to keep the sequence proper in case2, if device changed from ex to qfx
         self.markAllUplinkIfdsToUplink(device)
         
@@ -43,6 +43,7 @@ EC_L2_DATA_COLLECTION_FAILED                = 2004
 EC_L3_DATA_COLLECTION_FAILED                = 2005
 EC_TWO_STAGE_CONFIGURATION_FAILED           = 2006
 EC_TRAP_DAEMON_ERROR                        = 2007
+EC_HEALTH_DATA_COLLECTION_FAILED            = 2008
 
 dictErrorCode = {
     EC_OK                                       :   "Success",
@@ -71,6 +72,7 @@ dictErrorCode = {
     EC_L3_DATA_COLLECTION_FAILED                :   "Failed to collect L3 data: %s",
     EC_TWO_STAGE_CONFIGURATION_FAILED           :   "Failed to execute two stage configuration: %s",
     EC_TRAP_DAEMON_ERROR                        :   "Trap daemon error: %s", 
+    EC_HEALTH_DATA_COLLECTION_FAILED            :   "Failed to collect L2/L3 health data: %s",
 }
 
 def getErrorMessage(errorCode):
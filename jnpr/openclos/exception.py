@@ -239,6 +239,15 @@ class L3DataCollectionFailed(BaseError):
             error.getErrorMessage(error.EC_L3_DATA_COLLECTION_FAILED) % (reason), 
             cause)
 
+class HealthDataCollectionFailed(BaseError):
+    '''
+    Description of the error
+    '''
+    def __init__(self, reason, cause=None):
+        super(HealthDataCollectionFailed, self).__init__(error.EC_HEALTH_DATA_COLLECTION_FAILED,
+            error.getErrorMessage(error.EC_HEALTH_DATA_COLLECTION_FAILED) % (reason), 
+            cause)
+
 class TwoStageConfigurationFailed(BaseError):
     '''
     Description of the error
@@ -0,0 +1,140 @@
+'''
+Created on Oct 18, 2026
+'''
+import logging
+
+from model import Device, InterfaceDefinition, InterfaceLogical, BgpLink
+from propLoader import loadLoggingConfig
+
+moduleName = 'fabricIndex'
+loadLoggingConfig(appName = moduleName)
+logger = logging.getLogger(moduleName)
+
+class FabricIndex(object):
+    '''
+    In-memory view of a pod's fabric graph: devices, IFDs (per device sorted by
+    sequenceNum), IFLs (by device and name, and by layer below) and peers.
+    Everything is loaded with a constant number of SELECTs, so consumers that walk
+    every device (config generation, cabling plan, reports) do not have to query
+    per device.
+    Optionally the index can be restricted to a few devices (deviceIds), in that
+    case the peer IFDs/IFLs/devices of those devices are loaded as well.
+    Objects returned by the index belong to the session passed in.
+    '''
+    def __init__(self, session, pod, deviceIds = None):
+        self._session = session
+        self._pod = pod
+        self._deviceIds = deviceIds
+        self._devices = {}
+        self._ifdsByDevice = {}
+        self._ifds = {}
+        self._ifls = {}
+        self._layerAboves = {}
+        self._bgpLinksByDevice = None
+
+        if deviceIds is None:
+            self._loadPod()
+        else:
+            self._loadDevices(deviceIds)
+        logger.debug('FabricIndex loaded for pod: %s, devices: %d, IFDs: %d, IFLs: %d' %
+                     (pod.name, len(self._devices), len(self._ifds), len(self._ifls)))
+
+    def _loadPod(self):
+        session = self._session
+        podId = self._pod.id
+        self._addDevices(session.query(Device).filter(Device.pod_id == podId).all())
+        self._addIfds(session.query(InterfaceDefinition).join(Device, InterfaceDefinition.device_id == Device.id)
+                      .filter(Device.pod_id == podId).order_by(InterfaceDefinition.sequenceNum).all())
+        self._addIfls(session.query(InterfaceLogical).join(Device, InterfaceLogical.device_id == Device.id)
+                      .filter(Device.pod_id == podId).all())
+
+    def _loadDevices(self, deviceIds):
+        if len(deviceIds) == 0:
+            return
+        session = self._session
+        self._addDevices(session.query(Device).filter(Device.id.in_(deviceIds)).all())
+        self._addIfds(session.query(InterfaceDefinition).filter(InterfaceDefinition.device_id.in_(deviceIds))
+                      .order_by(InterfaceDefinition.sequenceNum).all())
+        self._addIfls(session.query(InterfaceLogical).filter(InterfaceLogical.device_id.in_(deviceIds)).all())
+
+        # peers of the selected devices, with their IFLs and devices
+        peerIds = set([ifd.peer_id for ifd in self._ifds.values() if ifd.peer_id is not None]) - set(self._ifds.keys())
+        if len(peerIds) > 0:
+            self._addIfds(session.query(InterfaceDefinition).filter(InterfaceDefinition.id.in_(peerIds))
+                          .order_by(InterfaceDefinition.sequenceNum).all())
+            self._addIfls(session.query(InterfaceLogical).filter(InterfaceLogical.layer_below_id.in_(peerIds)).all())
+            peerDeviceIds = set([self._ifds[peerId].device_id for peerId in peerIds if peerId in self._ifds]) - set(self._devices.keys())
+            if len(peerDeviceIds) > 0:
+                self._addDevices(session.query(Device).filter(Device.id.in_(peerDeviceIds)).all())
+
+    def _addDevices(self, devices):
+        for device in devices:
+            self._devices[device.id] = device
+
+    def _addIfds(self, ifds):
+        for ifd in ifds:
+            self._ifds[ifd.id] = ifd
+            self._ifdsByDevice.setdefault(ifd.device_id, []).append(ifd)
+
+    def _addIfls(self, ifls):
+        for ifl in ifls:
+            self._ifls[(ifl.device_id, ifl.name)] = ifl
+            if ifl.layer_below_id is not None:
+                self._layerAboves.setdefault(ifl.layer_below_id, []).append(ifl)
+
+    def getDevice(self, deviceId):
+        return self._devices.get(deviceId)
+
+    def getIfds(self, deviceId, role = None):
+        '''
+        :returns list: IFDs of the device sorted by sequenceNum, optionally filtered by role
+        '''
+        ifds = self._ifdsByDevice.get(deviceId, [])
+        if role is None:
+            return list(ifds)
+        return [ifd for ifd in ifds if ifd.role == role]
+
+    def getIfl(self, deviceId, name):
+        '''
+        :returns InterfaceLogical: IFL by name, example lo0.0, irb.1, or None
+        '''
+        return self._ifls.get((deviceId, name))
+
+    def getPeer(self, ifd):
+        if ifd.peer_id is None:
+            return None
+        return self._ifds.get(ifd.peer_id)
+
+    def getLayerAboves(self, ifd):
+        return self._layerAboves.get(ifd.id, [])
+
+    def getConnectedInterconnectIFDsFilterFakeOnes(self, device):
+        '''
+        Same as Dao.getConnectedInterconnectIFDsFilterFakeOnes, served from the index
+        Get interconnect IFDs except following ..
+        1. no peer configured
+        2. port name is uplink-* for device with known family
+        '''
+        ports = []
+        for port in self._ifdsByDevice.get(device.id, []):
+            if port.peer_id is None or port.role not in ('uplink', 'downlink'):
+                continue
+            if device.family != 'unknown' and 'uplink-' in port.name:
+                continue
+            ports.append(port)
+        return ports
+
+    def getBgpLinks(self, deviceId):
+        '''
+        BgpLinks are loaded on first use, in a single query for the pod
+        '''
+        if self._bgpLinksByDevice is None:
+            self._bgpLinksByDevice = {}
+            query = self._session.query(BgpLink)
+            if self._deviceIds is None:
+                query = query.filter(BgpLink.pod_id == self._pod.id)
+            else:
+                query = query.filter(BgpLink.device_id.in_(self._deviceIds))
+            for bgpLink in query.all():
+                self._bgpLinksByDevice.setdefault(bgpLink.device_id, []).append(bgpLink)
+        return self._bgpLinksByDevice.get(deviceId, [])
@@ -0,0 +1,89 @@
+'''
+Created on Oct 18, 2026
+
+Hands out IPv4 addresses and subnets of an allocated block by integer offset,
+nothing is materialised, each allocation is O(1). Same order and result as
+netaddr IPNetwork.iter_hosts()/subnet() on the block.
+'''
+import socket
+import struct
+
+from netaddr import IPNetwork
+
+def ipToString(value):
+    '''
+    :param int value: IPv4 address as integer
+    '''
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+def _toNetwork(block):
+    if isinstance(block, IPNetwork):
+        return block
+    return IPNetwork(block)
+
+def hostCount(block):
+    '''
+    Number of addresses iterHosts yields for the block
+    '''
+    block = _toNetwork(block)
+    if block.prefixlen <= 30:
+        return block.size - 2
+    return block.size
+
+def iterHosts(block):
+    '''
+    Yields host addresses of the block as str, network and broadcast
+    addresses are skipped, except for /31 and /32 (same as netaddr iter_hosts)
+    :param block: IPNetwork or str
+    '''
+    block = _toNetwork(block)
+    first = block.first
+    last = block.last
+    if block.prefixlen <= 30:
+        first += 1
+        last -= 1
+    for value in xrange(first, last + 1):
+        yield ipToString(value)
+
+def iterSubnets(block, prefixlen):
+    '''
+    Yields first address (int) of each subnet of prefixlen in the block
+    :param block: IPNetwork or str
+    '''
+    block = _toNetwork(block)
+    if prefixlen < block.prefixlen:
+        return
+    size = 2 ** (32 - prefixlen)
+    for value in xrange(block.first, block.last + 1, size):
+        yield value
+
+def firstHost(subnet, prefixlen):
+    '''
+    :param int subnet: first address of the subnet
+    :returns str: 'ip/prefixlen' of the first host of the subnet
+    '''
+    offset = 1 if prefixlen <= 30 else 0
+    return ipToString(subnet + offset) + '/' + str(prefixlen)
+
+def pointToPointEnds(subnet, prefixlen = 31):
+    '''
+    :param int subnet: first address of the subnet
+    :returns tuple: ('ip/prefixlen', 'ip/prefixlen') of first and second address of the subnet
+    '''
+    suffix = '/' + str(prefixlen)
+    return (ipToString(subnet) + suffix, ipToString(subnet + 1) + suffix)
+
+def iterFirstHostOfSubnets(block, prefixlen):
+    '''
+    Yields 'ip/prefixlen' of the first host of each subnet of prefixlen in the block
+    '''
+    for value in iterSubnets(block, prefixlen):
+        yield firstHost(value, prefixlen)
+
+def iterPointToPointSubnets(block, prefixlen = 31):
+    '''
+    Yields ('ip/prefixlen', 'ip/prefixlen') of both ends of each point-to-point
+    subnet in the block, first and second address of the subnet
+    '''
+    for value in iterSubnets(block, prefixlen):
+        yield pointToPointEnds(value, prefixlen)
@@ -0,0 +1,153 @@
+'''
+Created on Oct 18, 2026
+'''
+import uuid
+import logging
+
+from sqlalchemy import func, or_
+from netaddr import IPNetwork
+
+from model import IpAllocation
+from propLoader import loadLoggingConfig
+from exception import InsufficientLoopbackIp, InsufficientVlanIp, InsufficientInterconnectIp
+import ipAllocator
+
+moduleName = 'ipam'
+loadLoggingConfig(appName = moduleName)
+logger = logging.getLogger(moduleName)
+
+insufficientIpErrors = {'loopback': InsufficientLoopbackIp, 'irb': InsufficientVlanIp, 'interconnect': InsufficientInterconnectIp}
+
+class Ipam(object):
+    '''
+    Records every unit (address or subnet) allocated from pod's loopback, irb and
+    interconnect prefixes in IpAllocation table. A pool is the pod's prefix split
+    in units of prefixlen, unit at offset starts at prefix network + offset * unit size.
+    Units of removed devices are freed and reused lowest offset first, then the pool
+    grows from its highest offset, so cost of an allocation or free depends on the
+    number of units changed, not on the pod size.
+    '''
+    def __init__(self, dao):
+        self._dao = dao
+
+    def allocate(self, session, podId, pool, prefix, prefixlen, owners):
+        '''
+        :param str prefix: pool prefix of the pod, example 10.0.0.0/16
+        :param int prefixlen: unit size, 32 for loopback address
+        :param list owners: (deviceId, peerDeviceId) of each unit, peerDeviceId is None
+        when only one device uses the unit
+        :returns list of int: first ip of each unit, in order of owners
+        '''
+        if not owners:
+            return []
+
+        prefix = IPNetwork(prefix)
+        unitSize = 2 ** (32 - prefixlen)
+        firstOffset, lastOffset = self._getOffsetRange(pool, prefix, unitSize)
+
+        free = session.query(IpAllocation.id, IpAllocation.offset).filter(IpAllocation.pod_id == podId)\
+            .filter(IpAllocation.pool == pool).filter(IpAllocation.state == 'free')\
+            .order_by(IpAllocation.offset).limit(len(owners)).all()
+        newCount = len(owners) - len(free)
+        nextOffset = firstOffset
+        if newCount > 0:
+            highWaterMark = self.getHighWaterMark(session, podId, pool)
+            if highWaterMark is not None:
+                nextOffset = highWaterMark + 1
+            if nextOffset + newCount - 1 > lastOffset:
+                raise insufficientIpErrors[pool]("Pod[id='%s']: %s pool %s has %d free ip, %d required" %
+                    (podId, pool, prefix, lastOffset - nextOffset + 1 + len(free), len(owners)))
+
+        offsets = [offset for id, offset in free] + range(nextOffset, nextOffset + newCount)
+        suffix = '/' + str(prefixlen)
+        reused = []
+        created = []
+        for (deviceId, peerDeviceId), offset, index in zip(owners, offsets, xrange(len(owners))):
+            row = {'ipaddress': ipAllocator.ipToString(prefix.first + offset * unitSize) + suffix,
+                   'device_id': deviceId, 'peerDevice_id': peerDeviceId, 'state': 'allocated'}
+            if index < len(free):
+                row['id'] = free[index][0]
+                reused.append(row)
+            else:
+                row.update({'id': str(uuid.uuid4()), 'pod_id': podId, 'pool': pool, 'offset': offset})
+                created.append(row)
+        self._dao.bulkUpdate(session, IpAllocation, reused)
+        self._dao.bulkInsert(session, IpAllocation, created)
+        logger.debug("Pod[id='%s']: %s pool allocated %d, reused %d" % (podId, pool, len(created), len(reused)))
+
+        return [prefix.first + offset * unitSize for offset in offsets]
+
+    def importAllocations(self, session, podId, pool, prefix, prefixlen, units):
+        '''
+        Records units already in use by a pod built before IpAllocation existed, so
+        that allocate() does not hand them out again. Offsets below the highest one
+        not in use are recorded as free.
+        :param list units: (ip, deviceId, peerDeviceId) of each unit, ip (int) is any address of the unit
+        :returns int: number of units imported
+        '''
+        prefix = IPNetwork(prefix)
+        unitSize = 2 ** (32 - prefixlen)
+        firstOffset, lastOffset = self._getOffsetRange(pool, prefix, unitSize)
+        suffix = '/' + str(prefixlen)
+        owners = {}
+        for ip, deviceId, peerDeviceId in units:
+            offset = (ip - prefix.first) / unitSize
+            if ip < prefix.first or offset > lastOffset:
+                logger.warning("Pod[id='%s']: %s %s is not in %s pool %s, not imported" % (podId, ipAllocator.ipToString(ip), deviceId, pool, prefix))
+            elif offset in owners:
+                logger.warning("Pod[id='%s']: %s pool unit %s used by %s and %s" % (podId, pool, ipAllocator.ipToString(ip), owners[offset][0], deviceId))
+            else:
+                owners[offset] = (deviceId, peerDeviceId)
+        if not owners:
+            return 0
+
+        rows = []
+        for offset in xrange(min(firstOffset, min(owners)), max(owners) + 1):
+            deviceId, peerDeviceId = owners.get(offset, (None, None))
+            rows.append({'id': str(uuid.uuid4()), 'pod_id': podId, 'pool': pool, 'offset': offset,
+                         'ipaddress': ipAllocator.ipToString(prefix.first + offset * unitSize) + suffix,
+                         'device_id': deviceId, 'peerDevice_id': peerDeviceId, 
+                         'state': 'allocated' if offset in owners else 'free'})
+        self._dao.bulkInsert(session, IpAllocation, rows)
+        logger.info("Pod[id='%s']: %s pool imported %d units in use, %d free" % (podId, pool, len(owners), len(rows) - len(owners)))
+        return len(owners)
+
+    def _getOffsetRange(self, pool, prefix, unitSize):
+        unitCount = prefix.size / unitSize
+        if pool == 'loopback' and prefix.prefixlen <= 30:
+            # no network and broadcast address
+            return (1, unitCount - 2)
+        return (0, unitCount - 1)
+
+    def free(self, session, podId, deviceIds):
+        '''
+        Frees all units used by the devices, including interconnect subnets
+        where they are the peer
+        :returns int: number of units freed
+        '''
+        if not deviceIds:
+            return 0
+        count = session.query(IpAllocation).filter(IpAllocation.pod_id == podId)\
+            .filter(or_(IpAllocation.device_id.in_(deviceIds), IpAllocation.peerDevice_id.in_(deviceIds)))\
+            .update({'state': 'free', 'device_id': None, 'peerDevice_id': None}, synchronize_session = False)
+        logger.debug("Pod[id='%s']: freed %d ip units of %d devices" % (podId, count, len(deviceIds)))
+        return count
+
+    def releasePod(self, session, podId):
+        '''
+        Deletes all units of the pod, used when pod is deleted or its pools change
+        '''
+        session.query(IpAllocation).filter(IpAllocation.pod_id == podId).delete(synchronize_session = False)
+
+    def getHighWaterMark(self, session, podId, pool):
+        '''
+        :returns int: highest offset ever allocated in the pool, None if nothing allocated
+        '''
+        return session.query(func.max(IpAllocation.offset)).filter(IpAllocation.pod_id == podId)\
+            .filter(IpAllocation.pool == pool).scalar()
+
+    def getAllocations(self, session, podId, pool, deviceId = None):
+        query = session.query(IpAllocation).filter(IpAllocation.pod_id == podId).filter(IpAllocation.pool == pool)
+        if deviceId is not None:
+            query = query.filter(or_(IpAllocation.device_id == deviceId, IpAllocation.peerDevice_id == deviceId))
+        return query.order_by(IpAllocation.offset).all()
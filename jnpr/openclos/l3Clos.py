@@ -11,27 +11,106 @@ import math
 import zlib
 import base64
 import itertools
+import uuid
+import hashlib
+import threading
+import concurrent.futures
 
-from netaddr import IPNetwork
+from netaddr import IPNetwork, IPAddress
 from sqlalchemy.orm import exc
 
-from model import Pod, Device, InterfaceLogical, InterfaceDefinition, CablingPlan, DeviceConfig, TrapGroup
+from model import Pod, Device, Interface, InterfaceLogical, InterfaceDefinition, CablingPlan, DeviceConfig, TrapGroup, BgpLink, IpAllocation
 from dao import Dao
 from propLoader import propertyFileLocation, OpenClosProperty, DeviceSku, loadLoggingConfig
 import util
+import ipAllocator
+from ipam import Ipam
 
 from writer import ConfigWriter, CablingPlanWriter
-from jinja2 import Environment, PackageLoader
+from fabricIndex import FabricIndex
+from templateRegistry import TemplateRegistry, junosTemplates
 import logging
 from exception import InvalidRequest, MissingMandatoryAttribute, PodNotFound, InsufficientLoopbackIp, InsufficientVlanIp, InsufficientInterconnectIp, InsufficientManagementIp, CapacityCannotChange, CapacityMismatch
 
-junosTemplatePackage = 'jnpr.openclos'
-junosTemplateLocation = os.path.join('conf', 'junosTemplates')
-
 moduleName = 'l3Clos'
 loadLoggingConfig(appName = moduleName)
 logger = logging.getLogger(moduleName)
 
+DEFAULT_RENDERING_WORKERS = 4
+# (executor, workerCount) -> (pid, pool), rendering pools live as long as the process
+_renderingPools = {}
+_renderingPoolsLock = threading.Lock()
+
+def getRenderingPool(conf):
+    '''
+    Long-lived pool of configRendering in openclos.yaml, created once per process
+    and again in a forked child. Process pool workers are started when the pool is
+    created, call it at startup before other threads run (RestServer.start()).
+    :returns Executor: None for serial rendering
+    '''
+    renderingConf = conf.get('configRendering') or {}
+    executorType = renderingConf.get('executor', 'serial')
+    workerCount = renderingConf.get('workerCount', DEFAULT_RENDERING_WORKERS)
+    if executorType not in ['thread', 'process'] or workerCount < 2:
+        return None
+
+    with _renderingPoolsLock:
+        pid, pool = _renderingPools.get((executorType, workerCount), (None, None))
+        if pid != os.getpid():
+            if executorType == 'process':
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers = workerCount)
+                # forks all workers now
+                pool.submit(renderDeviceConfigs, []).result()
+            else:
+                pool = concurrent.futures.ThreadPoolExecutor(max_workers = workerCount)
+            _renderingPools[(executorType, workerCount)] = (os.getpid(), pool)
+            logger.info('Created config rendering %s pool, workers: %d' % (executorType, workerCount))
+        return pool
+
+def renderConfiglets(configlets):
+    '''
+    :param list configlets: (templateName, parameters) tuples, templateName None means parameters is plain text
+    :returns str: rendered configlets concatenated in order
+    '''
+    templateRegistry = TemplateRegistry.getInstance()
+    config = ''
+    for templateName, params in configlets:
+        if templateName is None:
+            config += params
+        else:
+            config += templateRegistry.getTemplate(junosTemplates, templateName).render(**params)
+    return config
+
+def renderDeviceConfigs(deviceConfiglets):
+    '''
+    Renders configs of several devices. It does not need DB or L3ClosMediation
+    so it can run in a thread or process pool worker.
+    :param list deviceConfiglets: configlets of each device, see L3ClosMediation._getDeviceConfiglets
+    :returns list: config of each device
+    '''
+    return [renderConfiglets(configlets) for configlets in deviceConfiglets]
+
+def _canonicalizeConfiglets(value):
+    '''
+    Converts template parameters to json friendly values with stable ordering
+    '''
+    if isinstance(value, (set, frozenset)):
+        return sorted([_canonicalizeConfiglets(item) for item in value])
+    elif isinstance(value, (list, tuple)):
+        return [_canonicalizeConfiglets(item) for item in value]
+    elif isinstance(value, dict):
+        return dict([(key, _canonicalizeConfiglets(item)) for key, item in value.iteritems()])
+    return value
+
+def getConfigletsFingerprint(configlets):
+    '''
+    :param list configlets: configlets of a device, see L3ClosMediation._getDeviceConfiglets
+    :returns str: sha256 of configlets and junos templates, same fingerprint means same rendered config
+    '''
+    sha = hashlib.sha256(TemplateRegistry.getInstance().getDigest(junosTemplates))
+    sha.update(json.dumps(_canonicalizeConfiglets(configlets), sort_keys = True))
+    return sha.hexdigest()
+
 class L3ClosMediation():
     def __init__(self, conf = {}, daoClass = Dao):
         if any(conf) == False:
@@ -40,9 +119,10 @@ class L3ClosMediation():
             self._conf = conf
 
         self._dao = daoClass.getInstance()
+        self.ipam = Ipam(self._dao)
 
-        self._templateEnv = Environment(loader=PackageLoader(junosTemplatePackage, junosTemplateLocation))
-        self._templateEnv.keep_trailing_newline = True
+        self._templateRegistry = TemplateRegistry.getInstance()
+        self._templateEnv = self._templateRegistry.getEnvironment(junosTemplates)
         self.isZtpStaged = util.isZtpStaged(self._conf)
         self.deviceSku = DeviceSku()
 
@@ -107,6 +187,7 @@ class L3ClosMediation():
                 interfaces.append(ifd)
         self._dao.createObjects(session, devices)
         self._dao.createObjects(session, interfaces)
+        return devices
         
     def _createLeafAndIfds(self, session, pod, leaves):
         devices = []
@@ -123,6 +204,7 @@ class L3ClosMediation():
         self._dao.createObjects(session, devices)
         for device in devices:
             self._createLeafIfds(session, pod, device)
+        return devices
         
     def _createLeafIfds(self, session, pod, device):
         interfaces = []
@@ -214,8 +296,7 @@ class L3ClosMediation():
     def _validateLoopbackPrefix(self, pod, podDict, inventoryData):
         inventoryDeviceCount = len(inventoryData['spines']) + len(inventoryData['leafs'])
         lo0Block = IPNetwork(podDict['loopbackPrefix'])
-        lo0Ips = list(lo0Block.iter_hosts())
-        availableIps = len(lo0Ips)
+        availableIps = ipAllocator.hostCount(lo0Block)
         cidr = 32 - int(math.ceil(math.log(inventoryDeviceCount, 2)))
         if availableIps < inventoryDeviceCount:
             raise InsufficientLoopbackIp("Pod[id='%s', name='%s']: loopbackPrefix minimum required: %s/%d" % (pod.id, pod.name, lo0Block.ip, cidr))
@@ -264,10 +345,6 @@ class L3ClosMediation():
         if inventoryData is None:
             raise InvalidRequest("Pod[id='%s', name='%s']: inventory cannot be empty" % (pod.id, pod.name))
         
-        # if following data changed we need to reallocate resource
-        if pod.spineCount != podDict['spineCount'] or pod.leafCount != podDict['leafCount']:
-            raise CapacityCannotChange("Pod[id='%s', name='%s']: capacity cannot be changed" % (pod.id, pod.name))
-
         for spine in inventoryData['spines']:
             self._validateAttribute(pod, 'name', spine)
             #self._validateAttribute(pod, 'role', spine)
@@ -328,8 +405,6 @@ class L3ClosMediation():
 
     def _needToRebuild(self, pod, podDict):
         if pod.spineDeviceType != podDict.get('spineDeviceType') or \
-           pod.spineCount != podDict.get('spineCount') or \
-           pod.leafCount != podDict.get('leafCount') or \
            pod.interConnectPrefix != podDict.get('interConnectPrefix') or \
            pod.vlanPrefix != podDict.get('vlanPrefix') or \
            pod.loopbackPrefix != podDict.get('loopbackPrefix') or \
@@ -337,6 +412,12 @@ class L3ClosMediation():
             return True
         else:
             return False
+
+    def _needToScale(self, pod, podDict):
+        '''
+        spineCount/leafCount change alone is handled by _scalePod, without rebuild
+        '''
+        return int(pod.spineCount) != int(podDict['spineCount']) or int(pod.leafCount) != int(podDict['leafCount'])
             
     def fixIfdIflName(self, ifd, name):
         if ifd is None:
@@ -397,11 +478,17 @@ class L3ClosMediation():
         
     def _updatePodData(self, session, pod, podDict, inventoryData):
         # if following data changed we need to reallocate resource
+        scale = False
         if self._needToRebuild(pod, podDict) == True:
             logger.debug("Pod[id='%s', name='%s']: rebuilding required" % (pod.id, pod.name))
             if len(pod.devices) > 0:
                 self._dao.deleteObjects(session, pod.devices)
                 session.expire(pod)
+            # pools may have changed, everything gets allocated again
+            self.ipam.releasePod(session, pod.id)
+        elif self._needToScale(pod, podDict) == True:
+            logger.debug("Pod[id='%s', name='%s']: scaling required" % (pod.id, pod.name))
+            scale = True
 
         # update pod itself
         pod.update(pod.id, pod.name, podDict)
@@ -409,17 +496,23 @@ class L3ClosMediation():
         # first time
         if len(pod.devices) == 0:
             logger.debug("Pod[id='%s', name='%s']: building inventory and resource..." % (pod.id, pod.name))
-            self._createSpineAndIfds(session, pod, inventoryData['spines'])
-            self._createLeafAndIfds(session, pod, inventoryData['leafs'])
-            self._createLinks(session, pod)
-            pod.devices.sort(key=lambda dev: dev.name) # Hack to order lists by name
-            self._allocateResource(session, pod)
+            if self._conf.get('bulkPodBuild', False) == True:
+                self._buildPodInBulk(session, pod, inventoryData)
+            else:
+                self._createSpineAndIfds(session, pod, inventoryData['spines'])
+                self._createLeafAndIfds(session, pod, inventoryData['leafs'])
+                self._createLinks(session, pod)
+                pod.devices.sort(key=lambda dev: dev.name) # Hack to order lists by name
+                self._allocateResource(session, pod)
             # save the new inventory to database
             pod.inventoryData = base64.b64encode(zlib.compress(json.dumps(inventoryData)))
         else:        
+            if scale == True:
+                self._scalePod(session, pod, inventoryData)
             # compare new inventory that user provides against old inventory that we stored in the database
             self._diffInventory(session, pod, inventoryData)
             
+        pod.updateManagementIpRange(self._getManagementIpCount(pod))
         # commit everything to db
         self._dao.updateObjects(session, [pod])
             
@@ -470,6 +563,7 @@ class L3ClosMediation():
             except (exc.NoResultFound):
                 raise PodNotFound(podId, exc) 
 
+            self.ipam.releasePod(session, pod.id)
             self._dao.deleteObject(session, pod)
             logger.info("Pod[id='%s', name='%s']: deleted" % (pod.id, pod.name)) 
 
@@ -556,6 +650,266 @@ class L3ClosMediation():
             spineIndex += 1
         self._dao.updateObjects(session, modifiedObjects)
         
+    def _scalePod(self, session, pod, inventoryData):
+        '''
+        Incremental counterpart of rebuild when only spineCount/leafCount changed. 
+        Devices missing from the inventory are removed with their links, new inventory
+        devices are created and linked to the existing ones, IFLs, ip and ASN are 
+        allocated for the new devices and links only. Existing devices keep all their
+        data, so generateConfig re-renders only the configs whose inputs changed: new
+        devices and devices that got a link added or removed.
+        '''
+        self._importIpAllocations(session, pod)
+        removedDevices, newSpines, newLeaves = self._diffInventoryDevices(pod, inventoryData)
+        self._removeDevices(session, pod, removedDevices)
+
+        newSpines = self._createSpineAndIfds(session, pod, newSpines)
+        newLeaves = self._createLeafAndIfds(session, pod, newLeaves)
+        links = self._createInterconnectLinksOfNewDevices(session, pod, newSpines, newLeaves)
+
+        newDevices = sorted(newSpines + newLeaves, key=lambda dev: dev.name)
+        lo0Ips = [ipAllocator.ipToString(value) for value in 
+                  self.ipam.allocate(session, pod.id, 'loopback', pod.loopbackPrefix, 32, [(device.id, None) for device in newDevices])]
+        self._assignAllocatedLoopbackToDevices(session, newDevices, lo0Ips)
+        
+        irbBlock, cidrForEachSubnet = self._getIrbBlock(pod.vlanPrefix, pod.hostOrVmCountPerLeaf, 1)
+        irbSubnets = [ipAllocator.firstHost(value, cidrForEachSubnet) for value in 
+                      self.ipam.allocate(session, pod.id, 'irb', pod.vlanPrefix, cidrForEachSubnet, [(leaf.id, None) for leaf in newLeaves])]
+        self._assignAllocatedIrbToDevices(session, newLeaves, irbSubnets, cidrForEachSubnet)
+        
+        interconnectBlock, cidrForEachSubnet = self._getInterconnectBlock(pod.interConnectPrefix, 1, 1)
+        self._assignInterconnectToLinks(session, pod, pod.interConnectPrefix, cidrForEachSubnet, links)
+        self._updateAllocatedBlocks(session, pod)
+
+        leafSpineDict = self._getLeafSpineFromPod(pod)
+        pod.allocatedSpineAS = self._allocateNewAsNumbers(session, pod.spineAS, leafSpineDict['spines'], newSpines)
+        pod.allocatefLeafAS = self._allocateNewAsNumbers(session, pod.leafAS, leafSpineDict['leafs'], newLeaves)
+        
+        # for 2stage, leaf management ip comes from DHCP
+        if self.isZtpStaged == True:
+            self._allocateNewManagementIps(session, pod, newSpines)
+        else:
+            self._allocateNewManagementIps(session, pod, newSpines + newLeaves)
+        logger.info("Pod[id='%s', name='%s']: scaled, devices removed: %d, spines added: %d, leaves added: %d" % 
+                    (pod.id, pod.name, len(removedDevices), len(newSpines), len(newLeaves)))
+
+    def _importIpAllocations(self, session, pod):
+        '''
+        Pods built before IpAllocation existed have their ip only in IFLs, units in
+        use are imported once, before the first incremental allocation
+        '''
+        if session.query(IpAllocation.id).filter(IpAllocation.pod_id == pod.id).first() is not None:
+            return
+        roles = dict(session.query(Device.id, Device.role).filter(Device.pod_id == pod.id))
+        interfaceDevices = dict(session.query(Interface.id, Interface.device_id).join(Device, Interface.device_id == Device.id)
+                                .filter(Device.pod_id == pod.id))
+        ifdPeers = dict(session.query(InterfaceDefinition.id, InterfaceDefinition.peer_id).join(Device, InterfaceDefinition.device_id == Device.id)
+                        .filter(Device.pod_id == pod.id).filter(InterfaceDefinition.peer_id != None))
+        ifls = session.query(InterfaceLogical.device_id, InterfaceLogical.name, InterfaceLogical.layer_below_id, InterfaceLogical.ipaddress)\
+            .join(Device, InterfaceLogical.device_id == Device.id).filter(Device.pod_id == pod.id).filter(InterfaceLogical.ipaddress != None).all()
+
+        units = {'loopback': [], 'irb': [], 'interconnect': []}
+        for deviceId, name, layerBelowId, ipaddress in ifls:
+            ip = IPNetwork(ipaddress).value
+            if name == 'lo0.0':
+                units['loopback'].append((ip, deviceId, None))
+            elif name == 'irb.1':
+                units['irb'].append((ip, deviceId, None))
+            elif roles.get(deviceId) == 'spine' and layerBelowId in ifdPeers:
+                units['interconnect'].append((ip, deviceId, interfaceDevices.get(ifdPeers[layerBelowId])))
+        if not any(units.values()):
+            return
+
+        logger.info("Pod[id='%s', name='%s']: importing ip allocations of existing devices" % (pod.id, pod.name))
+        self.ipam.importAllocations(session, pod.id, 'loopback', pod.loopbackPrefix, 32, units['loopback'])
+        self.ipam.importAllocations(session, pod.id, 'irb', pod.vlanPrefix, 
+                                    self._getIrbBlock(pod.vlanPrefix, pod.hostOrVmCountPerLeaf, 1)[1], units['irb'])
+        self.ipam.importAllocations(session, pod.id, 'interconnect', pod.interConnectPrefix, 
+                                    self._getInterconnectBlock(pod.interConnectPrefix, 1, 1)[1], units['interconnect'])
+
+    def _diffInventoryDevices(self, pod, inventoryData):
+        '''
+        Matches inventory with pod devices by role/id/name, same as _deployInventory
+        :returns tuple: (devices not in inventory, inventory of new spines, inventory of new leaves)
+        '''
+        devicesByKey = {}
+        for device in pod.devices:
+            devicesByKey[(device.role, device.id)] = device
+            devicesByKey[(device.role, device.name)] = device
+
+        matchedDevices = set()
+        newInventory = {'spine': [], 'leaf': []}
+        for role, inventory in [('spine', inventoryData['spines']), ('leaf', inventoryData['leafs'])]:
+            for inv in inventory:
+                device = devicesByKey.get((role, inv.get('id'))) or devicesByKey.get((role, inv['name']))
+                if device is None:
+                    newInventory[role].append(inv)
+                else:
+                    matchedDevices.add(device)
+        removedDevices = [device for device in pod.devices if device not in matchedDevices]
+        return (removedDevices, newInventory['spine'], newInventory['leaf'])
+
+    def _removeDevices(self, session, pod, devices):
+        '''
+        Deletes devices and frees their ip, interconnect IFLs of their peers are deleted
+        and peer IFDs unlinked, the IFDs stay for later scale-out
+        '''
+        if len(devices) == 0:
+            return
+        deviceIds = [device.id for device in devices]
+        peerIfds = session.query(InterfaceDefinition).filter(InterfaceDefinition.peer_id.in_(
+            session.query(Interface.id).filter(Interface.device_id.in_(deviceIds)))).all()
+        for peerIfd in peerIfds:
+            if peerIfd.device_id in deviceIds:
+                continue
+            self._dao.deleteObjects(session, peerIfd.layerAboves)
+            peerIfd.peer.peer = None
+            peerIfd.peer = None
+        # peer_id is set by post update, unlink must reach DB before the delete
+        session.flush()
+
+        self.ipam.free(session, pod.id, deviceIds)
+        session.query(BgpLink).filter(BgpLink.device_id.in_(deviceIds)).delete(synchronize_session = False)
+        self._dao.deleteObjects(session, devices)
+        session.flush()
+        session.expire(pod, ['devices'])
+        logger.debug("Pod[id='%s', name='%s']: removed devices: %s" % (pod.id, pod.name, [device.name for device in devices]))
+
+    def _createInterconnectLinksOfNewDevices(self, session, pod, newSpines, newLeaves):
+        '''
+        Same wiring as _createInterconnectLinks, leaf in slot N goes to port N of every 
+        spine, spine in slot N goes to uplink N of every leaf. Existing devices keep
+        their slot, new devices take the lowest slots left free by removed devices.
+        Leaves get 'uplink-N' IFDs when spine slots go beyond their uplink ports.
+        :returns list: (spine, spine IFD) of the new links, the leaf end is the IFD peer
+        '''
+        leafSpineDict = self._getLeafSpineFromPod(pod)
+        spines = leafSpineDict['spines']
+        leaves = leafSpineDict['leafs']
+        spinePorts = {}
+        for spine in spines:
+            spinePorts[spine.id] = session.query(InterfaceDefinition).filter(InterfaceDefinition.device_id == spine.id).filter(InterfaceDefinition.role == 'downlink').order_by(InterfaceDefinition.sequenceNum).all()
+        leafUplinkPorts = {}
+        for leaf in leaves:
+            leafUplinkPorts[leaf.id] = session.query(InterfaceDefinition).filter(InterfaceDefinition.device_id == leaf.id).filter(InterfaceDefinition.role == 'uplink').order_by(InterfaceDefinition.sequenceNum).all()
+
+        # slots taken by existing links
+        leafSlots = {}
+        for spine in spines:
+            for slot, spinePort in enumerate(spinePorts[spine.id]):
+                if spinePort.peer is not None:
+                    leafSlots[spinePort.peer.device_id] = slot
+        spineSlots = {}
+        for leaf in leaves:
+            for slot, leafPort in enumerate(leafUplinkPorts[leaf.id]):
+                if leafPort.peer is not None:
+                    spineSlots[leafPort.peer.device_id] = slot
+        self._assignFreeSlots(leafSlots, [leaf for leaf in leaves if leaf.id not in leafSlots])
+        self._assignFreeSlots(spineSlots, [spine for spine in spines if spine.id not in spineSlots])
+
+        if len(leaves) > 0 and len(spines) > 0:
+            spinePortCount = min([len(ports) for ports in spinePorts.values()])
+            if max(leafSlots.values()) >= spinePortCount:
+                raise CapacityCannotChange("Pod[id='%s', name='%s']: spine has %d ports, leaf slots required: %d" % 
+                                           (pod.id, pod.name, spinePortCount, max(leafSlots.values()) + 1))
+            # Hack plugNPlay-mixedLeaf: additional uplinks when spine slots are more than available uplink ports
+            uplinkCount = max(spineSlots.values()) + 1
+            interfaces = []
+            for leaf in leaves:
+                for i in xrange(len(leafUplinkPorts[leaf.id]), uplinkCount):
+                    ifd = InterfaceDefinition('uplink-' + str(i), leaf, 'uplink')
+                    leafUplinkPorts[leaf.id].append(ifd)
+                    interfaces.append(ifd)
+            self._dao.createObjects(session, interfaces)
+
+        newDeviceIds = set([device.id for device in newSpines + newLeaves])
+        links = []
+        modifiedObjects = []
+        for spine in sorted(spines, key=lambda dev: dev.name):
+            for leaf in sorted(leaves, key=lambda dev: leafSlots[dev.id]):
+                if spine.id not in newDeviceIds and leaf.id not in newDeviceIds:
+                    continue
+                spinePort = spinePorts[spine.id][leafSlots[leaf.id]]
+                leafPort = leafUplinkPorts[leaf.id][spineSlots[spine.id]]
+                spinePort.peer = leafPort
+                leafPort.peer = spinePort
+                modifiedObjects.append(spinePort)
+                modifiedObjects.append(leafPort)
+                links.append((spine, spinePort))
+        self._dao.updateObjects(session, modifiedObjects)
+        return links
+
+    def _assignFreeSlots(self, slots, devices):
+        usedSlots = set(slots.values())
+        slot = 0
+        for device in devices:
+            while slot in usedSlots:
+                slot += 1
+            slots[device.id] = slot
+            usedSlots.add(slot)
+
+    def _updateAllocatedBlocks(self, session, pod):
+        '''
+        allocated*Block covers the pool up to its high-water mark, units of removed 
+        devices stay in the block until reused
+        '''
+        highWaterMark = self.ipam.getHighWaterMark(session, pod.id, 'loopback')
+        if highWaterMark is not None:
+            pod.allocatedLoopbackBlock = str(self._getLoopbackBlock(pod.loopbackPrefix, highWaterMark).cidr)
+        highWaterMark = self.ipam.getHighWaterMark(session, pod.id, 'irb')
+        if highWaterMark is not None:
+            pod.allocatedIrbBlock = str(self._getIrbBlock(pod.vlanPrefix, pod.hostOrVmCountPerLeaf, highWaterMark + 1)[0].cidr)
+        highWaterMark = self.ipam.getHighWaterMark(session, pod.id, 'interconnect')
+        if highWaterMark is not None:
+            pod.allocatedInterConnectBlock = str(self._getInterconnectBlock(pod.interConnectPrefix, 1, highWaterMark + 1)[0].cidr)
+
+    def _allocateNewAsNumbers(self, session, firstAsn, devices, newDevices):
+        '''
+        New devices get the lowest ASN not used by the other devices, starting at firstAsn
+        :returns int: highest ASN in use, None if no device
+        '''
+        usedAsns = set([device.asn for device in devices if device not in newDevices and device.asn is not None])
+        asn = firstAsn
+        for device in newDevices:
+            while asn in usedAsns:
+                asn += 1
+            device.asn = asn
+            usedAsns.add(asn)
+        self._dao.updateObjects(session, newDevices)
+        return max(usedAsns) if len(usedAsns) > 0 else None
+
+    def _allocateNewManagementIps(self, session, pod, newDevices):
+        '''
+        New devices get the lowest management ip not used by the other devices
+        '''
+        newDeviceIds = set([device.id for device in newDevices])
+        usedIps = set([device.managementIp for device in pod.devices if device.id not in newDeviceIds])
+        # first len(usedIps) + len(newDevices) ips always have enough free ones
+        managementIps = util.getMgmtIps(pod.managementPrefix, pod.managementStartingIP, pod.managementMask, len(usedIps) + len(newDevices))
+        freeIps = [ip for ip in managementIps if ip not in usedIps]
+        # don't do partial allocation
+        if len(freeIps) >= len(newDevices):
+            for device, managementIp in zip(newDevices, freeIps):
+                device.managementIp = managementIp
+            self._dao.updateObjects(session, newDevices)
+
+    def _getManagementIpCount(self, pod):
+        '''
+        Number of management ips from the first one of the pod up to the highest one
+        allocated to a device, at least device count. Devices removed by scale-in leave
+        holes until new devices reuse them.
+        '''
+        count = len(pod.devices)
+        ipRange = util.getMgmtIpRange(pod.managementPrefix, pod.managementStartingIP, pod.managementMask, 1)
+        if ipRange is None:
+            return count
+        for device in pod.devices:
+            # for 2stage, leaf management ip comes from DHCP
+            if device.managementIp is None or (device.role == 'leaf' and self.isZtpStaged == True):
+                continue
+            count = max(count, IPAddress(device.managementIp.split('/')[0]).value - ipRange[0] + 1)
+        return count
+        
     def _getLeafSpineFromPod(self, pod):
         '''
         utility method to get list of spines and leafs of a pod
@@ -595,53 +949,65 @@ class L3ClosMediation():
                     leaf.managementIp = managementIp
                 self._dao.updateObjects(session, leaves)
         
-    def _allocateLoopback(self, session, pod, loopbackPrefix, devices):
+    def _getLoopbackBlock(self, loopbackPrefix, deviceCount):
         loopbackIp = IPNetwork(loopbackPrefix).network
-        numOfIps = len(devices) + 2 # +2 for network and broadcast
+        numOfIps = deviceCount + 2 # +2 for network and broadcast
         numOfBits = int(math.ceil(math.log(numOfIps, 2))) 
         cidr = 32 - numOfBits
-        lo0Block = IPNetwork(str(loopbackIp) + "/" + str(cidr))
-        lo0Ips = list(lo0Block.iter_hosts())
+        return IPNetwork(str(loopbackIp) + "/" + str(cidr))
+
+    def _allocateLoopback(self, session, pod, loopbackPrefix, devices):
+        lo0Block = self._getLoopbackBlock(loopbackPrefix, len(devices))
+        lo0Ips = [ipAllocator.ipToString(value) for value in 
+                  self.ipam.allocate(session, pod.id, 'loopback', loopbackPrefix, 32, [(device.id, None) for device in devices])]
         
         pod.allocatedLoopbackBlock = str(lo0Block.cidr)
         self._assignAllocatedLoopbackToDevices(session, devices, lo0Ips)
 
     def _assignAllocatedLoopbackToDevices(self, session, devices, lo0Ips):
         interfaces = []
-        for device in devices:
-            ifl = InterfaceLogical('lo0.0', device, str(lo0Ips.pop(0)) + '/32')
+        for device, ip in itertools.izip(devices, lo0Ips):
+            ifl = InterfaceLogical('lo0.0', device, ip + '/32')
             interfaces.append(ifl)
         self._dao.createObjects(session, interfaces)
 
-    def _allocateIrb(self, session, pod, irbPrefix, leafs):
+    def _getIrbBlock(self, irbPrefix, numOfHostIpsPerSwitch, leafCount):
+        '''
+        :returns tuple: (irb block, cidr of each leaf subnet)
+        '''
         irbIp = IPNetwork(irbPrefix).network
-        numOfHostIpsPerSwitch = pod.hostOrVmCountPerLeaf
-        numOfSubnets = len(leafs)
+        numOfSubnets = leafCount
         bitsPerSubnet = int(math.ceil(math.log(numOfHostIpsPerSwitch + 2, 2)))  # +2 for network and broadcast
         cidrForEachSubnet = 32 - bitsPerSubnet
 
         numOfIps = (numOfSubnets * (2 ** bitsPerSubnet))
         numOfBits = int(math.ceil(math.log(numOfIps, 2))) 
         cidr = 32 - numOfBits
-        irbBlock = IPNetwork(str(irbIp) + "/" + str(cidr))
-        irbSubnets = list(irbBlock.subnet(cidrForEachSubnet))
+        return (IPNetwork(str(irbIp) + "/" + str(cidr)), cidrForEachSubnet)
+
+    def _allocateIrb(self, session, pod, irbPrefix, leafs):
+        irbBlock, cidrForEachSubnet = self._getIrbBlock(irbPrefix, pod.hostOrVmCountPerLeaf, len(leafs))
+        irbSubnets = [ipAllocator.firstHost(value, cidrForEachSubnet) for value in 
+                      self.ipam.allocate(session, pod.id, 'irb', irbPrefix, cidrForEachSubnet, [(leaf.id, None) for leaf in leafs])]
         
         pod.allocatedIrbBlock = str(irbBlock.cidr)
         self._assignAllocatedIrbToDevices(session, leafs, irbSubnets, cidrForEachSubnet)
 
     def _assignAllocatedIrbToDevices(self, session, leafs, irbSubnets, cidrForEachSubnet):
         interfaces = [] 
-        for leaf in leafs:
-            ipAddress = list(irbSubnets.pop(0).iter_hosts())[0]
+        for leaf, ipAddress in itertools.izip(leafs, irbSubnets):
             # TODO: would be better to get irb.1 from property file as .1 is VLAN ID
-            ifl = InterfaceLogical('irb.1', leaf, str(ipAddress) + '/' + str(cidrForEachSubnet)) 
+            ifl = InterfaceLogical('irb.1', leaf, ipAddress) 
             interfaces.append(ifl)
         self._dao.createObjects(session, interfaces)
 
-    def _allocateInterconnect(self, session, interConnectPrefix, spines, leafs):
+    def _getInterconnectBlock(self, interConnectPrefix, spineCount, leafCount):
+        '''
+        :returns tuple: (interconnect block, cidr of each point-to-point subnet)
+        '''
         interConnectIp = IPNetwork(interConnectPrefix).network
         numOfIpsPerInterconnect = 2
-        numOfSubnets = len(spines) * len(leafs)
+        numOfSubnets = spineCount * leafCount
         # no need to add +2 for network and broadcast, as junos supports /31
         # TODO: it should be configurable and come from property file
         bitsPerSubnet = int(math.ceil(math.log(numOfIpsPerInterconnect, 2)))    # value is 1  
@@ -650,26 +1016,38 @@ class L3ClosMediation():
         numOfIps = (numOfSubnets * (numOfIpsPerInterconnect)) # no need to add +2 for network and broadcast
         numOfBits = int(math.ceil(math.log(numOfIps, 2))) 
         cidr = 32 - numOfBits
-        interconnectBlock = IPNetwork(str(interConnectIp) + "/" + str(cidr))
-        interconnectSubnets = list(interconnectBlock.subnet(cidrForEachSubnet))
+        return (IPNetwork(str(interConnectIp) + "/" + str(cidr)), cidrForEachSubnet)
 
-        interfaces = [] 
-        spines[0].pod.allocatedInterConnectBlock = str(interconnectBlock.cidr)
+    def _allocateInterconnect(self, session, interConnectPrefix, spines, leafs):
+        interconnectBlock, cidrForEachSubnet = self._getInterconnectBlock(interConnectPrefix, len(spines), len(leafs))
+        pod = spines[0].pod
+        pod.allocatedInterConnectBlock = str(interconnectBlock.cidr)
 
+        links = []
         for spine in spines:
             ifdsHasPeer = session.query(InterfaceDefinition).filter(InterfaceDefinition.device_id == spine.id).filter(InterfaceDefinition.peer != None).filter(InterfaceDefinition.role == 'downlink').order_by(InterfaceDefinition.sequenceNum).all()
-            for spineIfdHasPeer in ifdsHasPeer:
-                subnet =  interconnectSubnets.pop(0)
-                ips = list(subnet)
+            links += [(spine, spineIfdHasPeer) for spineIfdHasPeer in ifdsHasPeer]
+        self._assignInterconnectToLinks(session, pod, interConnectPrefix, cidrForEachSubnet, links)
+
+    def _assignInterconnectToLinks(self, session, pod, interConnectPrefix, cidrForEachSubnet, links):
+        '''
+        :param list links: (spine, spine IFD) of each link, the leaf end is the IFD peer
+        '''
+        interconnectSubnets = self.ipam.allocate(session, pod.id, 'interconnect', interConnectPrefix, cidrForEachSubnet, 
+                                                 [(spine.id, spineIfdHasPeer.peer.device_id) for spine, spineIfdHasPeer in links])
+
+        interfaces = [] 
+        for (spine, spineIfdHasPeer), subnet in zip(links, interconnectSubnets):
+            spineIp, leafIp = ipAllocator.pointToPointEnds(subnet, cidrForEachSubnet)
                 
-                spineEndIfl= InterfaceLogical(spineIfdHasPeer.name + '.0', spine, str(ips.pop(0)) + '/' + str(cidrForEachSubnet))
-                spineIfdHasPeer.layerAboves.append(spineEndIfl)
-                interfaces.append(spineEndIfl)
+            spineEndIfl= InterfaceLogical(spineIfdHasPeer.name + '.0', spine, spineIp)
+            spineIfdHasPeer.layerAboves.append(spineEndIfl)
+            interfaces.append(spineEndIfl)
                 
-                leafEndIfd = spineIfdHasPeer.peer
-                leafEndIfl= InterfaceLogical(leafEndIfd.name + '.0', leafEndIfd.device, str(ips.pop(0)) + '/' + str(cidrForEachSubnet))
-                leafEndIfd.layerAboves.append(leafEndIfl)
-                interfaces.append(leafEndIfl)
+            leafEndIfd = spineIfdHasPeer.peer
+            leafEndIfl= InterfaceLogical(leafEndIfd.name + '.0', leafEndIfd.device, leafIp)
+            leafEndIfd.layerAboves.append(leafEndIfl)
+            interfaces.append(leafEndIfl)
         self._dao.createObjects(session, interfaces)
 
     def _allocateAsNumberToSpines(self, session, spineAsn, spines):
@@ -692,25 +1070,165 @@ class L3ClosMediation():
 
         self._dao.updateObjects(session, devices)
 
+    def _buildPodInBulk(self, session, pod, inventoryData):
+        '''
+        Bulk counterpart of _createSpineAndIfds, _createLeafAndIfds, _createLinks and
+        _allocateResource. Complete device/IFD/IFL/peer graph is computed in memory 
+        as plain rows and written with a constant number of executemany statements
+        instead of one INSERT/UPDATE per ORM object at flush time.
+        '''
+        # pod row and any pending delete (rebuild) must reach DB before bulk insert
+        session.flush()
+        
+        spines = [self._newDeviceRow(pod, spine, 'spine', pod.spineDeviceType) for spine in inventoryData['spines']]
+        leaves = [self._newDeviceRow(pod, leaf, 'leaf', leaf.get('family')) for leaf in inventoryData['leafs']]
+        
+        ifds = []
+        spinePorts = {}
+        for spine in spines:
+            portNames = self.deviceSku.getPortNamesForDeviceFamily(spine['family'], 'spine')
+            spinePorts[spine['id']] = [self._newInterfaceRow(name, spine, role = 'downlink') for name in portNames['downlinkPorts']]
+            ifds += spinePorts[spine['id']]
+        
+        leafUplinkPorts = {}
+        for leaf in leaves:
+            uplinkNames = []
+            if leaf['family'] is not None and leaf['family'] != 'unknown':
+                uplinkNames += self.deviceSku.getPortNamesForDeviceFamily(leaf['family'], 'leaf')['uplinkPorts']
+            # Hack plugNPlay-mixedLeaf: fake uplinks when spine count is more than available uplink ports
+            for i in xrange(len(uplinkNames), pod.spineCount):
+                uplinkNames.append('uplink-' + str(i))
+            leafUplinkPorts[leaf['id']] = [self._newInterfaceRow(name, leaf, role = 'uplink') for name in uplinkNames]
+            ifds += leafUplinkPorts[leaf['id']]
+
+        # same port order as the sequenceNum ordered queries of _createInterconnectLinks
+        for ports in spinePorts.values() + leafUplinkPorts.values():
+            ports.sort(key=lambda ifd: ifd['sequenceNum'])
+        
+        # leaf N goes to port N of every spine, spine N goes to uplink N of every leaf
+        for leafIndex, leaf in enumerate(leaves):
+            for spineIndex, spine in enumerate(spines):
+                spinePort = spinePorts[spine['id']][leafIndex]
+                leafPort = leafUplinkPorts[leaf['id']][spineIndex]
+                spinePort['peer'] = leafPort
+                leafPort['peer'] = spinePort
+
+        spines.sort(key=lambda dev: dev['name'])
+        leaves.sort(key=lambda dev: dev['name'])
+        devices = sorted(spines + leaves, key=lambda dev: dev['name'])
+        
+        ifls = []
+        lo0Block = self._getLoopbackBlock(pod.loopbackPrefix, len(devices))
+        pod.allocatedLoopbackBlock = str(lo0Block.cidr)
+        lo0Ips = self.ipam.allocate(session, pod.id, 'loopback', pod.loopbackPrefix, 32, [(device['id'], None) for device in devices])
+        for device, ip in itertools.izip(devices, lo0Ips):
+            ifls.append(self._newInterfaceRow('lo0.0', device, ipaddress = ipAllocator.ipToString(ip) + '/32'))
+            
+        irbBlock, cidrForEachSubnet = self._getIrbBlock(pod.vlanPrefix, pod.hostOrVmCountPerLeaf, len(leaves))
+        pod.allocatedIrbBlock = str(irbBlock.cidr)
+        irbSubnets = self.ipam.allocate(session, pod.id, 'irb', pod.vlanPrefix, cidrForEachSubnet, [(leaf['id'], None) for leaf in leaves])
+        for leaf, subnet in itertools.izip(leaves, irbSubnets):
+            ifls.append(self._newInterfaceRow('irb.1', leaf, ipaddress = ipAllocator.firstHost(subnet, cidrForEachSubnet)))
+            
+        interconnectBlock, cidrForEachSubnet = self._getInterconnectBlock(pod.interConnectPrefix, len(spines), len(leaves))
+        pod.allocatedInterConnectBlock = str(interconnectBlock.cidr)
+        links = [(spine, spinePort) for spine in spines for spinePort in spinePorts[spine['id']] if spinePort.get('peer') is not None]
+        interconnectSubnets = self.ipam.allocate(session, pod.id, 'interconnect', pod.interConnectPrefix, cidrForEachSubnet, 
+                                                 [(spine['id'], spinePort['peer']['device']['id']) for spine, spinePort in links])
+        for (spine, spinePort), subnet in itertools.izip(links, interconnectSubnets):
+            spineIp, leafIp = ipAllocator.pointToPointEnds(subnet, cidrForEachSubnet)
+            leafPort = spinePort['peer']
+            ifls.append(self._newInterfaceRow(spinePort['name'] + '.0', spine, ipaddress = spineIp, layerBelow = spinePort))
+            ifls.append(self._newInterfaceRow(leafPort['name'] + '.0', leafPort['device'], ipaddress = leafIp, layerBelow = leafPort))
+
+        for asn, spine in enumerate(spines, pod.spineAS):
+            spine['asn'] = asn
+        pod.allocatedSpineAS = pod.spineAS + len(spines) - 1
+        for asn, leaf in enumerate(leaves, pod.leafAS):
+            leaf['asn'] = asn
+        pod.allocatefLeafAS = pod.leafAS + len(leaves) - 1
+
+        managementIps = util.getMgmtIps(pod.managementPrefix, pod.managementStartingIP, pod.managementMask, len(devices))
+        # don't do partial allocation, for 2stage and leaf, don't fill in management ip
+        if len(managementIps) == len(devices):
+            managedDevices = spines if self.isZtpStaged else spines + leaves
+            for device, managementIp in zip(managedDevices, managementIps):
+                device['managementIp'] = managementIp
+
+        self._dao.bulkInsert(session, Device, devices)
+        self._dao.bulkInsert(session, InterfaceDefinition, ifds)
+        # peer is self referencing, so it gets written once all IFDs exist (same as ORM post_update)
+        self._dao.bulkUpdate(session, Interface, [{'id': ifd['id'], 'peer_id': ifd['peer']['id']} for ifd in ifds if ifd.get('peer') is not None])
+        self._dao.bulkInsert(session, InterfaceLogical, ifls)
+        
+        # devices were written behind ORM's back, force lazy load of the collection
+        session.expire(pod, ['devices'])
+        logger.debug("Pod[id='%s', name='%s']: bulk build done, devices: %d, IFDs: %d, IFLs: %d" % (pod.id, pod.name, len(devices), len(ifds), len(ifls)))
+
+    def _newDeviceRow(self, pod, inventory, role, family):
+        '''
+        Row equivalent of Device(...) for _buildPodInBulk
+        '''
+        password = inventory.get('password')
+        if password is not None and len(password) > 0:
+            encryptedPassword = pod.cryptic.encrypt(password)
+        else:
+            encryptedPassword = pod.encryptedPassword
+        
+        return {'id': str(uuid.uuid4()), 'name': inventory['name'], 'family': family, 'role': role,
+                'username': inventory.get('username'), 'encryptedPassword': encryptedPassword, 
+                'macAddress': inventory.get('macAddress'), 'serialNumber': inventory.get('serialNumber'), 
+                'deployStatus': inventory.get('deployStatus'), 'managementIp': None, 'asn': None, 'pod_id': pod.id}
+
+    def _newInterfaceRow(self, name, device, role = None, ipaddress = None, layerBelow = None):
+        '''
+        Row equivalent of InterfaceDefinition(...)/InterfaceLogical(...) for _buildPodInBulk
+        '''
+        return {'id': str(uuid.uuid4()), 'name': name, 'sequenceNum': util.interfaceNameToUniqueSequenceNumber(name),
+                'device': device, 'device_id': device['id'], 'role': role, 'ipaddress': ipaddress, 'mtu': 0,
+                'layer_below_id': layerBelow['id'] if layerBelow is not None else None}
+
     def generateConfig(self, session, pod):
+        '''
+        Generates config for all devices of the pod in three steps
+        1. snapshot template parameters of each device from DB (FabricIndex)
+        2. render configs, serially or in a thread/process pool (openclos.yaml configRendering)
+        3. store all configs in DB in a single batch
+        Devices whose template parameters fingerprint did not change since last 
+        generation keep their config, they are neither rendered nor written.
+        :returns dict: number of 'regenerated' and 'reused' device configs
+        '''
         configWriter = ConfigWriter(self._conf, pod, self._dao)
         modifiedObjects = []
+        fabricIndex = FabricIndex(session, pod)
+        oob = self._getParamsForOutOfBandNetwork(session, pod)
+        # hashing forks openssl, devices mostly share the pod password
+        hashedPasswords = {}
+        existingFingerprints = self._getConfigFingerprints(session, pod)
         
+        devices = []
+        deviceConfiglets = []
+        fingerprints = []
+        reusedCount = 0
         for device in pod.devices:
             if device.role == 'leaf' and (self.isZtpStaged or device.family == 'unknown'):
                 # leaf configs will get created when they are plugged in after 2Stage ztp
                 continue
-            
-            config = self._createBaseConfig(device)
-            config += self._createInterfaces(session, device)
-            config += self._createRoutingOptionsStatic(session, device)
-            config += self._createRoutingOptionsBgp(session, device)
-            config += self._createProtocolBgp(session, device)
-            config += self._createProtocolLldp(device)
-            config += self._createPolicyOption(session, device)
-            config += self._createSnmpTrapAndEvent(session, device)
-            config += self._createVlan(device)
-            device.config = DeviceConfig(device.id, config)
+            configlets = self._getDeviceConfiglets(session, device, fabricIndex, oob, hashedPasswords)
+            fingerprint = getConfigletsFingerprint(configlets)
+            if existingFingerprints.get(device.id) == fingerprint:
+                logger.debug('Config inputs unchanged for device name: %s, id: %s, reusing config' % (device.name, device.id))
+                reusedCount += 1
+                configWriter.write(device)
+                continue
+            devices.append(device)
+            deviceConfiglets.append(configlets)
+            fingerprints.append(fingerprint)
+
+        configs = self._renderDeviceConfigs(deviceConfiglets)
+
+        for device, config, fingerprint in zip(devices, configs, fingerprints):
+            device.config = DeviceConfig(device.id, config, fingerprint)
             modifiedObjects.append(device)
             logger.debug('Generated config for device name: %s, id: %s, storing in DB' % (device.name, device.id))
             configWriter.write(device)
@@ -722,54 +1240,135 @@ class L3ClosMediation():
             configWriter.writeGenericLeaf(pod)
         
         self._dao.updateObjects(session, modifiedObjects)
+        logger.info("Pod[id='%s', name='%s']: device configs regenerated: %d, reused: %d" % (pod.id, pod.name, len(devices), reusedCount))
+        return {'regenerated': len(devices), 'reused': reusedCount}
+
+    def _getConfigFingerprints(self, session, pod):
+        '''
+        :returns dict: config fingerprint by device id, for all devices of the pod having config
+        '''
+        fingerprints = session.query(DeviceConfig.device_id, DeviceConfig.fingerprint).join(Device, DeviceConfig.device_id == Device.id)\
+            .filter(Device.pod_id == pod.id).all()
+        return dict(fingerprints)
+
+    def _getDeviceConfiglets(self, session, device, fabricIndex = None, oob = None, hashedPasswords = None):
+        '''
+        :param dict hashedPasswords: cache of hashed password by cleartext, shared across devices
+        :returns list: (templateName, parameters) for complete device config, see renderConfiglets
+        '''
+        configlets = self._getBaseConfiglets(device, hashedPasswords)
+        configlets += self._getInterfacesConfiglets(session, device, fabricIndex)
+        configlets += self._getRoutingOptionsStaticConfiglets(session, device, oob)
+        configlets += self._getRoutingOptionsBgpConfiglets(session, device, fabricIndex)
+        configlets += self._getProtocolBgpConfiglets(session, device, fabricIndex)
+        configlets += self._getProtocolLldpConfiglets(device)
+        configlets += self._getPolicyOptionConfiglets(session, device, fabricIndex)
+        configlets += self._getSnmpTrapAndEventConfiglets(session, device)
+        configlets += self._getVlanConfiglets(device)
+        return configlets
+
+    def _renderDeviceConfigs(self, deviceConfiglets):
+        '''
+        Renders list of device configlets, in the order given
+        :returns list: configs
+        '''
+        if len(deviceConfiglets) < 2:
+            return renderDeviceConfigs(deviceConfiglets)
+        executor = getRenderingPool(self._conf)
+        if executor is None:
+            return renderDeviceConfigs(deviceConfiglets)
+
+        workerCount = self._conf['configRendering'].get('workerCount', DEFAULT_RENDERING_WORKERS)
+        # few large chunks, pickling every device separately is costly for process pool
+        chunkSize = int(math.ceil(len(deviceConfiglets) / float(workerCount * 4)))
+        chunks = [deviceConfiglets[i:i + chunkSize] for i in xrange(0, len(deviceConfiglets), chunkSize)]
+        logger.debug('Rendering %d device configs with %s, workers: %d, chunks: %d' % 
+                     (len(deviceConfiglets), executor.__class__.__name__, workerCount, len(chunks)))
+        
+        configs = []
+        for chunkConfigs in executor.map(renderDeviceConfigs, chunks):
+            configs += chunkConfigs
+        return configs
 
     def _createBaseConfig(self, device):
-        baseTemplate = self._templateEnv.get_template('baseTemplate.txt')
-        return baseTemplate.render(hostName=device.name, hashedPassword=device.getHashPassword())
+        return renderConfiglets(self._getBaseConfiglets(device))
 
-    def _createInterfaces(self, session, device): 
-        lo0Stanza = self._templateEnv.get_template('lo0_stanza.txt')
-        mgmtStanza = self._templateEnv.get_template('mgmt_interface.txt')
-        rviStanza = self._templateEnv.get_template('rvi_stanza.txt')
-            
-        config = "interfaces {" + "\n" 
+    def _getBaseConfiglets(self, device, hashedPasswords = None):
+        if hashedPasswords is None:
+            hashedPassword = device.getHashPassword()
+        else:
+            cleartext = device.getCleartextPassword()
+            if cleartext not in hashedPasswords:
+                hashedPasswords[cleartext] = device.getHashPassword()
+            hashedPassword = hashedPasswords[cleartext]
+        return [('baseTemplate.txt', {'hostName': device.name, 'hashedPassword': hashedPassword})]
+
+    def _getDeviceIfl(self, session, device, name, fabricIndex = None):
+        '''
+        Lookup IFL (lo0.0, irb.1) of the device, from fabricIndex when available
+        '''
+        if fabricIndex is not None:
+            return fabricIndex.getIfl(device.id, name)
+        return session.query(InterfaceLogical).join(Device).filter(Device.id == device.id).filter(InterfaceLogical.name == name).one()
+
+    def _getInterconnectPeers(self, session, device, fabricIndex = None):
+        '''
+        :returns list: (interconnectIfd, interconnectIfl, peerIfd, peerIfl, peerDevice) for each 
+        connected interconnect port of the device, from fabricIndex when available
+        '''
+        peers = []
+        if fabricIndex is not None:
+            for ifd in fabricIndex.getConnectedInterconnectIFDsFilterFakeOnes(device):
+                peerIfd = fabricIndex.getPeer(ifd)
+                peers.append((ifd, fabricIndex.getLayerAboves(ifd)[0], peerIfd, 
+                              fabricIndex.getLayerAboves(peerIfd)[0], fabricIndex.getDevice(peerIfd.device_id)))
+        else:
+            for ifd in self._dao.getConnectedInterconnectIFDsFilterFakeOnes(session, device):
+                peerIfd = ifd.peer
+                peers.append((ifd, ifd.layerAboves[0], peerIfd, peerIfd.layerAboves[0], peerIfd.device))
+        return peers
+
+    def _createInterfaces(self, session, device, fabricIndex = None): 
+        return renderConfiglets(self._getInterfacesConfiglets(session, device, fabricIndex))
+
+    def _getInterfacesConfiglets(self, session, device, fabricIndex = None): 
+        configlets = [(None, "interfaces {" + "\n")]
         # management interface
-        config += mgmtStanza.render(mgmt_address=device.managementIp)
+        configlets.append(('mgmt_interface.txt', {'mgmt_address': device.managementIp}))
                 
         #loopback interface
-        loopbackIfl = session.query(InterfaceLogical).join(Device).filter(Device.id == device.id).filter(InterfaceLogical.name == 'lo0.0').one()
-        config += lo0Stanza.render(address=loopbackIfl.ipaddress)
+        loopbackIfl = self._getDeviceIfl(session, device, 'lo0.0', fabricIndex)
+        configlets.append(('lo0_stanza.txt', {'address': loopbackIfl.ipaddress}))
         
         # For Leaf add IRB and server facing interfaces        
         if device.role == 'leaf':
-            irbIfl = session.query(InterfaceLogical).join(Device).filter(Device.id == device.id).filter(InterfaceLogical.name == 'irb.1').one()
-            config += rviStanza.render(address=irbIfl.ipaddress)
-            config += self._createAccessPortInterfaces(session, device)
+            irbIfl = self._getDeviceIfl(session, device, 'irb.1', fabricIndex)
+            configlets.append(('rvi_stanza.txt', {'address': irbIfl.ipaddress}))
+            configlets += self._getAccessPortInterfacesConfiglets(session, device)
                 
-        config += self._createInterconnectInterfaces(session, device)
-        config += "}\n"
-        return config
+        configlets += self._getInterconnectInterfacesConfiglets(session, device, fabricIndex)
+        configlets.append((None, "}\n"))
+        return configlets
 
-    def _createInterconnectInterfaces(self, session, device): 
-        interfaceStanza = self._templateEnv.get_template('interface_stanza.txt')
-        config = ''
+    def _createInterconnectInterfaces(self, session, device, fabricIndex = None): 
+        return renderConfiglets(self._getInterconnectInterfacesConfiglets(session, device, fabricIndex))
 
-        deviceInterconnectIfds = self._dao.getConnectedInterconnectIFDsFilterFakeOnes(session, device)
-        for interconnectIfd in deviceInterconnectIfds:
-            peerDevice = interconnectIfd.peer.device
-            interconnectIfl = interconnectIfd.layerAboves[0]
+    def _getInterconnectInterfacesConfiglets(self, session, device, fabricIndex = None): 
+        configlets = []
+        for interconnectIfd, interconnectIfl, peerIfd, peerIfl, peerDevice in self._getInterconnectPeers(session, device, fabricIndex):
             namePlusUnit = interconnectIfl.name.split('.')  # example et-0/0/0.0
-            config += interfaceStanza.render(ifd_name=namePlusUnit[0],
-                                             unit=namePlusUnit[1],
-                                             description="facing_" + peerDevice.name,
-                                             address=interconnectIfl.ipaddress)
-        return config
+            configlets.append(('interface_stanza.txt', {'ifd_name': namePlusUnit[0],
+                                                        'unit': namePlusUnit[1],
+                                                        'description': "facing_" + peerDevice.name,
+                                                        'address': interconnectIfl.ipaddress}))
+        return configlets
     
     def _createAccessPortInterfaces(self, session, device):
-        accessInterface = self._templateEnv.get_template('accessInterface.txt')
-        
+        return renderConfiglets(self._getAccessPortInterfacesConfiglets(session, device))
+
+    def _getAccessPortInterfacesConfiglets(self, session, device):
         ifdNames = self.deviceSku.getPortNamesForDeviceFamily(device.family, 'leaf')['downlinkPorts']
-        return accessInterface.render(ifdNames=ifdNames)
+        return [('accessInterface.txt', {'ifdNames': ifdNames})]
 
     def _getOpenclosTrapTargetIpFromConf(self):
         snmpTrapConf = self._conf.get('snmpTrap')
@@ -812,60 +1411,68 @@ class L3ClosMediation():
             return {}
     
     def _createRoutingOptionsStatic(self, session, device):
-        routingOptions = self._templateEnv.get_template('routingOptionsStatic.txt')
-        return routingOptions.render(oob = self._getParamsForOutOfBandNetwork(session, device.pod))
+        return renderConfiglets(self._getRoutingOptionsStaticConfiglets(session, device))
+
+    def _getRoutingOptionsStaticConfiglets(self, session, device, oob = None):
+        if oob is None:
+            oob = self._getParamsForOutOfBandNetwork(session, device.pod)
+        return [('routingOptionsStatic.txt', {'oob': oob})]
 
-    def _createRoutingOptionsBgp(self, session, device):
-        routingOptions = self._templateEnv.get_template('routingOptionsBgp.txt')
+    def _createRoutingOptionsBgp(self, session, device, fabricIndex = None):
+        return renderConfiglets(self._getRoutingOptionsBgpConfiglets(session, device, fabricIndex))
 
-        loopbackIfl = session.query(InterfaceLogical).join(Device).filter(Device.id == device.id).filter(InterfaceLogical.name == 'lo0.0').one()
+    def _getRoutingOptionsBgpConfiglets(self, session, device, fabricIndex = None):
+        loopbackIfl = self._getDeviceIfl(session, device, 'lo0.0', fabricIndex)
         loopbackIpWithNoCidr = loopbackIfl.ipaddress.split('/')[0]
         
-        return routingOptions.render(routerId=loopbackIpWithNoCidr, asn=str(device.asn))
+        return [('routingOptionsBgp.txt', {'routerId': loopbackIpWithNoCidr, 'asn': str(device.asn)})]
 
-    def _createProtocolBgp(self, session, device):
-        template = self._templateEnv.get_template('protocolBgp.txt')
+    def _createProtocolBgp(self, session, device, fabricIndex = None):
+        return renderConfiglets(self._getProtocolBgpConfiglets(session, device, fabricIndex))
 
+    def _getProtocolBgpConfiglets(self, session, device, fabricIndex = None):
         neighborList = []
-        deviceInterconnectIfds = self._dao.getConnectedInterconnectIFDsFilterFakeOnes(session, device)
-        for ifd in deviceInterconnectIfds:
-            peerIfd = ifd.peer
-            peerDevice = peerIfd.device
-            peerInterconnectIfl = peerIfd.layerAboves[0]
+        for ifd, ifl, peerIfd, peerInterconnectIfl, peerDevice in self._getInterconnectPeers(session, device, fabricIndex):
             peerInterconnectIpNoCidr = peerInterconnectIfl.ipaddress.split('/')[0]
             neighborList.append({'peer_ip': peerInterconnectIpNoCidr, 'peer_asn': peerDevice.asn})
 
-        return template.render(neighbors=neighborList)        
+        return [('protocolBgp.txt', {'neighbors': neighborList})]
          
     def _createProtocolLldp(self, device):
-        template = self._templateEnv.get_template('protocolLldp.txt')
-        return template.render()        
+        return renderConfiglets(self._getProtocolLldpConfiglets(device))
+
+    def _getProtocolLldpConfiglets(self, device):
+        return [('protocolLldp.txt', {})]
+
+    def _createPolicyOption(self, session, device, fabricIndex = None):
+        return renderConfiglets(self._getPolicyOptionConfiglets(session, device, fabricIndex))
 
-    def _createPolicyOption(self, session, device):
+    def _getPolicyOptionConfiglets(self, session, device, fabricIndex = None):
         pod = device.pod
         
-        template = self._templateEnv.get_template('policyOptions.txt')
         subnetDict = {}
         subnetDict['lo0_in'] = pod.allocatedLoopbackBlock
         subnetDict['irb_in'] = pod.allocatedIrbBlock
         
         if device.role == 'leaf':
-            deviceLoopbackIfl = session.query(InterfaceLogical).join(Device).filter(Device.id == device.id).filter(InterfaceLogical.name == 'lo0.0').one()
-            deviceIrbIfl = session.query(InterfaceLogical).join(Device).filter(Device.id == device.id).filter(InterfaceLogical.name == 'irb.1').one()
+            deviceLoopbackIfl = self._getDeviceIfl(session, device, 'lo0.0', fabricIndex)
+            deviceIrbIfl = self._getDeviceIfl(session, device, 'irb.1', fabricIndex)
             subnetDict['lo0_out'] = deviceLoopbackIfl.ipaddress
             subnetDict['irb_out'] = deviceIrbIfl.ipaddress
         else:
             subnetDict['lo0_out'] = pod.allocatedLoopbackBlock
             subnetDict['irb_out'] = pod.allocatedIrbBlock
          
-        return template.render(subnet=subnetDict)
+        return [('policyOptions.txt', {'subnet': subnetDict})]
         
     def _createVlan(self, device):
+        return renderConfiglets(self._getVlanConfiglets(device))
+
+    def _getVlanConfiglets(self, device):
         if device.role == 'leaf':
-            template = self._templateEnv.get_template('vlans.txt')
-            return template.render()
+            return [('vlans.txt', {})]
         else:
-            return ''
+            return []
 
     def _getOpenclosTrapGroupSettings(self, session):
         '''
@@ -912,29 +1519,24 @@ class L3ClosMediation():
         return []
     
     def _createSnmpTrapAndEvent(self, session, device):
-        snmpTemplate = self._templateEnv.get_template('snmpTrap.txt')
-        trapEventTemplate = self._templateEnv.get_template('eventOptionForTrap.txt')
-        
-        configlet = trapEventTemplate.render()
-        
+        return renderConfiglets(self._getSnmpTrapAndEventConfiglets(session, device))
+
+    def _getSnmpTrapAndEventConfiglets(self, session, device):
         if device.role == 'leaf':
             trapGroups = self._getLeafTrapGroupSettings(session)
-            if trapGroups:
-                configlet += snmpTemplate.render(trapGroups = trapGroups)
-                return configlet
-
         elif device.role == 'spine':
             trapGroups = self._getSpineTrapGroupSettings(session)
-            if trapGroups:
-                configlet += snmpTemplate.render(trapGroups = trapGroups)
-                return configlet
+        else:
+            trapGroups = []
 
-        return ''
+        if trapGroups:
+            return [('eventOptionForTrap.txt', {}), ('snmpTrap.txt', {'trapGroups': trapGroups})]
+        return []
 
     def _createSnmpTrapAndEventForLeafFor2ndStage(self, session, device):
-        snmpTemplate = self._templateEnv.get_template('snmpTrap.txt')
-        trapEventTemplate = self._templateEnv.get_template('eventOptionForTrap.txt')
-        disableSnmpTemplate = self._templateEnv.get_template('snmpTrapDisable.txt')
+        snmpTemplate = self._templateRegistry.getTemplate(junosTemplates, 'snmpTrap.txt')
+        trapEventTemplate = self._templateRegistry.getTemplate(junosTemplates, 'eventOptionForTrap.txt')
+        disableSnmpTemplate = self._templateRegistry.getTemplate(junosTemplates, 'snmpTrapDisable.txt')
         
         configlet = trapEventTemplate.render()
         
@@ -957,7 +1559,7 @@ class L3ClosMediation():
         :param Pod: pod
         :returns list: list of PodConfigs
         '''
-        leafTemplate = self._templateEnv.get_template('leafGenericTemplate.txt')
+        leafTemplate = self._templateRegistry.getTemplate(junosTemplates, 'leafGenericTemplate.txt')
         leafSettings = {}
         for leafSetting in pod.leafSettings:
             leafSettings[leafSetting.deviceFamily] = leafSetting
@@ -983,13 +1585,14 @@ class L3ClosMediation():
         configWriter = ConfigWriter(self._conf, device.pod, self._dao)
         
         with self._dao.getReadWriteSession() as session:
+            fabricIndex = FabricIndex(session, device.pod, [device.id])
             config = self._createBaseConfig(device)
-            config += self._createInterfaces(session, device)
+            config += self._createInterfaces(session, device, fabricIndex)
             config += self._createRoutingOptionsStatic(session, device)
-            config += self._createRoutingOptionsBgp(session, device)
-            config += self._createProtocolBgp(session, device)
+            config += self._createRoutingOptionsBgp(session, device, fabricIndex)
+            config += self._createProtocolBgp(session, device, fabricIndex)
             config += self._createProtocolLldp(device)
-            config += self._createPolicyOption(session, device)
+            config += self._createPolicyOption(session, device, fabricIndex)
             config += self._createSnmpTrapAndEventForLeafFor2ndStage(session, device)
             config += self._createVlan(device)
             device.config = DeviceConfig(device.id, config)
@@ -16,7 +16,7 @@ else:
     from sqlalchemy.dialects.mysql import MEDIUMBLOB as BLOB
 
 
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm import relationship, backref, deferred, validates
 from netaddr import IPAddress, IPNetwork, AddrFormatError
 from crypt import Cryptic
 import util
@@ -70,8 +70,12 @@ class Pod(ManagedElement, Base):
     allocatedLoopbackBlock = Column(String(32))
     allocatedSpineAS = Column(BigInteger)
     allocatefLeafAS = Column(BigInteger)
-    inventoryData = Column(String(2048))
+    # large columns are deferred, loaded on first access of the attribute
+    inventoryData = deferred(Column(String(2048)))
     encryptedPassword = Column(String(100)) # 2-way encrypted
+    # management ip range of the devices as integers, see updateManagementIpRange
+    managementIpStart = Column(BigInteger, index=True)
+    managementIpEnd = Column(BigInteger)
     cryptic = Cryptic()
     cablingPlan = relationship("CablingPlan", uselist=False, cascade='all, delete, delete-orphan')
 
@@ -165,6 +169,17 @@ class Pod(ManagedElement, Base):
 
         return count
         
+    def updateManagementIpRange(self, deviceCount):
+        '''
+        Must be called when management ip settings or device count change,
+        the range is used to find pod by device management ip
+        '''
+        ipRange = util.getMgmtIpRange(self.managementPrefix, self.managementStartingIP, self.managementMask, deviceCount)
+        if ipRange is not None:
+            self.managementIpStart, self.managementIpEnd = ipRange
+        else:
+            self.managementIpStart, self.managementIpEnd = None, None
+        
     def getCleartextPassword(self):
         '''
         Return decrypted password
@@ -260,25 +275,39 @@ class LeafSetting(ManagedElement, Base):
     deviceFamily = Column(String(100), primary_key=True)
     pod_id = Column(String(60), ForeignKey('pod.id'), nullable = False, primary_key=True)
     junosImage = Column(String(126))
-    config = Column(BLOB)
+    config = deferred(Column(BLOB))
+    # ETag of config, kept in sync by _setConfig
+    configEtag = Column(String(42))
 
     def __init__(self, deviceFamily, podId, junosImage = None, config = None):
         self.deviceFamily = deviceFamily
         self.pod_id = podId
         self.junosImage = junosImage
         self.config = config
+
+    @validates('config')
+    def _setConfig(self, key, config):
+        self.configEtag = util.getContentEtag(config)
+        return config
     
 class CablingPlan(ManagedElement, Base):
     __tablename__ = 'cablingPlan'
     pod_id = Column(String(60), ForeignKey('pod.id'), nullable = False, primary_key=True)
-    json = Column(BLOB)
-    dot = Column(BLOB)
+    json = deferred(Column(BLOB))
+    dot = deferred(Column(BLOB))
+    # ETag of json, kept in sync by _setJson
+    jsonEtag = Column(String(42))
 
     def __init__(self, podId, json = None, dot = None):
         self.pod_id = podId
         self.json = json
         self.dot = dot
 
+    @validates('json')
+    def _setJson(self, key, json):
+        self.jsonEtag = util.getContentEtag(json)
+        return json
+
 class Device(ManagedElement, Base):
     __tablename__ = 'device'
     id = Column(String(60), primary_key=True)
@@ -304,6 +333,8 @@ class Device(ManagedElement, Base):
     cryptic = Cryptic()
     __table_args__ = (
         Index('pod_id_name_uindex', 'pod_id', 'name', unique=True),
+        # LLDP neighbors are known by device name only, see Dao.getIfdsByDeviceNamePortNames
+        Index('name_index', 'name'),
     )
     
                 
@@ -361,11 +392,21 @@ class Device(ManagedElement, Base):
 class DeviceConfig(ManagedElement, Base):
     __tablename__ = 'deviceConfig'
     device_id = Column(String(60), ForeignKey('device.id'), nullable = False, primary_key=True)
-    config = Column(BLOB)
+    config = deferred(Column(BLOB))
+    # digest of everything used to render config, to skip unchanged devices
+    fingerprint = Column(String(64))
+    # ETag of config, kept in sync by _setConfig
+    configEtag = Column(String(42))
 
-    def __init__(self, deviceId, config):
+    def __init__(self, deviceId, config, fingerprint = None):
         self.device_id = deviceId
         self.config = config
+        self.fingerprint = fingerprint
+
+    @validates('config')
+    def _setConfig(self, key, config):
+        self.configEtag = util.getContentEtag(config)
+        return config
             
 class Interface(ManagedElement, Base):
     __tablename__ = 'interface'
@@ -385,6 +426,7 @@ class Interface(ManagedElement, Base):
     deployStatus = Column(Enum('deploy', 'provision'), default = 'provision')
     __table_args__ = (
         Index('device_id_sequence_num_uindex', 'device_id', 'sequenceNum', unique=True),
+        Index('device_id_name_index', 'device_id', 'name'),
     )
 
     __mapper_args__ = {
@@ -508,3 +550,32 @@ class BgpLink(ManagedElement, Base):
         self.flap_count = linkDict.get('flapCount')
         self.link_state = linkDict.get('linkState')
         self.act_rx_acc_route_count = linkDict.get('activeReceiveAcceptCount')
+
+class IpAllocation(ManagedElement, Base):
+    '''
+    Unit (address or subnet) allocated from one of pod's ip pools, see Ipam.
+    Units of removed devices are kept with state 'free' and are reused first.
+    '''
+    __tablename__ = 'ipAllocation'
+    id = Column(String(60), primary_key=True)
+    pod_id = Column(String(60), ForeignKey('pod.id'), nullable = False)
+    pool = Column(Enum('loopback', 'irb', 'interconnect'), nullable = False)
+    offset = Column(BigInteger, nullable = False) # unit index from start of pool prefix
+    ipaddress = Column(String(40)) # first ip of the unit with unit's prefix length
+    device_id = Column(String(60)) # None when free
+    peerDevice_id = Column(String(60)) # other end of interconnect subnet
+    state = Column(Enum('allocated', 'free'), default = 'allocated')
+    __table_args__ = (
+        Index('pod_id_pool_offset_uindex', 'pod_id', 'pool', 'offset', unique=True),
+        Index('pod_id_pool_state_index', 'pod_id', 'pool', 'state'),
+    )
+
+    def __init__(self, podId, pool, offset, ipaddress, deviceId, peerDeviceId = None):
+        self.id = str(uuid.uuid4())
+        self.pod_id = podId
+        self.pool = pool
+        self.offset = offset
+        self.ipaddress = ipaddress
+        self.device_id = deviceId
+        self.peerDevice_id = peerDeviceId
+        self.state = 'allocated'
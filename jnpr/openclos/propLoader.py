@@ -7,6 +7,7 @@ Created on Apr 16, 2015
 import os
 import yaml
 import re
+import threading
 import logging.config
 
 from crypt import Cryptic
@@ -44,34 +45,112 @@ class PropertyLoader:
             logger.error("YAML error: %s" % (e))
 
     
+class FrozenDict(dict):
+    '''
+    Read-only dict, every modification raises TypeError
+    '''
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError('%s is read-only' % (self.__class__.__name__))
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readOnly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+def freeze(value):
+    '''
+    :returns: read-only copy of value, dict -> FrozenDict, list -> tuple, recursively
+    '''
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.iteritems())
+    elif isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
 class OpenClosProperty(PropertyLoader):
+    '''
+    openclos.yaml is parsed (dbUrl built, db password decrypted) once per process,
+    all instances share the same read-only properties. getProperties() reparses the
+    file only when its modification time changes, getStats() counts the reloads.
+    '''
+    # file name with path -> (modification time, properties)
+    _propertyCache = {}
+    _propertyCacheLock = threading.Lock()
+    _stats = {'loads': 0, 'reloads': 0, 'hits': 0}
+
     def __init__(self, fileName = 'openclos.yaml', appName = None):
-        fileNameWithPath = os.path.join(propertyFileLocation, fileName)
-        self._properties = self.loadProperty(fileNameWithPath)
+        self._fileNameWithPath = os.path.join(propertyFileLocation, fileName)
+        self._properties = self.getProperties()
+
+    def getProperties(self):
+        '''
+        :returns FrozenDict: read-only properties, None if file could not be loaded
+        '''
+        try:
+            modificationTime = os.path.getmtime(self._fileNameWithPath)
+        except OSError as e:
+            logger.error("File error: %s" % (e))
+            return None
+
+        with OpenClosProperty._propertyCacheLock:
+            cached = OpenClosProperty._propertyCache.get(self._fileNameWithPath)
+            if cached is not None and cached[0] == modificationTime:
+                OpenClosProperty._stats['hits'] += 1
+                return cached[1]
+            
+            if cached is None:
+                OpenClosProperty._stats['loads'] += 1
+            else:
+                OpenClosProperty._stats['reloads'] += 1
+                logger.info('Reloading changed properties: %s' % (self._fileNameWithPath))
+            properties = freeze(self._loadProperties(self._fileNameWithPath))
+            OpenClosProperty._propertyCache[self._fileNameWithPath] = (modificationTime, properties)
+            return properties
+
+    def _loadProperties(self, fileNameWithPath):
+        properties = self.loadProperty(fileNameWithPath)
         
-        if self._properties is not None:
-            if 'dbUrl' in self._properties:
-                if 'dbDialect' in self._properties:
+        if properties is not None:
+            if 'dbUrl' in properties:
+                if 'dbDialect' in properties:
                     print "Warning: dbUrl and dbDialect both exist. dbDialect ignored"
                 # dbUrl is used by sqlite only
-                self._properties['dbUrl'] = self.fixSqlliteDbUrlForRelativePath(self._properties['dbUrl'])
-            elif 'dbDialect' in self._properties:
-                dbPass = Cryptic ().decrypt ( self._properties['dbPassword'] )
-                self._properties['dbUrl'] = self._properties['dbDialect'] + '://' + self._properties['dbUser'] + ':' + dbPass + '@' + self._properties['dbHost'] + '/' + self._properties['dbName'] 
-            if 'outputDir' in self._properties:
-                self._properties['outputDir'] = self.fixOutputDirForRelativePath(self._properties['outputDir'])
+                properties['dbUrl'] = self.fixSqlliteDbUrlForRelativePath(properties['dbUrl'])
+            elif 'dbDialect' in properties:
+                dbPass = Cryptic ().decrypt ( properties['dbPassword'] )
+                properties['dbUrl'] = properties['dbDialect'] + '://' + properties['dbUser'] + ':' + dbPass + '@' + properties['dbHost'] + '/' + properties['dbName'] 
+            if 'outputDir' in properties:
+                properties['outputDir'] = self.fixOutputDirForRelativePath(properties['outputDir'])
+        return properties
 
-    def getProperties(self):
-        return self._properties
+    @classmethod
+    def getStats(cls):
+        '''
+        :returns dict: 'loads': files parsed first time, 'reloads': files parsed again on change, 
+        'hits': properties served without parsing
+        '''
+        with cls._propertyCacheLock:
+            return dict(cls._stats)
+
+    @classmethod
+    def clearCache(cls):
+        with cls._propertyCacheLock:
+            cls._propertyCache.clear()
                     
     def getDbUrl(self):
-        if self._properties.get('dbUrl') is None or self._properties.get('dbUrl')  == '':
+        properties = self.getProperties()
+        if properties.get('dbUrl') is None or properties.get('dbUrl')  == '':
             raise InvalidConfiguration('DB Url is empty')
         
-        return self._properties['dbUrl'] 
+        return properties['dbUrl'] 
 
     def isSqliteUsed(self):
-        return 'sqlite' in self._properties.get('dbUrl')
+        return 'sqlite' in self.getProperties().get('dbUrl')
 
     def fixSqlliteDbUrlForRelativePath(self, dbUrl):
         # sqlite:////absolute-path/sqllite3.db
@@ -97,61 +176,103 @@ class OpenClosProperty(PropertyLoader):
 
 
 portNameRegx = re.compile(r"([a-z]+-\d\/\d\/\[)(\d{1,3})-(\d{1,3})(\])")
+# port names are tuples, xxxPortSet are frozenset views for membership test
+noPortNames = FrozenDict({'uplinkPorts': (), 'downlinkPorts': (), 'uplinkPortSet': frozenset(), 'downlinkPortSet': frozenset()})
 class DeviceSku(PropertyLoader):
+    '''
+    Port names of device families. deviceFamily.yaml is parsed and port regular
+    expressions are expanded once per process, all instances share the immutable
+    read-only port name tables, getPortNamesForDeviceFamily() picks up new tables
+    when the file modification time changes.
+    '''
+    # file name with path -> (modification time, (skuDetail, threeStageSkuDetail, fiveStageSkuDetail))
+    _skuCache = {}
+    _skuCacheLock = threading.Lock()
+    
     def __init__(self, fileName = 'deviceFamily.yaml'):
-        self.skuDetail = {}
-        self.threeStageSkuDetail = {}
-        self.fiveStageSkuDetail = {}
-        
-        fileNameWithPath = self.getFileNameWithPath(fileName)
-        skuDetail = self.loadProperty(fileNameWithPath)
-        
-        if skuDetail is not None and skuDetail.get('deviceFamily') is not None:
-            self.skuDetail = skuDetail.get('deviceFamily')
-            self.populateDeviceFamily(self.skuDetail)
+        self._fileNameWithPath = self.getFileNameWithPath(fileName)
+        self._skuTables = self._getSkuDetail(self._fileNameWithPath)
+        skuDetail, threeStageSkuDetail, fiveStageSkuDetail = self._skuTables
+        # top level is per instance, callers may add device families
+        self.skuDetail = dict(skuDetail)
+        self.threeStageSkuDetail = dict(threeStageSkuDetail)
+        self.fiveStageSkuDetail = dict(fiveStageSkuDetail)
+
+    def _refreshSkuDetail(self):
+        '''
+        Replaces device families of the file with reloaded ones if the file changed,
+        device families added by callers are kept
+        '''
+        if not self._fileNameWithPath:
+            return
+        tables = self._getSkuDetail(self._fileNameWithPath)
+        if tables is not self._skuTables:
+            self._skuTables = tables
+            for instanceTable, table in zip([self.skuDetail, self.threeStageSkuDetail, self.fiveStageSkuDetail], tables):
+                instanceTable.update(table)
+
+    def _getSkuDetail(self, fileNameWithPath):
+        if not fileNameWithPath:
+            return ({}, {}, {})
+        try:
+            modificationTime = os.path.getmtime(fileNameWithPath)
+        except OSError as e:
+            logger.error("File error: %s" % (e))
+            return ({}, {}, {})
+
+        with DeviceSku._skuCacheLock:
+            cached = DeviceSku._skuCache.get(fileNameWithPath)
+            if cached is not None and cached[0] == modificationTime:
+                return cached[1]
             
-        if skuDetail is not None and skuDetail.get('3Stage') is not None:
-            self.threeStageSkuDetail = skuDetail.get('3Stage')
-            self.populate3StageOverride(self.threeStageSkuDetail)
+            logger.info('Loading device families: %s' % (fileNameWithPath))
+            skuDetail = self.loadProperty(fileNameWithPath)
+            tables = []
+            for section in ['deviceFamily', '3Stage', '5Stage']:
+                if skuDetail is not None and skuDetail.get(section) is not None:
+                    tables.append(skuDetail.get(section))
+                    self.populateDeviceFamily(tables[-1])
+                else:
+                    tables.append({})
+            tables = tuple(freeze(table) for table in tables)
+            DeviceSku._skuCache[fileNameWithPath] = (modificationTime, tables)
+            return tables
 
-        if skuDetail is not None and skuDetail.get('5Stage') is not None:
-            self.fiveStageSkuDetail = skuDetail.get('5Stage')
-            self.populate5StageOverride(self.fiveStageSkuDetail)
+    @classmethod
+    def clearCache(cls):
+        with cls._skuCacheLock:
+            cls._skuCache.clear()
 
     def populateDeviceFamily(self, skuDetail):
         for deviceFamily, value in skuDetail.iteritems():
             logger.debug(deviceFamily)
             for role, ports in value.iteritems():
-                uplink = ports.get('uplinkPorts')
-                if isinstance(uplink, list):
-                    ports['uplinkPorts'] = self.portRegexListToList(uplink)
-                else:
-                    ports['uplinkPorts'] = self.portRegexToList(uplink)
-
-                downlink = ports.get('downlinkPorts')
-                if isinstance(downlink, list):
-                    ports['downlinkPorts'] = self.portRegexListToList(downlink)
-                else:
-                    ports['downlinkPorts'] = self.portRegexToList(downlink)
+                for portType, portSetType in [('uplinkPorts', 'uplinkPortSet'), ('downlinkPorts', 'downlinkPortSet')]:
+                    portRegex = ports.get(portType)
+                    if isinstance(portRegex, list):
+                        portNames = self.portRegexListToList(portRegex)
+                    else:
+                        portNames = self.portRegexToList(portRegex)
+                    ports[portType] = tuple(portNames)
+                    ports[portSetType] = frozenset(portNames)
 
                 #logger.debug("\t%s" % (role))
                 #logger.debug("\t\t%s" % (ports.get('uplinkPorts')))
                 #logger.debug("\t\t%s" % (ports.get('downlinkPorts')))
         
-    def populate3StageOverride(self, threeStage):
-        self.populateDeviceFamily(threeStage)
-    
-    def populate5StageOverride(self, fiveStage):
-        self.populateDeviceFamily(fiveStage)
-
     def getPortNamesForDeviceFamily(self, deviceFamily, role, topology = '3Stage'):
+        '''
+        :returns FrozenDict: 'uplinkPorts'/'downlinkPorts' tuples of port names, 'uplinkPortSet'/'downlinkPortSet' 
+        same as frozenset. Shared by all instances, read-only.
+        '''
+        self._refreshSkuDetail()
         if self.skuDetail is None:
             logger.error('deviceFamily.yaml was not loaded properly')
-            return {'uplinkPorts': [], 'downlinkPorts': []}
+            return noPortNames
         
         if deviceFamily is None or role is None:
             logger.error("No ports found, deviceFamily: %s, role: %s, topology: %s" % (deviceFamily, role, topology))
-            return {'uplinkPorts': [], 'downlinkPorts': []}
+            return noPortNames
         
         try:
             try:
@@ -162,7 +283,7 @@ class DeviceSku(PropertyLoader):
             return self.skuDetail[deviceFamily][role]
         except KeyError as ke:
             logger.error("No ports found, deviceFamily: %s, role: %s, topology: %s. KeyError: %s" % (deviceFamily, role, topology, ke))
-        return {'uplinkPorts': [], 'downlinkPorts': []}
+        return noPortNames
 
     def getSupportedDeviceFamily(self):
         '''
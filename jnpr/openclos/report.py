@@ -5,19 +5,18 @@ Created on Sep 5, 2014
 '''
 import logging
 from sqlalchemy.orm import exc
-import concurrent.futures
 
 from dao import Dao
 from model import Pod, Device
-from devicePlugin import L2DataCollector, L3DataCollector
-from writer import L2ReportWriter, L3ReportWriter
+from devicePlugin import L2DataCollector, L3DataCollector, HealthDataCollector
+from collectorEngine import CollectorEngine
+from writer import L2ReportWriter, L3ReportWriter, HealthReportWriter
 from propLoader import OpenClosProperty, loadLoggingConfig
 from exception import PodNotFound
 
 moduleName = 'report'
 loadLoggingConfig(appName = moduleName)
 logger = logging.getLogger(moduleName)
-maxThreads = 10
 
 class Report(object):
     def __init__(self, conf = {}, daoClass = Dao):
@@ -28,18 +27,45 @@ class Report(object):
 
         self._dao = daoClass.getInstance()
 
-    def getPod(self, session, podId):
+    def getPod(self, session, podId, loadProfile = None):
         try:
-            return self._dao.getObjectById(session, Pod, podId)
+            return self._dao.getObjectById(session, Pod, podId, loadProfile)
         except (exc.NoResultFound) as e:
             logger.debug("No IpFabric found with Id: '%s', exc.NoResultFound: %s" % (podId, e.message)) 
+
+    def resetSpineStatus(self, devices, statusNames):
+        '''
+        Sets status of spines to unknown, spine status is derived from leaf data
+        :param list statusNames: 'l2Status', 'l3Status', 'configStatus', reason is cleared too
+        '''
+        with self._dao.getReadWriteSession() as session:
+            devicesToBeUpdated = set()
+            for device in devices:
+                if device.role == 'spine':
+                    for statusName in statusNames:
+                        setattr(device, statusName, 'unknown')
+                        setattr(device, statusName + 'Reason', None)
+                    devicesToBeUpdated.add(device)
+                
+            if len(devicesToBeUpdated) > 0:
+                self._dao.updateObjects(session, devicesToBeUpdated)
+
+    def getDeviceAsn2NameMap(self, podId, session):
+        map = {}
+        logger.debug("Building device AS -> device name map...")
+        devices = session.query(Device).filter(Device.pod_id == podId).all()
+        for device in devices:
+            if device.asn is not None:
+                logger.debug("[%d]->[%s]" %(device.asn, device.name))
+                map[device.asn] = device
+        return map
             
 class ResourceAllocationReport(Report):
     def __init__(self, conf = {}, daoClass = Dao):
         super(ResourceAllocationReport, self).__init__(conf, daoClass)
         
     def getPods(self, session):
-        podObject = self._dao.getAll(session, Pod)
+        podObject = self._dao.getAll(session, Pod, 'podSummary')
         pods = []
         
         for i in range(len(podObject)):
@@ -61,25 +87,11 @@ class ResourceAllocationReport(Report):
 class L2Report(Report):
     def __init__(self, conf = {},  daoClass = Dao):
         super(L2Report, self).__init__(conf, daoClass)
-        
-        if self._conf.get('report') and self._conf['report'].get('threadCount'):
-            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = self._conf['report']['threadCount'])
-        else:
-            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = maxThreads)
+        # shared by all reports, bounds number of device sessions in flight
+        self.collectorEngine = CollectorEngine.getInstance()
         
     def resetSpineL2Status(self, devices):
-        with self._dao.getReadWriteSession() as session:
-            devicesToBeUpdated = set()
-            for device in devices:
-                if device.role == 'spine':
-                    device.l2Status = 'unknown'
-                    device.l2StatusReason = None
-                    device.configStatus = 'unknown'
-                    device.configStatusReason = None
-                    devicesToBeUpdated.add(device)
-                
-            if len(devicesToBeUpdated) > 0:
-                self._dao.updateObjects(session, devicesToBeUpdated)
+        self.resetSpineStatus(devices, ['l2Status', 'configStatus'])
             
     def generateReport(self, podId, cachedData = True, writeToFile = False):
         with self._dao.getReadSession() as session:
@@ -94,13 +106,16 @@ class L2Report(Report):
                 # reset all spines l2 status
                 self.resetSpineL2Status(pod.devices)
                 
-                futureList = []
+                tasks = []
                 for device in pod.devices:
                     if device.role == 'leaf':
                         l2DataCollector = L2DataCollector(device.id, self._conf, self._dao) 
-                        futureList.append(self.executor.submit(l2DataCollector.startL2Report))
+                        l2DataCollector.rpcTimeout = self.collectorEngine.deviceTimeout
+                        tasks.append((device.name, l2DataCollector.startL2Report))
                 logger.info('Submitted processing all devices')
-                concurrent.futures.wait(futureList)
+                self.collectorEngine.runAll(tasks)
+                # collectors write status through the status sink, write what is still pending
+                self._dao.getStatusSink().flush()
                 # At this point multiple threads, ie multiple db sessions
                 # have updated device, so we need to refresh pod data. 
                 # Rather than refresh, better option is expire, which
@@ -118,34 +133,12 @@ class L2Report(Report):
 class L3Report(Report):
     def __init__(self, conf = {},  daoClass = Dao):
         super(L3Report, self).__init__(conf, daoClass)
-        
-        if self._conf.get('report') and self._conf['report'].get('threadCount'):
-            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = self._conf['report']['threadCount'])
-        else:
-            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = maxThreads)
+        # shared by all reports, bounds number of device sessions in flight
+        self.collectorEngine = CollectorEngine.getInstance()
         
     def resetSpineL3Status(self, devices):
-        with self._dao.getReadWriteSession() as session:
-            devicesToBeUpdated = set()
-            for device in devices:
-                if device.role == 'spine':
-                    device.l3Status = 'unknown'
-                    device.l3StatusReason = None
-                    devicesToBeUpdated.add(device)
-                
-            if len(devicesToBeUpdated) > 0:
-                self._dao.updateObjects(session, devicesToBeUpdated)
+        self.resetSpineStatus(devices, ['l3Status'])
             
-    def getDeviceAsn2NameMap(self, podId, session):
-        map = {}
-        logger.debug("Building device AS -> device name map...")
-        devices = session.query(Device).filter(Device.pod_id == podId).all()
-        for device in devices:
-            if device.asn is not None:
-                logger.debug("[%d]->[%s]" %(device.asn, device.name))
-                map[device.asn] = device
-        return map
-        
     def generateReport(self, podId, cachedData = True, writeToFile = False):
         with self._dao.getReadSession() as session:
             pod = self.getPod(session, podId)
@@ -162,13 +155,16 @@ class L3Report(Report):
                 # reset all spines l3 status
                 self.resetSpineL3Status(pod.devices)
                
-                futureList = []
+                tasks = []
                 for device in pod.devices:
                     if device.role == 'leaf':
                         l3DataCollector = L3DataCollector(device.id, self._conf, self._dao, deviceAsn2NameMap) 
-                        futureList.append(self.executor.submit(l3DataCollector.startL3Report))
+                        l3DataCollector.rpcTimeout = self.collectorEngine.deviceTimeout
+                        tasks.append((device.name, l3DataCollector.startL3Report))
                 logger.info('Submitted processing all devices')
-                concurrent.futures.wait(futureList)
+                self.collectorEngine.runAll(tasks)
+                # collectors write status through the status sink, write what is still pending
+                self._dao.getStatusSink().flush()
                 # At this point multiple threads, ie multiple db sessions
                 # have updated device, so we need to refresh pod data. 
                 # Rather than refresh, better option is expire, which
@@ -183,6 +179,53 @@ class L3Report(Report):
             else:
                 return l3ReportWriter.getThreeStageL3ReportJson()
 
+class HealthReport(Report):
+    '''
+    L2 and L3 report in one pass, each leaf is connected once for both LLDP and
+    BGP data and both statuses are stored in one transaction
+    '''
+    def __init__(self, conf = {},  daoClass = Dao):
+        super(HealthReport, self).__init__(conf, daoClass)
+        # shared by all reports, bounds number of device sessions in flight
+        self.collectorEngine = CollectorEngine.getInstance()
+        
+    def generateReport(self, podId, cachedData = True, writeToFile = False):
+        with self._dao.getReadSession() as session:
+            pod = self.getPod(session, podId)
+            if pod is None: 
+                logger.error('No pod found for podId: %s' % (podId))
+                raise PodNotFound('No pod found for podId: %s' % (podId)) 
+            
+            if cachedData == False:
+                logger.info('Generating HealthReport from real data')
+                
+                deviceAsn2NameMap = self.getDeviceAsn2NameMap(podId, session)
+                
+                # reset all spines l2 and l3 status
+                self.resetSpineStatus(pod.devices, ['l2Status', 'configStatus', 'l3Status'])
+               
+                tasks = []
+                for device in pod.devices:
+                    if device.role == 'leaf':
+                        healthDataCollector = HealthDataCollector(device.id, self._conf, self._dao, deviceAsn2NameMap) 
+                        healthDataCollector.rpcTimeout = self.collectorEngine.deviceTimeout
+                        tasks.append((device.name, healthDataCollector.startHealthReport))
+                logger.info('Submitted processing all devices')
+                self.collectorEngine.runAll(tasks)
+                # collectors write status through the status sink, write what is still pending
+                self._dao.getStatusSink().flush()
+                # At this point multiple threads, ie multiple db sessions
+                # have updated device, so we need to refresh pod data. 
+                session.expire(pod)
+                logger.info('Done processing all devices')
+            else:
+                logger.info('Generating HealthReport from cached data')
+            healthReportWriter = HealthReportWriter(self._conf, pod, self._dao)
+            if writeToFile:
+                return healthReportWriter.writeThreeStageHealthReportJson()
+            else:
+                return healthReportWriter.getThreeStageHealthReportJson()
+
 if __name__ == '__main__':
     report = ResourceAllocationReport()
     with report._dao.getReadSession() as session:
@@ -7,26 +7,38 @@ Created on Sep 2, 2014
 import os
 import bottle
 from sqlalchemy.orm import exc
-import StringIO
 import zipfile
 import traceback
 import json
+import urllib
+import threading
+import Queue
+from wsgiref.simple_server import WSGIServer
 import util
 import logging
 
 from bottle import error, request, response, PluginError
-from exception import InvalidRequest, PodNotFound, CablingPlanNotFound, DeviceConfigurationNotFound, DeviceNotFound, ImageNotFound, CreatePodFailed, UpdatePodFailed
-from model import Pod, Device
-from dao import Dao
-from report import ResourceAllocationReport, L2Report, L3Report
-from l3Clos import L3ClosMediation
+from exception import InvalidConfiguration, InvalidRequest, PodNotFound, CablingPlanNotFound, DeviceConfigurationNotFound, DeviceNotFound, ImageNotFound, CreatePodFailed, UpdatePodFailed
+from model import Pod, Device, DeviceConfig, LeafSetting
+from dao import Dao, deviceSummaryColumns
+from writer import etagFileSuffix
+from report import ResourceAllocationReport, L2Report, L3Report, HealthReport
+from l3Clos import L3ClosMediation, getRenderingPool
 from ztp import ZtpServer
+from templateRegistry import TemplateRegistry
 from propLoader import OpenClosProperty, DeviceSku, loadLoggingConfig
 
 moduleName = 'rest'
 loadLoggingConfig(appName = moduleName)
 logger = logging.getLogger(moduleName)
 
+# query parameters of GET /openclos/pods/<podId>/devices, comma separated values
+deviceListFilters = ['role', 'family', 'deployStatus', 'configStatus', 'l2Status', 'l3Status']
+deviceListFields = [column for column in deviceSummaryColumns if column != 'pod_id'] + ['uri']
+
+# server: None picks wsgiref for sqlite, paste otherwise, see RestServer.getServerOptions
+defaultRestServerSettings = {'server': None, 'threadCount': 10, 'workerCount': 4}
+
 webServerRoot = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'out')
 junosImageRoot = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conf', 'ztp')
 
@@ -88,6 +100,34 @@ class OpenclosDbSessionPlugin(object):
         # Replace the route callback with the wrapped one.
         return wrapper
     
+class ThreadPoolWSGIServer(WSGIServer):
+    '''
+    wsgiref server handling requests in threadCount threads, accepted
+    requests wait in a queue while all threads are busy
+    '''
+    threadCount = 10
+
+    def __init__(self, *args, **kwargs):
+        WSGIServer.__init__(self, *args, **kwargs)
+        self._requests = Queue.Queue()
+        for i in xrange(self.threadCount):
+            thread = threading.Thread(target = self._processRequests, name = 'restServer-%d' % (i))
+            thread.daemon = True
+            thread.start()
+
+    def process_request(self, request, clientAddress):
+        self._requests.put((request, clientAddress))
+
+    def _processRequests(self):
+        while True:
+            request, clientAddress = self._requests.get()
+            try:
+                self.finish_request(request, clientAddress)
+            except Exception:
+                self.handle_error(request, clientAddress)
+            finally:
+                self.shutdown_request(request)
+
 class ResourceLink():
     def __init__(self, baseUrl, path):
         self.baseUrl = baseUrl
@@ -95,6 +135,32 @@ class ResourceLink():
     def toDict(self):
         return {'href': self.baseUrl + self.path}
 
+zipConfigBatchSize = 100
+
+class ZipStream(object):
+    '''
+    Write only, non seekable file object for zipfile.ZipFile, written bytes are 
+    kept until drain() so that archive can be sent while it is being created
+    '''
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._position += len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = ''.join(self._chunks)
+        self._chunks = []
+        return data
+
 class RestServer():
     def __init__(self, conf = {}, daoClass = Dao):
         if any(conf) == False:
@@ -128,6 +194,8 @@ class RestServer():
         # Create a single instance of l3Report as it holds thread-pool
         # for device connection. Don't create l3Report multiple times 
         self.l3Report = L3Report(self._conf, daoClass)
+        # combined l2 and l3 report, connects to each leaf once
+        self.healthReport = HealthReport(self._conf, daoClass)
         self.deviceSku = DeviceSku()
         
     def initRest(self):
@@ -148,14 +216,62 @@ class RestServer():
 
     def start(self):
         logger.info('REST server starting at %s:%d' % (self.host, self.port))
+        # compile config/cabling plan templates before first request
+        TemplateRegistry.getInstance().warmUp()
         debugRest = False
         if logger.isEnabledFor(logging.DEBUG):
             debugRest = True
 
-        if self._openclosProperty.isSqliteUsed():
-            bottle.run(self.app, host=self.host, port=self.port, debug=debugRest)
+        server, options = self.getServerOptions()
+        logger.info('REST server backend: %s, options: %s' % (server, options))
+        if server == 'gunicorn':
+            # workers are forked from this process
+            self.__dao.dispose()
+        else:
+            # process pool workers are forked before request threads start
+            getRenderingPool(self._conf)
+        bottle.run(self.app, host=self.host, port=self.port, debug=debugRest, server=server, **options)
+
+    def getServerOptions(self):
+        '''
+        Backend of restServer:server in openclos.yaml
+        wsgiref: single thread
+        threadPool: wsgiref with threadCount request threads
+        paste, waitress: threadCount request threads
+        gunicorn: workerCount pre-forked processes, threadCount request threads each
+        :returns tuple: (bottle server name, server options)
+        '''
+        settings = dict(defaultRestServerSettings)
+        settings.update(self._conf.get('restServer') or {})
+        server = settings['server']
+        threadCount = settings['threadCount']
+        if server is None:
+            server = 'wsgiref' if OpenClosProperty().isSqliteUsed() else 'paste'
+
+        if server == 'wsgiref':
+            return ('wsgiref', {})
+        elif server == 'threadPool':
+            class ServerClass(ThreadPoolWSGIServer):
+                pass
+            ServerClass.threadCount = threadCount
+            return ('wsgiref', {'server_class': ServerClass})
+        elif server == 'paste':
+            # paste spawns extra threads when less than spawn_if_under are idle, must be below threadCount
+            return ('paste', {'use_threadpool': True, 'threadpool_workers': threadCount, 
+                              'threadpool_options': {'spawn_if_under': threadCount / 2}})
+        elif server == 'waitress':
+            return ('waitress', {'threads': threadCount})
+        elif server == 'gunicorn':
+            if OpenClosProperty().isSqliteUsed():
+                logger.warning('gunicorn workers share sqlite db file, writes are serialized by file lock')
+            daoClass = self.__daoClass
+            conf = self._conf
+            def postFork(server, worker):
+                daoClass.getInstance().afterFork()
+                getRenderingPool(conf)
+            return ('gunicorn', {'workers': settings['workerCount'], 'threads': threadCount, 'post_fork': postFork})
         else:
-            bottle.run(self.app, host=self.host, port=self.port, debug=debugRest, server='paste')
+            raise InvalidConfiguration('Unsupported restServer:server: %s' % (server))
 
 
     @staticmethod
@@ -192,6 +308,7 @@ class RestServer():
         bottle.route('/openclos/pods/<podId>/leaf-generic-configurations/<deviceModel>', 'GET', self.getLeafGenericConfiguration)
         bottle.route('/openclos/pods/<podId>/l2-report', 'GET', self.getL2Report)
         bottle.route('/openclos/pods/<podId>/l3-report', 'GET', self.getL3Report)
+        bottle.route('/openclos/pods/<podId>/health-report', 'GET', self.getHealthReport)
         bottle.route('/openclos/pods/<podId>/devices', 'GET', self.getDevices)
         bottle.route('/openclos/pods/<podId>/devices/<deviceId>', 'GET', self.getDevice)
         bottle.route('/openclos/pods/<podId>/devices/<deviceId>/config', 'GET', self.getDeviceConfig)
@@ -264,10 +381,9 @@ class RestServer():
     def getPod(self, dbSession, podId, requestUrl = None):
         if requestUrl is None:
             requestUrl = str(bottle.request.url).translate(None, ',')
-        pod = self.report.getPod(dbSession, podId)
+        pod = self.report.getPod(dbSession, podId, 'podDetail')
         if pod is not None:
             outputDict = {} 
-            devices = pod.devices
             for field in self.getPodFieldListToCopy():
                 outputDict[field] = pod.__dict__.get(field)
             
@@ -296,12 +412,13 @@ class RestServer():
 
             outputDict['devicePassword'] = pod.getCleartextPassword()
             outputDict['uri'] = requestUrl
-            outputDict['devices'] = {'uri': requestUrl + '/devices', 'total':len(devices)}
+            outputDict['devices'] = {'uri': requestUrl + '/devices', 'total': self.__dao.getDeviceCount(dbSession, pod.id)}
             outputDict['cablingPlan'] = {'uri': requestUrl + '/cabling-plan'}
             outputDict['deviceConfiguration'] = {'uri': requestUrl + '/device-configuration'}
             outputDict['ztpConfiguration'] = {'uri': requestUrl + '/ztp-configuration'}
             outputDict['l2Report'] = {'uri': requestUrl + '/l2-report'}
             outputDict['l3Report'] = {'uri': requestUrl + '/l3-report'}
+            outputDict['healthReport'] = {'uri': requestUrl + '/health-report'}
             
             logger.debug('getPod: %s' % (podId))
      
@@ -324,8 +441,10 @@ class RestServer():
             
             if header == 'application/json':
                 cablingPlan = pod.cablingPlan
-                if cablingPlan is not None and cablingPlan.json is not None:
+                if cablingPlan is not None and (cablingPlan.jsonEtag is not None or cablingPlan.json is not None):
                     logger.debug('CablingPlan found in DB')
+                    if self.isNotModified(cablingPlan.jsonEtag):
+                        return self.notModified()
                     return cablingPlan.json
                 else:
                     raise bottle.HTTPError(404, exception = CablingPlanNotFound(pod.id))
@@ -352,10 +471,12 @@ class RestServer():
         logger.debug('Pod name: %s, id: %s' % (pod.name, podId))
         
         leafSetting = self.__dao.getLeafSetting(dbSession, podId, deviceModel)
-        if leafSetting is None or leafSetting.config is None:
+        if leafSetting is None or (leafSetting.configEtag is None and leafSetting.config is None):
             raise bottle.HTTPError(404, exception = DeviceConfigurationNotFound("Pod exists but no leaf generic config found, probably configuration \
                 was not created. deviceModel: %s, pod name: '%s', id: '%s'" % (deviceModel, pod.name, podId)))
         
+        if self.isNotModified(leafSetting.configEtag):
+            return self.notModified()
         bottle.response.headers['Content-Type'] = 'application/json'
         return leafSetting.config
 
@@ -366,64 +487,97 @@ class RestServer():
         
         logger.debug('Pod name: %s' % (pod.name))
 
-        zippedConfigFiles = self.createZipArchive(pod)
-        if zippedConfigFiles is not None:
-            bottle.response.headers['Content-Type'] = 'application/zip'
-            return zippedConfigFiles
-        else:
-            raise bottle.HTTPError(404, exception = DeviceConfigurationNotFound("Pod exists but no configs for devices.'%s " % (pod.name)))
-
-    def createZipArchive(self, pod):
-
-        buff = StringIO.StringIO()
-        zipArchive = zipfile.ZipFile(buff, mode='w')
-        for device in pod.devices:
-            fileName = device.id + '__' + device.name + '.conf'
-            if device.config is not None:
-                zipArchive.writestr(fileName, device.config.config)
-                
-        if pod.leafSettings is not None:
-            for leafSetting in pod.leafSettings:
-                if leafSetting.config is not None:
-                    zipArchive.writestr(leafSetting.deviceFamily + '.conf', leafSetting.config)
+        bottle.response.headers['Content-Type'] = 'application/zip'
+        return self.createZipArchiveStream(pod.id)
+
+    def createZipArchiveStream(self, podId):
+        '''
+        Generator of zip archive chunks for device configs and leaf generic configs of the pod.
+        Each entry is sent as soon as it is written and configs are loaded zipConfigBatchSize 
+        rows at a time, so memory does not grow with pod size. 
+        It runs after request callback returned (bottle iterates the body), so it uses its own 
+        DB session instead of the request dbSession.
+        '''
+        stream = ZipStream()
+        zipArchive = zipfile.ZipFile(stream, mode='w')
+        with self.__dao.getReadSession() as session:
+            deviceConfigs = session.query(Device.id, Device.name, DeviceConfig.config)\
+                .join(DeviceConfig, DeviceConfig.device_id == Device.id).filter(Device.pod_id == podId)\
+                .order_by(Device.name).yield_per(zipConfigBatchSize)
+            for deviceId, deviceName, config in deviceConfigs:
+                if config is not None:
+                    zipArchive.writestr(deviceId + '__' + deviceName + '.conf', config)
+                    yield stream.drain()
+    
+            leafSettings = session.query(LeafSetting.deviceFamily, LeafSetting.config).filter(LeafSetting.pod_id == podId)
+            for deviceFamily, config in leafSettings:
+                if config is not None:
+                    zipArchive.writestr(deviceFamily + '.conf', config)
+                    yield stream.drain()
         
         zipArchive.close()
         logger.debug('zip file content:\n' + str(zipArchive.namelist()))
-        return buff.getvalue()
+        yield stream.drain()
 
     def copyAdditionalDeviceFields(self, dict, device):
         '''
         Hook to enhance Device object
         '''
     def getDevices(self, dbSession, podId):
-        
-        devices = {}
-        listOfDevices = []
-        pod = self.report.getPod(dbSession, podId)
-        if pod is not None:
-            for device in pod.devices:
-                outputDict = {}
-                outputDict['id'] = device.id
-                outputDict['name'] = device.name
-                outputDict['role'] = device.role
-                outputDict['family'] = device.family
-                outputDict['macAddress'] = device.macAddress
-                outputDict['managementIp'] = device.managementIp
-                outputDict['serialNumber'] = device.serialNumber
-                outputDict['deployStatus'] = device.deployStatus
-                outputDict['configStatus'] = device.configStatus
-                outputDict['l2Status'] = device.l2Status
-                outputDict['l3Status'] = device.l3Status
-                outputDict['uri'] = str(bottle.request.url).translate(None, ',') + '/' +device.id
-                self.copyAdditionalDeviceFields(outputDict, device)
-
-                listOfDevices.append(outputDict)
-            devices['device'] = listOfDevices
-            devices['uri'] = str(bottle.request.url).translate(None, ',')
-            devices['total'] = len(pod.devices)
-            return {'devices' : devices}
-        else:
+        '''
+        Query parameters, all optional:
+        limit: page size, 'next' is the uri of next page if there are more devices
+        after: name of the last device of previous page
+        role, family, deployStatus, configStatus, l2Status, l3Status: filters, comma separated values
+        fields: fields of each device, comma separated, see deviceListFields
+        '''
+        query = bottle.request.query
+        filters = {}
+        for column in deviceListFilters:
+            if column in query:
+                filters[column] = query.get(column).split(',')
+        fields = deviceListFields
+        if 'fields' in query:
+            fields = query.get('fields').split(',')
+            if not set(fields).issubset(deviceListFields):
+                raise bottle.HTTPError(400, exception = InvalidRequest("Unknown fields: %s, supported: %s" % (
+                    ','.join(sorted(set(fields) - set(deviceListFields))), ','.join(deviceListFields))))
+        limit = None
+        if 'limit' in query:
+            try:
+                limit = int(query.get('limit'))
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                raise bottle.HTTPError(400, exception = InvalidRequest("limit must be a positive integer"))
+
+        # name is the pagination key
+        columns = [column for column in deviceSummaryColumns if column in fields or column in ('id', 'name')]
+        # one extra to find if there is a next page
+        page = self.__dao.getDevices(dbSession, podId, filters, query.get('after'), limit + 1 if limit else None, columns)
+        total = self.__dao.getDeviceCount(dbSession, podId, filters)
+        if total == 0 and self.report.getPod(dbSession, podId) is None:
             raise bottle.HTTPError(404, exception = PodNotFound(podId))
+
+        devicesUri = bottle.request.urlparts._replace(query = '').geturl().translate(None, ',')
+        devices = {'uri': devicesUri, 'total': total}
+        if limit and len(page) > limit:
+            page = page[:limit]
+            nextQuery = [(key, value) for key, value in query.allitems() if key != 'after'] + [('after', page[-1].name)]
+            devices['next'] = devicesUri + '?' + urllib.urlencode(nextQuery)
+
+        listOfDevices = []
+        for device in page:
+            outputDict = {}
+            for field in fields:
+                if field == 'uri':
+                    outputDict['uri'] = devicesUri + '/' + device.id
+                else:
+                    outputDict[field] = getattr(device, field)
+            self.copyAdditionalDeviceFields(outputDict, device)
+            listOfDevices.append(outputDict)
+        devices['device'] = listOfDevices
+        return {'devices' : devices}
         
     def getDevice(self, dbSession, podId, deviceId):
         
@@ -474,9 +628,29 @@ class RestServer():
         if config is None:
             raise bottle.HTTPError(404, exception = DeviceConfigurationNotFound("Device exists but no config found, probably fabric script is not ran. podId: '%s', deviceId: '%s'" % (podId, deviceId)))
         
+        if self.isNotModified(config.configEtag):
+            return self.notModified()
         bottle.response.headers['Content-Type'] = 'application/json'
         return config.config
 
+    def isNotModified(self, etag):
+        '''
+        Sets ETag header of the response
+        :returns bool: True if If-None-Match header of the request has the etag
+        '''
+        if etag is None:
+            return False
+        bottle.response.headers['ETag'] = etag
+        ifNoneMatch = bottle.request.get_header('If-None-Match')
+        if ifNoneMatch is None:
+            return False
+        # weak comparison, W/ prefix is ignored
+        tags = [tag.strip() for tag in ifNoneMatch.split(',')]
+        return '*' in tags or etag in tags or 'W/' + etag in tags
+
+    def notModified(self):
+        return bottle.HTTPResponse(status = 304, headers = {'ETag': bottle.response.headers['ETag']})
+
     
     def getZtpConfig(self, dbSession, podId):
         
@@ -487,9 +661,19 @@ class RestServer():
             podFolder = pod.id + '-' + pod.name
             fileName = os.path.join(podFolder, "dhcpd.conf")
             logger.debug('webServerRoot: %s, fileName: %s, exists: %s' % (webServerRoot, fileName, os.path.exists(os.path.join(webServerRoot, fileName))))         
+            # ETag written with the file
+            etag = None
+            etagFileName = os.path.join(webServerRoot, fileName + etagFileSuffix)
+            if os.path.exists(etagFileName) and os.path.exists(os.path.join(webServerRoot, fileName)):
+                with open(etagFileName) as f:
+                    etag = f.read()
+                if self.isNotModified(etag):
+                    return self.notModified()
             ztpConf = bottle.static_file(fileName, root=webServerRoot)
             if isinstance(ztpConf, bottle.HTTPError):
                 raise bottle.HTTPError(404, exception = DeviceConfigurationNotFound("Pod exists but no ztp Config found. Pod name: '%s " % (pod.name)))
+            if etag is not None:
+                ztpConf.set_header('ETag', etag)
             return ztpConf
         else:
             raise bottle.HTTPError(404, exception = PodNotFound(podId))
@@ -713,6 +897,19 @@ class RestServer():
         except Exception as e:
             raise bottle.HTTPError(404, exception = PodNotFound(podId, e))
 
+    def getHealthReport(self, dbSession, podId):
+        try:
+            cached = bottle.request.query.get('cached', '1')
+            if cached == '1':
+                cachedData = True
+            else:
+                cachedData = False
+            bottle.response.headers['Content-Type'] = 'application/json'
+            return self.healthReport.generateReport(podId, cachedData)
+
+        except Exception as e:
+            raise bottle.HTTPError(404, exception = PodNotFound(podId, e))
+
 def main():
     restServer = RestServer()
     restServer.initRest()
@@ -0,0 +1,173 @@
+'''
+Created on Oct 18, 2026
+'''
+import time
+import threading
+import logging
+
+from propLoader import OpenClosProperty, loadLoggingConfig
+
+moduleName = 'statusSink'
+loadLoggingConfig(appName = moduleName)
+logger = logging.getLogger(moduleName)
+
+defaultSinkSettings = {'batchSize': 500, 'flushInterval': 1.0}
+
+# kinds of status update
+UPDATE = 'update'               # (UPDATE, objectType, id, values): update columns of one row
+UPDATE_WHERE = 'updateWhere'    # (UPDATE_WHERE, objectType, column, value, values): update rows with column == value
+REPLACE = 'replace'             # (REPLACE, objectType, column, value, objects): delete rows with column == value, insert objects
+
+class StatusSink(object):
+    '''
+    Write-behind sink for status updates of device data collectors. Collectors
+    submit the updates of one device run together, the sink writes everything
+    submitted so far in one transaction, when batchSize updates are pending or
+    every flushInterval seconds, from a background thread (flushInterval 0: no
+    thread, written by the submitting thread at batchSize). Updates of the same
+    row are coalesced, row updates of a table are written with one executemany.
+    Updates of one submit() are never split between transactions. When the
+    transaction fails, each submit() is retried in its own transaction, updates
+    of the submits failing again are dropped and counted in failedCount.
+    Use Dao.getStatusSink(), call flush() to make pending updates visible now.
+    '''
+    def __init__(self, dao, conf = None):
+        if conf is None:
+            conf = (OpenClosProperty().getProperties() or {}).get('statusSink') or {}
+        settings = dict(defaultSinkSettings)
+        settings.update(conf)
+        self.batchSize = settings['batchSize']
+        self.flushInterval = settings['flushInterval']
+
+        self._dao = dao
+        self._condition = threading.Condition(threading.Lock())
+        self._flushLock = threading.Lock()
+        # one list of updates per submit()
+        self._pending = []
+        self._pendingCount = 0
+        self._thread = None
+        self._stopped = False
+        self.flushCount = 0
+        self.updateCount = 0
+        self.failedCount = 0
+
+    def submit(self, updates):
+        '''
+        :param list updates: UPDATE/UPDATE_WHERE/REPLACE tuples, written in order. UPDATEs
+        of the same row are coalesced (last value of a column wins) and written with
+        executemany, before the next UPDATE_WHERE/REPLACE of the same table
+        '''
+        if not updates:
+            return
+        with self._condition:
+            self._pending.append(list(updates))
+            self._pendingCount += len(updates)
+            batchFull = self._pendingCount >= self.batchSize
+            if self.flushInterval and self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target = self._run, name = moduleName)
+                self._thread.daemon = True
+                self._thread.start()
+            elif self.flushInterval and batchFull:
+                self._condition.notify()
+        if batchFull and not self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes all pending updates in one transaction, on failure each submit()
+        in its own transaction
+        :returns int: number of updates written
+        '''
+        with self._flushLock:
+            with self._condition:
+                submits = self._pending
+                self._pending = []
+                self._pendingCount = 0
+            if not submits:
+                return 0
+            start = time.time()
+            updates = [update for submitted in submits for update in submitted]
+            try:
+                with self._dao.getReadWriteSession() as session:
+                    self._write(session, updates)
+                written = len(updates)
+            except Exception as exc:
+                logger.warning('Failed to write %d status updates, retrying per submit, %s' % (len(updates), exc))
+                written = self._writeEach(submits)
+            self.flushCount += 1
+            self.updateCount += written
+            logger.debug('Wrote %d status updates in %.3f sec' % (written, time.time() - start))
+            return written
+
+    def _writeEach(self, submits):
+        written = 0
+        for submitted in submits:
+            try:
+                with self._dao.getReadWriteSession() as session:
+                    self._write(session, submitted)
+                written += len(submitted)
+            except Exception as exc:
+                self.failedCount += len(submitted)
+                logger.error('Failed to write %d status updates, dropped, %s: %s' % (len(submitted), exc, submitted))
+        return written
+
+    def stop(self):
+        '''
+        Stops background thread and writes pending updates
+        '''
+        with self._condition:
+            self._stopped = True
+            thread = self._thread
+            self._thread = None
+            self._condition.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._stopped and self._pendingCount < self.batchSize:
+                    self._condition.wait(self.flushInterval)
+                if self._stopped:
+                    return
+            self.flush()
+
+    def _write(self, session, updates):
+        # pending row updates, objectType -> id -> coalesced values
+        rows = {}
+        for update in updates:
+            kind = update[0]
+            if kind == UPDATE:
+                kind, objectType, id, values = update
+                row = rows.setdefault(objectType, {}).get(id)
+                if row is None:
+                    row = {'id': id}
+                    rows[objectType][id] = row
+                row.update(values)
+            elif kind == UPDATE_WHERE:
+                kind, objectType, column, value, values = update
+                self._writeRows(session, objectType, rows.pop(objectType, {}))
+                session.flush()
+                session.query(objectType).filter(getattr(objectType, column) == value).update(values, synchronize_session = False)
+            elif kind == REPLACE:
+                kind, objectType, column, value, objects = update
+                self._writeRows(session, objectType, rows.pop(objectType, {}))
+                session.flush()
+                session.query(objectType).filter(getattr(objectType, column) == value).delete(synchronize_session = False)
+                session.add_all(objects)
+        session.flush()
+
+        for objectType, tableRows in rows.iteritems():
+            self._writeRows(session, objectType, tableRows)
+
+    def _writeRows(self, session, objectType, rows):
+        '''
+        One executemany per set of updated columns
+        :param dict rows: id -> values
+        '''
+        rowUpdates = {}
+        for row in rows.itervalues():
+            rowUpdates.setdefault(tuple(sorted(row.keys())), []).append(row)
+        for mappings in rowUpdates.itervalues():
+            self._dao.bulkUpdate(session, objectType, mappings)
@@ -0,0 +1,114 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import hashlib
+import threading
+import logging
+from jinja2 import Environment, PackageLoader, FileSystemBytecodeCache
+
+from common import SingletonBase
+from propLoader import OpenClosProperty, loadLoggingConfig
+
+moduleName = 'templateRegistry'
+loadLoggingConfig(appName = moduleName)
+logger = logging.getLogger(moduleName)
+
+templatePackage = 'jnpr.openclos'
+junosTemplates = 'junosTemplates'
+cablingPlanTemplates = 'cablingPlanTemplates'
+
+class TemplateRegistry(SingletonBase):
+    '''
+    Process-wide registry of compiled Jinja2 templates for conf/junosTemplates and
+    conf/cablingPlanTemplates. Each template is compiled once and handed out from
+    memory afterwards. If openclos.yaml has templateBytecodeCache, compiled templates
+    are also stored in that directory so that next process start skips compilation.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._digests = {}
+        self.hits = 0
+        self.misses = 0
+
+        bytecodeCache = None
+        conf = OpenClosProperty().getProperties() or {}
+        bytecodeCacheDir = conf.get('templateBytecodeCache')
+        if bytecodeCacheDir:
+            bytecodeCacheDir = OpenClosProperty().fixOutputDirForRelativePath(bytecodeCacheDir)
+            if not os.path.exists(bytecodeCacheDir):
+                os.makedirs(bytecodeCacheDir)
+            bytecodeCache = FileSystemBytecodeCache(bytecodeCacheDir)
+            logger.info('Template bytecode cache: %s' % (bytecodeCacheDir))
+
+        # templates are not changed at runtime, auto_reload would stat the file on every lookup
+        self._environments = {}
+        junosEnv = Environment(loader=PackageLoader(templatePackage, os.path.join('conf', junosTemplates)),
+                               bytecode_cache=bytecodeCache, auto_reload=False)
+        junosEnv.keep_trailing_newline = True
+        self._environments[junosTemplates] = junosEnv
+
+        cablingPlanEnv = Environment(loader=PackageLoader(templatePackage, os.path.join('conf', cablingPlanTemplates)),
+                                     bytecode_cache=bytecodeCache, auto_reload=False)
+        cablingPlanEnv.lstrip_blocks = True
+        self._environments[cablingPlanTemplates] = cablingPlanEnv
+
+    def __del__(self):
+        self._templates = {}
+
+    def getEnvironment(self, templateDir):
+        '''
+        :param str templateDir: junosTemplates or cablingPlanTemplates
+        '''
+        return self._environments[templateDir]
+
+    def getTemplate(self, templateDir, templateName):
+        '''
+        :param str templateDir: junosTemplates or cablingPlanTemplates
+        :param str templateName: file name of the template, example 'protocolBgp.txt'
+        :returns jinja2.Template: compiled template
+        :raises jinja2.TemplateNotFound:
+        '''
+        key = (templateDir, templateName)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self.hits += 1
+                return template
+            self.misses += 1
+            template = self._environments[templateDir].get_template(templateName)
+            self._templates[key] = template
+            return template
+
+    def getDigest(self, templateDir):
+        '''
+        :returns str: digest of all template sources of templateDir, changes when any template changes
+        '''
+        with self._lock:
+            digest = self._digests.get(templateDir)
+            if digest is None:
+                env = self._environments[templateDir]
+                sha = hashlib.sha1()
+                for templateName in sorted(env.list_templates()):
+                    source = env.loader.get_source(env, templateName)[0]
+                    sha.update(templateName)
+                    sha.update(source.encode('utf-8'))
+                digest = sha.hexdigest()
+                self._digests[templateDir] = digest
+            return digest
+
+    def warmUp(self):
+        '''
+        Compiles all templates, called at startup so that first request does not pay for it
+        '''
+        count = 0
+        for templateDir, env in self._environments.items():
+            for templateName in env.list_templates():
+                self.getTemplate(templateDir, templateName)
+                count += 1
+        logger.info('Template registry warmed up, %d templates' % (count))
+
+    def getStats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'templates': len(self._templates)}
@@ -0,0 +1,79 @@
+'''
+Created on Oct 18, 2026
+
+Measures L3ClosMediation.createDeviceConfig time for 100/500/1000 device pods,
+rendering serially and in thread/process pool (openclos.yaml configRendering),
+against in-memory sqlite.
+
+Running the test:
+  python benchmarkConfigRendering.py [workerCount]
+
+Leaves are qfx5100-48s-6q so that leaf configs are generated (ztpStaged false),
+spines are a synthetic family with enough downlink ports for 996 leaves.
+'''
+import sys
+import time
+import multiprocessing
+
+from jnpr.openclos.dao import AbstractDao
+from jnpr.openclos.l3Clos import L3ClosMediation
+from jnpr.openclos.propLoader import loadLoggingConfig
+from jnpr.openclos.model import DeviceConfig
+
+moduleName = 'benchmarkConfigRendering'
+benchmarkSpineFamily = 'benchmark-spine-1024'
+spineCount = 4
+deviceCounts = [100, 500, 1000]
+executors = ['serial', 'thread', 'process']
+
+class BenchmarkDao(AbstractDao):
+    def _getDbUrl(self):
+        loadLoggingConfig(appName = moduleName)
+        return 'sqlite:///'
+
+def getPodDict(spineCount, leafCount):
+    inventory = {'spines': [], 'leafs': []}
+    for i in xrange(spineCount):
+        inventory['spines'].append({'name': 'spine-%03d' % (i)})
+    for i in xrange(leafCount):
+        inventory['leafs'].append({'name': 'leaf-%04d' % (i), 'family': 'qfx5100-48s-6q'})
+
+    podDict = {"devicePassword": "abcd1234", "leafCount": leafCount, "leafSettings": [{"deviceType":"qfx5100-48s-6q"}],
+               "spineAS": 100, "spineCount": spineCount, "spineDeviceType": benchmarkSpineFamily, "interConnectPrefix": "192.168.0.0/16",
+               "vlanPrefix": "172.16.0.0/12", "topologyType": "threeStage", "loopbackPrefix": "10.0.0.0/16", "leafAS": 10000,
+               "managementPrefix": "10.128.0.1/16", "hostOrVmCountPerLeaf": 254}
+    return podDict, inventory
+
+def timeCreateDeviceConfig(deviceCount, workerCount):
+    conf = {'outputDir': 'out', 'bulkPodBuild': True, 'deploymentMode': {'ztpStaged': False}}
+    l3ClosMediation = L3ClosMediation(conf, BenchmarkDao)
+    l3ClosMediation.deviceSku.skuDetail[benchmarkSpineFamily] = {'spine': {'uplinkPorts': [],
+        'downlinkPorts': l3ClosMediation.deviceSku.portRegexToList('et-0/0/[0-511]') + l3ClosMediation.deviceSku.portRegexToList('et-0/1/[0-511]')}}
+    podDict, inventory = getPodDict(spineCount, deviceCount - spineCount)
+    pod = l3ClosMediation.createPod('pod-%d' % (deviceCount), podDict, inventory)
+
+    times = {}
+    for executor in executors:
+        conf['configRendering'] = {'executor': executor, 'workerCount': workerCount}
+        # otherwise unchanged configs are reused
+        with BenchmarkDao.getInstance().getReadWriteSession() as session:
+            session.query(DeviceConfig).delete()
+        start = time.time()
+        l3ClosMediation.createDeviceConfig(pod.id)
+        times[executor] = time.time() - start
+
+    BenchmarkDao._destroy()
+    return times
+
+def main():
+    workerCount = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count()
+    print 'workers: %d' % (workerCount)
+    print 'devices,' + ','.join(['%s(sec)' % (executor) for executor in executors]) + ',' + \
+        ','.join(['%s(devices/sec)' % (executor) for executor in executors])
+    for deviceCount in deviceCounts:
+        times = timeCreateDeviceConfig(deviceCount, workerCount)
+        print '%d,' % (deviceCount) + ','.join(['%.2f' % (times[executor]) for executor in executors]) + ',' + \
+            ','.join(['%.0f' % (deviceCount / times[executor]) for executor in executors])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+'''
+Created on Oct 18, 2026
+
+Measures util.interfaceNameToUniqueSequenceNumber over the interface names of
+a pod build (spine et-, leaf xe-/et-/ge-, uplink-, access-, lo0, irb and their
+IFLs): old two regexes per name vs combined pattern, uncached and cached.
+Every name is checked to get the same sequence number from all of them.
+
+Running the test:
+  python benchmarkInterfaceSequenceNumber.py [spineCount leafCount]
+'''
+import re
+import sys
+import time
+
+from jnpr.openclos import util
+
+# old implementation, for reference
+otherPortRegx = re.compile(r"[0-9A-Za-z]+\.?(\d{0,2})")
+fpcPicPortRegx = re.compile(r"([a-z]+)-(\d)\/(\d)\/(\d{1,3})\.?(\d{0,2})")
+fakeNameRegxList = [(re.compile(r"uplink-(\d{1,3})\.?(\d{0,2})"), 90000000, 91000000),
+                    (re.compile(r"access-(\d{1,3})\.?(\d{0,2})"), 92000000, 93000000)]
+
+def oldInterfaceNameToUniqueSequenceNumber(interfaceName):
+    if interfaceName is None or interfaceName == '':
+        return None
+    match = fpcPicPortRegx.match(interfaceName)
+    if match is not None:
+        speed, fpc, pic, port, unit = match.groups()
+        if not unit:
+            unit = 0
+        if 'et' in speed:
+            speedInt = 1
+        elif 'xe' in speed:
+            speedInt = 2
+        elif 'ge' in speed:
+            speedInt = 3
+        else:
+            speedInt = 4
+        sequenceNum = 100000 * speedInt + 10000 * int(fpc) + 1000 * int(pic) + int(port)
+        if unit != 0:
+            sequenceNum = 100 * sequenceNum + int(unit)
+        return sequenceNum
+    for fakeNameRegx, intfStart, subIntfStart in fakeNameRegxList:
+        match = fakeNameRegx.match(interfaceName)
+        if match is not None:
+            port, unit = match.groups()
+            if not unit:
+                unit = 0
+            sequenceNum = intfStart + int(port)
+            if unit != 0:
+                sequenceNum = subIntfStart + 100 * int(port) + int(unit)
+            return sequenceNum
+    match = otherPortRegx.match(interfaceName)
+    if match is not None:
+        return int(interfaceName.encode('hex'), 16)
+
+def withIfl(names):
+    return names + [name + '.0' for name in names]
+
+def getPodInterfaceNames(spineCount, leafCount):
+    '''
+    Names in the order Interface objects of a pod build are created,
+    every device has lo0.0, leaves have irb.1
+    '''
+    names = []
+    for spine in xrange(spineCount):
+        names += withIfl(['et-0/0/%d' % (port) for port in xrange(min(leafCount, 32))]) + ['lo0.0']
+    for leaf in xrange(leafCount):
+        if leaf % 4 == 3:
+            # ex4300 leaf
+            uplinks = ['et-0/1/%d' % (port) for port in xrange(4)] + ['uplink-%d' % (port) for port in xrange(4, spineCount)]
+            downlinks = ['ge-0/0/%d' % (port) for port in xrange(24)]
+        else:
+            uplinks = ['et-0/0/%d' % (port) for port in xrange(48, 48 + min(spineCount, 6))] + ['uplink-%d' % (port) for port in xrange(6, spineCount)]
+            downlinks = ['xe-0/0/%d' % (port) for port in xrange(48)]
+        names += withIfl(uplinks) + downlinks + ['access-%d' % (port) for port in xrange(2)] + ['lo0', 'lo0.0', 'irb', 'irb.1']
+    return names
+
+def timeCalls(function, names):
+    start = time.time()
+    for name in names:
+        function(name)
+    return time.time() - start
+
+def main():
+    spineCount = int(sys.argv[1]) if len(sys.argv) > 2 else 4
+    leafCount = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+    names = getPodInterfaceNames(spineCount, leafCount)
+    for name in set(names):
+        assert oldInterfaceNameToUniqueSequenceNumber(name) == util.interfaceNameToUniqueSequenceNumber.uncached(name), name
+    
+    print 'names,distinct,function,total(sec),perCall(usec)'
+    util.interfaceNameToUniqueSequenceNumber.cacheClear()
+    for functionName, function in [('old', oldInterfaceNameToUniqueSequenceNumber), 
+                                   ('combinedPattern', util.interfaceNameToUniqueSequenceNumber.uncached), 
+                                   ('cached', util.interfaceNameToUniqueSequenceNumber)]:
+        elapsed = timeCalls(function, names)
+        print '%d,%d,%s,%.3f,%.2f' % (len(names), len(set(names)), functionName, elapsed, elapsed * 1000000 / len(names))
+
+if __name__ == '__main__':
+    main()
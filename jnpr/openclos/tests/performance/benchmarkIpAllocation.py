@@ -0,0 +1,64 @@
+'''
+Created on Oct 18, 2026
+
+Measures loopback, irb and interconnect address allocation of a pod, netaddr
+lists with pop(0) (old L3ClosMediation allocation) vs ipAllocator generators.
+Only addresses are allocated, no device or DB is involved.
+
+Running the test:
+  python benchmarkIpAllocation.py [spineCount leafCount]
+Default is 64 spines x 2048 leaves, old allocation is quadratic in
+spineCount * leafCount (pop(0) of the subnet list).
+'''
+import sys
+import time
+
+from jnpr.openclos import ipAllocator
+from jnpr.openclos.l3Clos import L3ClosMediation
+
+def getBlocks(spineCount, leafCount):
+    # block sizing of L3ClosMediation, no instance is needed
+    lo0Block = L3ClosMediation._getLoopbackBlock.im_func(None, '10.0.0.0/8', spineCount + leafCount)
+    irbBlock, irbCidr = L3ClosMediation._getIrbBlock.im_func(None, '172.16.0.0/4', 254, leafCount)
+    interconnectBlock, interconnectCidr = L3ClosMediation._getInterconnectBlock.im_func(None, '192.168.0.0/8', spineCount, leafCount)
+    return lo0Block, irbBlock, irbCidr, interconnectBlock, interconnectCidr
+
+def allocateWithLists(spineCount, leafCount):
+    lo0Block, irbBlock, irbCidr, interconnectBlock, interconnectCidr = getBlocks(spineCount, leafCount)
+    lo0Ips = list(lo0Block.iter_hosts())
+    allocated = [str(lo0Ips.pop(0)) + '/32' for device in xrange(spineCount + leafCount)]
+    irbSubnets = list(irbBlock.subnet(irbCidr))
+    allocated += [str(list(irbSubnets.pop(0).iter_hosts())[0]) + '/' + str(irbCidr) for leaf in xrange(leafCount)]
+    interconnectSubnets = list(interconnectBlock.subnet(interconnectCidr))
+    for link in xrange(spineCount * leafCount):
+        ips = list(interconnectSubnets.pop(0))
+        allocated.append(str(ips.pop(0)) + '/' + str(interconnectCidr))
+        allocated.append(str(ips.pop(0)) + '/' + str(interconnectCidr))
+    return allocated
+
+def allocateWithGenerators(spineCount, leafCount):
+    lo0Block, irbBlock, irbCidr, interconnectBlock, interconnectCidr = getBlocks(spineCount, leafCount)
+    lo0Ips = ipAllocator.iterHosts(lo0Block)
+    allocated = [lo0Ips.next() + '/32' for device in xrange(spineCount + leafCount)]
+    irbIps = ipAllocator.iterFirstHostOfSubnets(irbBlock, irbCidr)
+    allocated += [irbIps.next() for leaf in xrange(leafCount)]
+    interconnectSubnets = ipAllocator.iterPointToPointSubnets(interconnectBlock, interconnectCidr)
+    for link in xrange(spineCount * leafCount):
+        allocated.extend(interconnectSubnets.next())
+    return allocated
+
+def timeAllocation(allocate, spineCount, leafCount):
+    start = time.time()
+    allocated = allocate(spineCount, leafCount)
+    return time.time() - start, allocated
+
+def main():
+    spineCount, leafCount = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (64, 2048)
+    print 'spines,leaves,addresses,lists(sec),generators(sec),speedup'
+    listTime, listAllocated = timeAllocation(allocateWithLists, spineCount, leafCount)
+    generatorTime, generatorAllocated = timeAllocation(allocateWithGenerators, spineCount, leafCount)
+    assert listAllocated == generatorAllocated
+    print '%d,%d,%d,%.2f,%.2f,%.1f' % (spineCount, leafCount, len(generatorAllocated), listTime, generatorTime, listTime / generatorTime)
+
+if __name__ == '__main__':
+    main()
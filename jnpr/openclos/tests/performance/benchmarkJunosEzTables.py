@@ -0,0 +1,41 @@
+'''
+Created on Oct 18, 2026
+
+Measures per-collection overhead of getting junos-eznc LLDP/BGP tables ready,
+loadyaml on every collection (old) vs table classes cached in devicePlugin.
+No device is needed, the table is bound to None.
+
+Running the test:
+  python benchmarkJunosEzTables.py [collectionCount]
+'''
+import os
+import sys
+import time
+
+from jnpr.junos.factory import loadyaml
+from jnpr.openclos.devicePlugin import junosEzTableLocation, getJunosEzTable
+
+tables = [('lldp.yaml', 'LLDPNeighborTable'), ('BGP.yaml', 'BGPNeighborTable')]
+
+def loadEveryTime(fileName, tableName):
+    return loadyaml(os.path.join(junosEzTableLocation, fileName))[tableName](None)
+
+def loadCached(fileName, tableName):
+    return getJunosEzTable(fileName, tableName)(None)
+
+def timeCollections(loader, count):
+    start = time.time()
+    for i in xrange(count):
+        for fileName, tableName in tables:
+            loader(fileName, tableName)
+    return time.time() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print 'collections,loader,total(sec),perCollection(usec)'
+    for name, loader in [('loadyaml', loadEveryTime), ('cached', loadCached)]:
+        elapsed = timeCollections(loader, count)
+        print '%d,%s,%.3f,%.1f' % (count, name, elapsed, elapsed * 1000000 / count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Created on Oct 18, 2026
+
+Measures L3ClosMediation.createPod time as spine/leaf count grows, for both
+ORM build and bulk build (openclos.yaml bulkPodBuild) against in-memory sqlite. 
+
+Running the test:
+  python benchmarkPodCreation.py
+
+Spine port count of real SKUs limits leaf count to 72 (qfx10002-72q), so the
+benchmark registers a synthetic spine family with enough downlink ports 
+to build 32 spine x 512 leaf pods. Leaves are 'unknown' family, which gets 
+one fake uplink per spine.
+'''
+import time
+
+from jnpr.openclos.dao import AbstractDao
+from jnpr.openclos.l3Clos import L3ClosMediation
+from jnpr.openclos.propLoader import loadLoggingConfig
+
+moduleName = 'benchmarkPodCreation'
+benchmarkSpineFamily = 'benchmark-spine-512'
+podSizes = [(4, 16), (8, 64), (16, 128), (16, 256), (32, 512)]
+# ORM build grows quadratically, beyond this many devices it takes tens of minutes
+ormMaxDeviceCount = 300
+
+class BenchmarkDao(AbstractDao):
+    def _getDbUrl(self):
+        loadLoggingConfig(appName = moduleName)
+        return 'sqlite:///'
+
+def getPodDict(spineCount, leafCount):
+    inventory = {'spines': [], 'leafs': []}
+    for i in xrange(spineCount):
+        inventory['spines'].append({'name': 'spine-%03d' % (i), 'macAddress': '10:0e:7e:af:%02x:%02x' % (i / 256, i % 256)})
+    for i in xrange(leafCount):
+        inventory['leafs'].append({'name': 'leaf-%04d' % (i)})
+
+    podDict = {"devicePassword": "abcd1234", "leafCount": leafCount, "leafSettings": [{"deviceType":"qfx5100-48s-6q"}], 
+               "spineAS": 100, "spineCount": spineCount, "spineDeviceType": benchmarkSpineFamily, "interConnectPrefix": "192.168.0.0/16", 
+               "vlanPrefix": "172.16.0.0/12", "topologyType": "threeStage", "loopbackPrefix": "10.0.0.0/16", "leafAS": 10000, 
+               "managementPrefix": "10.128.0.1/16", "hostOrVmCountPerLeaf": 254}
+    return podDict, inventory
+
+def timeCreatePod(bulkPodBuild, spineCount, leafCount):
+    conf = {'outputDir': 'out', 'bulkPodBuild': bulkPodBuild}
+    l3ClosMediation = L3ClosMediation(conf, BenchmarkDao)
+    l3ClosMediation.deviceSku.skuDetail[benchmarkSpineFamily] = {'spine': {'uplinkPorts': [], 
+        'downlinkPorts': l3ClosMediation.deviceSku.portRegexToList('et-0/0/[0-511]')}}
+    podDict, inventory = getPodDict(spineCount, leafCount)
+
+    start = time.time()
+    l3ClosMediation.createPod('pod-%dx%d' % (spineCount, leafCount), podDict, inventory)
+    elapsed = time.time() - start
+    
+    BenchmarkDao._destroy()
+    return elapsed
+
+def main():
+    print 'spines,leaves,orm(sec),bulk(sec),speedup'
+    for spineCount, leafCount in podSizes:
+        bulk = timeCreatePod(True, spineCount, leafCount)
+        if spineCount + leafCount <= ormMaxDeviceCount:
+            orm = timeCreatePod(False, spineCount, leafCount)
+            print '%d,%d,%.2f,%.2f,%.1fx' % (spineCount, leafCount, orm, bulk, orm / bulk)
+        else:
+            print '%d,%d,-,%.2f,-' % (spineCount, leafCount, bulk)
+    
+if __name__ == '__main__':
+    main()
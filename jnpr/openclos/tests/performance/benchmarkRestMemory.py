@@ -0,0 +1,147 @@
+'''
+Created on Oct 18, 2026
+
+Measures memory used by REST GET /openclos/pods, /openclos/pods/<podId> and
+/openclos/pods/<podId>/devices on a pod with large device configs, leaf generic
+configs and cabling plan stored, against in-memory sqlite. For each request:
+BLOB bytes loaded in the session, SELECT count, time and growth of peak RSS.
+Last row loads the pod with every BLOB column undeferred, what touching
+pod.devices/device.config/leafSettings/cablingPlan loaded before deferral.
+
+Running the test:
+  python benchmarkRestMemory.py [leafCount] [configSize(KB)]
+'''
+import sys
+import time
+import resource
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import selectinload, undefer
+from webtest import TestApp
+
+from jnpr.openclos.dao import AbstractDao
+from jnpr.openclos.l3Clos import L3ClosMediation
+from jnpr.openclos.rest import RestServer
+from jnpr.openclos.propLoader import loadLoggingConfig
+from jnpr.openclos.model import Pod, Device, DeviceConfig, LeafSetting, CablingPlan
+
+moduleName = 'benchmarkRestMemory'
+benchmarkSpineFamily = 'benchmark-spine-1024'
+spineCount = 4
+# mapped class -> deferred columns
+blobColumns = {Pod: ['inventoryData'], LeafSetting: ['config'], CablingPlan: ['json', 'dot'], DeviceConfig: ['config']}
+
+class BenchmarkDao(AbstractDao):
+    def _getDbUrl(self):
+        loadLoggingConfig(appName = moduleName)
+        return 'sqlite:///'
+
+def getPodDict(spineCount, leafCount):
+    inventory = {'spines': [], 'leafs': []}
+    for i in xrange(spineCount):
+        inventory['spines'].append({'name': 'spine-%03d' % (i)})
+    for i in xrange(leafCount):
+        inventory['leafs'].append({'name': 'leaf-%04d' % (i)})
+
+    podDict = {"devicePassword": "abcd1234", "leafCount": leafCount, "leafSettings": [{"deviceType":"qfx5100-48s-6q"}],
+               "spineAS": 100, "spineCount": spineCount, "spineDeviceType": benchmarkSpineFamily, "interConnectPrefix": "192.168.0.0/16",
+               "vlanPrefix": "172.16.0.0/12", "topologyType": "threeStage", "loopbackPrefix": "10.0.0.0/16", "leafAS": 10000,
+               "managementPrefix": "10.128.0.1/16", "hostOrVmCountPerLeaf": 254}
+    return podDict, inventory
+
+def createPodWithBlobs(leafCount, configSize):
+    conf = {'outputDir': 'out', 'bulkPodBuild': True}
+    l3ClosMediation = L3ClosMediation(conf, BenchmarkDao)
+    l3ClosMediation.deviceSku.skuDetail[benchmarkSpineFamily] = {'spine': {'uplinkPorts': [],
+        'downlinkPorts': l3ClosMediation.deviceSku.portRegexToList('et-0/0/[0-511]') + l3ClosMediation.deviceSku.portRegexToList('et-0/1/[0-511]')}}
+    podDict, inventory = getPodDict(spineCount, leafCount)
+    podId = l3ClosMediation.createPod('pod-%d' % (leafCount), podDict, inventory).id
+
+    dao = BenchmarkDao.getInstance()
+    config = 'x' * configSize
+    with dao.getReadWriteSession() as session:
+        deviceIds = [id for id, in session.query(Device.id).filter(Device.pod_id == podId)]
+        dao.bulkInsert(session, DeviceConfig, [{'device_id': id, 'config': config} for id in deviceIds])
+        session.query(LeafSetting).filter(LeafSetting.pod_id == podId).update({'config': config}, synchronize_session = False)
+        session.add(CablingPlan(podId, config * 4, config * 4))
+        session.query(Pod).filter(Pod.id == podId).update({'inventoryData': 'x' * 2048}, synchronize_session = False)
+    return podId, len(deviceIds)
+
+class LoadCounter(object):
+    '''
+    Counts BLOB bytes loaded into sessions and SELECT statements
+    '''
+    def __init__(self):
+        self.blobBytes = 0
+        self.selectCount = 0
+
+    def onLoad(self, target, context):
+        self.countBlobs(target, blobColumns[type(target)])
+
+    def onRefresh(self, target, context, attrs):
+        self.countBlobs(target, attrs or blobColumns[type(target)])
+
+    def countBlobs(self, target, columns):
+        for column in columns:
+            value = target.__dict__.get(column)
+            if value is not None and column in blobColumns[type(target)]:
+                self.blobBytes += len(value)
+
+    def beforeExecute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT'):
+            self.selectCount += 1
+
+    def __enter__(self):
+        for objectType in blobColumns:
+            event.listen(objectType, 'load', self.onLoad)
+            event.listen(objectType, 'refresh', self.onRefresh)
+        event.listen(Engine, 'before_cursor_execute', self.beforeExecute)
+        return self
+
+    def __exit__(self, *args):
+        for objectType in blobColumns:
+            event.remove(objectType, 'load', self.onLoad)
+            event.remove(objectType, 'refresh', self.onRefresh)
+        event.remove(Engine, 'before_cursor_execute', self.beforeExecute)
+        return False
+
+def maxRssKb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def loadAllBlobs(podId):
+    with BenchmarkDao.getInstance().getReadSession() as session:
+        pod = session.query(Pod).options(undefer(Pod.inventoryData),
+            selectinload(Pod.devices).selectinload(Device.config).undefer(DeviceConfig.config),
+            selectinload(Pod.leafSettings).undefer(LeafSetting.config),
+            selectinload(Pod.cablingPlan).undefer(CablingPlan.json).undefer(CablingPlan.dot)).filter(Pod.id == podId).one()
+        return len(pod.devices)
+
+def main():
+    leafCount = int(sys.argv[1]) if len(sys.argv) > 1 else 996
+    configSize = (int(sys.argv[2]) if len(sys.argv) > 2 else 64) * 1024
+    podId, deviceCount = createPodWithBlobs(leafCount, configSize)
+
+    restServer = RestServer({'httpServer': {'ipAddr': 'localhost', 'port': 9090}}, BenchmarkDao)
+    restServer.initRest()
+    app = TestApp(restServer.app)
+    requests = [('GET /openclos/pods', lambda: app.get('/openclos/pods')),
+                ('GET /openclos/pods/<podId>', lambda: app.get('/openclos/pods/' + podId)),
+                ('GET /openclos/pods/<podId>/devices', lambda: app.get('/openclos/pods/' + podId + '/devices')),
+                ('all blobs loaded', lambda: loadAllBlobs(podId))]
+
+    print 'devices: %d, config: %dKB' % (deviceCount, configSize / 1024)
+    print 'request,blobs(KB),selects,time(sec),peakRssGrowth(KB)'
+    for name, request in requests:
+        rssBefore = maxRssKb()
+        start = time.time()
+        with LoadCounter() as counter:
+            request()
+        elapsed = time.time() - start
+        print '%s,%d,%d,%.3f,%d' % (name, counter.blobBytes / 1024, counter.selectCount, elapsed, maxRssKb() - rssBefore)
+
+    restServer._reset()
+    BenchmarkDao._destroy()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+Created on Oct 18, 2026
+
+Compares REST server backends (openclos.yaml restServer:server) under the
+PodLocust load of stressRest.py: reads of pods, devices, device configs and
+dhcpd.conf mixed with slow device configuration PUTs. Uses db of openclos.yaml,
+a pod with configs is created first. gunicorn backend needs gunicorn installed.
+
+Before running this test install locust - 'pip install locustio'
+Running the test:
+  python benchmarkRestServer.py [clientCount] [runTime(sec)]
+'''
+import os
+import sys
+import csv
+import time
+import socket
+import subprocess
+import multiprocessing
+
+from jnpr.openclos.dao import Dao
+from jnpr.openclos.l3Clos import L3ClosMediation
+from jnpr.openclos.ztp import ZtpServer
+from jnpr.openclos.rest import RestServer, webServerRoot
+from jnpr.openclos.propLoader import OpenClosProperty
+
+backends = ['wsgiref', 'threadPool', 'paste', 'waitress', 'gunicorn']
+port = 20081
+
+def getConf(server = None):
+    conf = dict(OpenClosProperty().getProperties())
+    conf['outputDir'] = webServerRoot
+    conf['httpServer'] = {'ipAddr': '127.0.0.1', 'port': port}
+    conf['restServer'] = dict(conf.get('restServer') or {}, server = server)
+    return conf
+
+def createPod():
+    conf = getConf()
+    inventory = {'spines': [{'name': 'spine-%02d' % (i)} for i in xrange(4)],
+                 'leafs': [{'name': 'leaf-%02d' % (i), 'family': 'qfx5100-48s-6q', 'macAddress': '10:0e:7e:af:00:%02x' % (i)} for i in xrange(32)]}
+    podDict = {"devicePassword": "abcd1234", "leafCount": 32, "leafSettings": [{"deviceType":"qfx5100-48s-6q"}],
+               "spineAS": 100, "spineCount": 4, "spineDeviceType": "qfx5100-24q-2p", "interConnectPrefix": "192.168.0.0/16",
+               "vlanPrefix": "172.16.0.0/12", "topologyType": "threeStage", "loopbackPrefix": "10.0.0.0/16", "leafAS": 10000,
+               "managementPrefix": "10.128.0.1/16", "hostOrVmCountPerLeaf": 254}
+    l3ClosMediation = L3ClosMediation(conf)
+    pod = l3ClosMediation.createPod('benchmarkRestServer-%d' % (time.time()), podDict, inventory)
+    l3ClosMediation.createCablingPlan(pod.id)
+    l3ClosMediation.createDeviceConfig(pod.id)
+    with Dao.getInstance().getReadWriteSession() as session:
+        ZtpServer(conf).createPodSpecificDhcpConfFile(session, pod.id)
+
+def runServer(server):
+    restServer = RestServer(getConf(server))
+    restServer.initRest()
+    restServer.start()
+
+def waitForPort(timeout = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return True
+        except socket.error:
+            time.sleep(0.2)
+    return False
+
+def runLocust(server, clientCount, runTime):
+    '''
+    :returns list: Total row of locust request stats
+    '''
+    csvPrefix = 'locust-' + server
+    subprocess.call(['locust', '-f', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stressRest.py'), 'PodLocust',
+                     '--no-web', '--only-summary', '-c', str(clientCount), '-r', str(clientCount), '-t', '%ds' % (runTime),
+                     '--host', 'http://127.0.0.1:%d' % (port), '--csv', csvPrefix])
+    with open(csvPrefix + '_requests.csv') as f:
+        for row in csv.DictReader(f):
+            if row['Name'] == 'Total':
+                return row
+
+def main():
+    clientCount = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    runTime = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    createPod()
+
+    print 'server,requests,failures,median(ms),average(ms),requests/sec'
+    for server in backends:
+        process = multiprocessing.Process(target = runServer, args = (server, ))
+        process.start()
+        try:
+            if not waitForPort():
+                print '%s,not started' % (server)
+                continue
+            total = runLocust(server, clientCount, runTime)
+            print '%s,%s,%s,%s,%s,%s' % (server, total['# requests'], total['# failures'], total['Median response time'],
+                                         total['Average response time'], total['Requests/s'])
+        finally:
+            process.terminate()
+            process.join()
+
+if __name__ == '__main__':
+    main()
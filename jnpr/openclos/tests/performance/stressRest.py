@@ -12,6 +12,10 @@ Running the test:
   5. python postProcess.py 
   6. The result is in 'out.csv'
 
+PodLocust exercises the /openclos/pods API, used by benchmarkRestServer.py
+to compare REST server backends:
+  locust -f stressRest.py PodLocust --host http://localhost:20080
+
 '''
 
 from jnpr.openclos.propLoader import loadLoggingConfig
@@ -216,3 +220,67 @@ class MyLocust(HttpLocust):
     stop_timeout = 15000
     task_set = MyTaskSet
 
+class PodTaskSet(TaskSet):
+    '''
+    Reads of ZTP clients and dashboards polling status, mixed with slow
+    device configuration PUTs that must not block the reads
+    '''
+    def on_start(self):
+        self.podIds = []
+        self.deviceIds = {}
+        self.etags = {}
+        self.getPods()
+
+    @task(5)
+    def getPods(self):
+        response = self.client.get('/openclos/pods')
+        if response.status_code == 200:
+            self.podIds = [pod['id'] for pod in response.json()['pods']['pod']]
+
+    @task(5)
+    def getPod(self):
+        if self.podIds:
+            self.client.get('/openclos/pods/%s' % (random.choice(self.podIds)), name = '/openclos/pods/[podId]')
+
+    @task(10)
+    def getDevices(self):
+        if self.podIds:
+            podId = random.choice(self.podIds)
+            response = self.client.get('/openclos/pods/%s/devices?limit=100&fields=id,name' % (podId), name = '/openclos/pods/[podId]/devices')
+            if response.status_code == 200:
+                self.deviceIds[podId] = [device['id'] for device in response.json()['devices']['device']]
+
+    @task(10)
+    def getDeviceStatus(self):
+        if self.podIds:
+            self.client.get('/openclos/pods/%s/devices?fields=name,l2Status,l3Status,configStatus' % (random.choice(self.podIds)), 
+                            name = '/openclos/pods/[podId]/devices?fields')
+
+    @task(20)
+    def getDeviceConfig(self):
+        podIds = [podId for podId in self.podIds if self.deviceIds.get(podId)]
+        if podIds:
+            podId = random.choice(podIds)
+            url = '/openclos/pods/%s/devices/%s/config' % (podId, random.choice(self.deviceIds[podId]))
+            headers = {}
+            if url in self.etags:
+                headers['If-None-Match'] = self.etags[url]
+            response = self.client.get(url, headers = headers, name = '/openclos/pods/[podId]/devices/[deviceId]/config')
+            if 'ETag' in response.headers:
+                self.etags[url] = response.headers['ETag']
+
+    @task(10)
+    def getZtpConfig(self):
+        if self.podIds:
+            self.client.get('/openclos/pods/%s/ztp-configuration' % (random.choice(self.podIds)), name = '/openclos/pods/[podId]/ztp-configuration')
+
+    @task(1)
+    def createDeviceConfiguration(self):
+        if self.podIds:
+            self.client.put('/openclos/pods/%s/device-configuration' % (random.choice(self.podIds)), name = '/openclos/pods/[podId]/device-configuration')
+
+class PodLocust(HttpLocust):
+    min_wait = 100
+    max_wait = 200
+    task_set = PodTaskSet
+
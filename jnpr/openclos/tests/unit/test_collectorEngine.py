@@ -0,0 +1,115 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import sys
+sys.path.insert(0,os.path.abspath(os.path.dirname(__file__) + '/' + '../..')) #trick to make it run from CLI
+
+import unittest
+import time
+import threading
+
+from jnpr.openclos.collectorEngine import CollectorEngine
+
+class TestCollectorEngine(unittest.TestCase):
+    def setUp(self):
+        self.engines = []
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.shutdown()
+
+    def createEngine(self, conf):
+        engine = CollectorEngine(conf)
+        self.engines.append(engine)
+        return engine
+
+    def testDefaults(self):
+        engine = self.createEngine({})
+        self.assertEqual(200, engine.maxInFlight)
+        self.assertIsNone(engine.deviceTimeout)
+        self.assertEqual(20, self.createEngine({'threadCount': 20}).maxInFlight)
+
+    def testRunAllKeepsDevicesInFlight(self):
+        deviceCount = 50
+        engine = self.createEngine({'maxInFlight': deviceCount})
+        # every device waits until all devices are in flight
+        allStarted = threading.Event()
+        started = []
+        lock = threading.Lock()
+
+        def collect():
+            with lock:
+                started.append(1)
+                if len(started) == deviceCount:
+                    allStarted.set()
+            if not allStarted.wait(5):
+                raise Exception('not all devices in flight')
+
+        result = engine.runAll([('leaf-%d' % (i), collect) for i in xrange(deviceCount)])
+        self.assertEqual({'done': deviceCount, 'failed': 0, 'timedOut': 0, 'cancelled': 0}, result)
+
+    def testRunAllFailure(self):
+        engine = self.createEngine({'maxInFlight': 2})
+        def fail():
+            raise ValueError('rpc error')
+        result = engine.runAll([('leaf-1', fail), ('leaf-2', lambda: None)])
+        self.assertEqual(1, result['failed'])
+        self.assertEqual(1, result['done'])
+
+    def testRunAllTimeoutKeepsSlotUntilReturn(self):
+        engine = self.createEngine({'maxInFlight': 1, 'deviceTimeout': 0.2})
+        lock = threading.Lock()
+        live = []
+        maxLive = []
+        def collect(duration):
+            with lock:
+                live.append(1)
+                maxLive.append(len(live))
+            time.sleep(duration)
+            with lock:
+                live.pop()
+        # leaf-1 times out at 0.2 and ends at 0.3, leaf-2 starts after it and
+        # gets its own deviceTimeout from the time it started
+        tasks = [('leaf-1', lambda: collect(0.3)), ('leaf-2', lambda: collect(0.15))]
+        result = engine.runAll(tasks)
+        self.assertEqual({'done': 1, 'failed': 0, 'timedOut': 1, 'cancelled': 0}, result)
+        self.assertEqual([1, 1], maxLive)
+
+    def testRunAllCancelsDevicesWithoutSlot(self):
+        engine = self.createEngine({'maxInFlight': 1, 'deviceTimeout': 0.1})
+        release = threading.Event()
+        self.addCleanup(release.set)
+        ran = []
+        tasks = [('leaf-1', lambda: release.wait(5)), ('leaf-2', lambda: ran.append(2)), ('leaf-3', lambda: ran.append(3))]
+        # leaf-1 hangs holding the only slot, the others are cancelled after 3 rounds
+        start = time.time()
+        result = engine.runAll(tasks)
+        self.assertEqual({'done': 0, 'failed': 0, 'timedOut': 1, 'cancelled': 2}, result)
+        self.assertTrue(time.time() - start < 1)
+        release.set()
+        engine.shutdown()
+        self.assertEqual([], ran)
+
+    def testCancelPending(self):
+        engine = self.createEngine({'maxInFlight': 1})
+        release = threading.Event()
+        self.addCleanup(release.set)
+        started = threading.Event()
+        def collect():
+            started.set()
+            return release.wait(5)
+        running = engine.submit(collect)
+        started.wait(5)
+        pending = [engine.submit(lambda: None) for i in xrange(3)]
+        self.assertEqual(3, engine.cancel())
+        release.set()
+        self.assertTrue(running.result())
+        self.assertTrue(all([future.cancelled() for future in pending]))
+
+    def testSingleton(self):
+        self.assertEqual(CollectorEngine.getInstance(), CollectorEngine.getInstance())
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
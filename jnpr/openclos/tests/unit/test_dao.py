@@ -8,8 +8,9 @@ from sqlalchemy import exc
 from flexmock import flexmock
 
 import jnpr.openclos.util
-from jnpr.openclos.model import Pod, Device, Interface, InterfaceDefinition, TrapGroup
+from jnpr.openclos.model import Pod, Device, Interface, InterfaceDefinition, TrapGroup, DeviceConfig
 from jnpr.openclos.dao import AbstractDao
+from jnpr.openclos.statusSink import StatusSink
 from jnpr.openclos.exception import InvalidConfiguration
 
 class TestAbstractDao(unittest.TestCase):
@@ -22,6 +23,10 @@ class InMemoryDao(AbstractDao):
         jnpr.openclos.propLoader.loadLoggingConfig(appName = 'unittest')
         return 'sqlite:///'
 
+    def _createStatusSink(self):
+        # in-memory db is per thread, status updates are written by the test's thread
+        return StatusSink(self, {'flushInterval': 0})
+
 class TestDao(unittest.TestCase):
     def setUp(self):
         self.__dao = InMemoryDao.getInstance()
@@ -36,6 +41,12 @@ class TestDao(unittest.TestCase):
         with self.assertRaises(InvalidConfiguration):
             BadDao()
 
+    def testAfterForkDropsStatusSink(self):
+        statusSink = self.__dao.getStatusSink()
+        self.assertIs(statusSink, self.__dao.getStatusSink())
+        self.__dao.afterFork()
+        self.assertIsNot(statusSink, self.__dao.getStatusSink())
+
     def testCreateObjects(self):
         from test_model import createDevice
 
@@ -52,6 +63,27 @@ class TestDao(unittest.TestCase):
             self.assertEqual(1, len(self.__dao.getObjectsByName(session, InterfaceDefinition, 'ifd1')))
             self.assertEqual(1, len(self.__dao.getObjectsByName(session, InterfaceDefinition, 'ifd2')))
         
+    def testBulkInsert(self):
+        from test_model import createDevice
+
+        with self.__dao.getReadWriteSession() as session:
+            device = createDevice(session, "test")
+            rows = [{'id': 'ifd1', 'name': 'et-0/0/0', 'sequenceNum': 100000, 'device_id': device.id, 'role': 'downlink'},
+                    {'id': 'ifd2', 'name': 'et-0/0/1', 'sequenceNum': 100001, 'device_id': device.id, 'role': 'downlink', 'deployStatus': None}]
+            self.__dao.bulkInsert(session, InterfaceDefinition, rows)
+            self.__dao.bulkUpdate(session, Interface, [{'id': 'ifd1', 'peer_id': 'ifd2'}, {'id': 'ifd2', 'peer_id': 'ifd1'}])
+
+        with self.__dao.getReadSession() as session:
+            ifds = self.__dao.getAll(session, InterfaceDefinition)
+            self.assertEqual(2, len(ifds))
+            self.assertEqual('physical', ifds[0].type)
+            self.assertEqual('downlink', ifds[0].role)
+            # column defaults are honored for missing/None values
+            self.assertEqual('provision', ifds[0].deployStatus)
+            self.assertEqual('unknown', ifds[1].status)
+            self.assertEqual('et-0/0/1', ifds[0].peer.name)
+            self.assertEqual('et-0/0/0', ifds[1].peer.name)
+
     def testDeleteNonExistingPod(self):
         dict = {'devicePassword': 'test'}
         pod = Pod('unknown', dict)
@@ -110,6 +142,110 @@ class TestDao(unittest.TestCase):
             filteredIfds = self.__dao.getConnectedInterconnectIFDsFilterFakeOnes(fakeSession, device)
             self.assertEqual(2, len(filteredIfds))
 
+    def createIfdsInTwoPods(self, session):
+        from test_model import createPod, createPodDevice
+        pod1 = createPod('pod1', session)
+        pod2 = createPod('pod2', session)
+        spine1 = createPodDevice(session, 'spine1', pod1)
+        spine2 = createPodDevice(session, 'spine2', pod1)
+        # same device name in other pod
+        otherSpine1 = createPodDevice(session, 'spine1', pod2)
+        session.add_all([InterfaceDefinition('et-0/0/0', spine1, 'downlink'), InterfaceDefinition('et-0/0/1', spine1, 'downlink'),
+                         InterfaceDefinition('et-0/0/0', spine2, 'downlink'), InterfaceDefinition('et-0/0/2', otherSpine1, 'downlink'),
+                         InterfaceDefinition('et-0/0/1', otherSpine1, 'downlink')])
+        session.commit()
+
+    def testGetIfdByDeviceNamePortName(self):
+        with self.__dao.getReadWriteSession() as session:
+            self.createIfdsInTwoPods(session)
+            ifd = self.__dao.getIfdByDeviceNamePortName(session, 'spine2', 'et-0/0/0')
+            self.assertEqual('spine2', ifd.device.name)
+            self.assertEqual('et-0/0/0', ifd.name)
+            self.assertIsNone(self.__dao.getIfdByDeviceNamePortName(session, 'spine2', 'et-0/0/1'))
+            self.assertIsNotNone(self.__dao.getIfdByDeviceNamePortName(session, 'spine1', 'et-0/0/2'))
+            # ambiguous, spine1 of both pods has it
+            self.assertIsNone(self.__dao.getIfdByDeviceNamePortName(session, 'spine1', 'et-0/0/1'))
+
+    def testGetIfdsByDeviceNamePortNames(self):
+        with self.__dao.getReadWriteSession() as session:
+            self.createIfdsInTwoPods(session)
+            self.assertEqual({}, self.__dao.getIfdsByDeviceNamePortNames(session, []))
+
+            flexmock(session).should_call('query').once()
+            ifds = self.__dao.getIfdsByDeviceNamePortNames(session, [('spine1', 'et-0/0/0'), ('spine1', 'et-0/0/1'), ('spine2', 'et-0/0/0'), 
+                                                                     ('spine2', 'et-0/0/1'), ('spine1', 'et-0/0/2'), ('leaf1', 'et-0/0/48')])
+            self.assertEqual(set([('spine1', 'et-0/0/0'), ('spine2', 'et-0/0/0'), ('spine1', 'et-0/0/2')]), set(ifds.keys()))
+            self.assertEqual('spine2', ifds[('spine2', 'et-0/0/0')].device.name)
+
+    def testGetPodByManagementIp(self):
+        from test_model import createPod
+        with self.__dao.getReadWriteSession() as session:
+            pod1 = createPod('pod1', session)
+            pod1.managementPrefix = '192.168.48.216/24'
+            pod1.updateManagementIpRange(4)
+            pod2 = createPod('pod2', session)
+            pod2.managementPrefix = '10.0.0.1/16'
+            pod2.updateManagementIpRange(300)
+            
+        with self.__dao.getReadSession() as session:
+            self.assertEqual('pod1', self.__dao.getPodByManagementIp(session, '192.168.48.216').name)
+            self.assertEqual('pod1', self.__dao.getPodByManagementIp(session, '192.168.48.219').name)
+            self.assertIsNone(self.__dao.getPodByManagementIp(session, '192.168.48.220'))
+            self.assertIsNone(self.__dao.getPodByManagementIp(session, '192.168.48.215'))
+            self.assertEqual('pod2', self.__dao.getPodByManagementIp(session, '10.0.1.44').name)
+            self.assertIsNone(self.__dao.getPodByManagementIp(session, '10.0.1.45'))
+
+    def testBackfillManagementIpRange(self):
+        from test_model import createPod, createPodDevice
+        with self.__dao.getReadWriteSession() as session:
+            pod = createPod('pod1', session)
+            pod.managementPrefix = '192.168.48.216/24'
+            for i in xrange(3):
+                createPodDevice(session, 'device%d' % (i), pod)
+            # pod of a db upgraded from before the range was added
+            pod.managementIpStart = pod.managementIpEnd = None
+            
+        with self.__dao.getReadWriteSession() as session:
+            self.assertIsNone(self.__dao.getPodByManagementIp(session, '192.168.48.218'))
+        self.__dao._backfillManagementIpRange()
+        with self.__dao.getReadSession() as session:
+            self.assertEqual('pod1', self.__dao.getPodByManagementIp(session, '192.168.48.218').name)
+            self.assertIsNone(self.__dao.getPodByManagementIp(session, '192.168.48.219'))
+
+    def testUpgradeSchema(self):
+        import os
+        import shutil
+        import tempfile
+        import sqlalchemy
+        dbDir = tempfile.mkdtemp()
+        try:
+            dbUrl = 'sqlite:///' + os.path.join(dbDir, 'old.db')
+            # deviceConfig of a db created before fingerprint/configEtag were added
+            engine = sqlalchemy.create_engine(dbUrl)
+            engine.execute('CREATE TABLE deviceConfig (device_id VARCHAR(60) NOT NULL PRIMARY KEY, config BLOB)')
+            engine.execute("INSERT INTO deviceConfig (device_id, config) VALUES ('1234', 'config')")
+            engine.execute('CREATE TABLE interface (id VARCHAR(60) NOT NULL PRIMARY KEY, name VARCHAR(100) NOT NULL, ' +
+                           'sequenceNum BIGINT NOT NULL, type VARCHAR(100), device_id VARCHAR(60) NOT NULL, peer_id VARCHAR(60), ' +
+                           'layer_below_id VARCHAR(60), deployStatus VARCHAR(9))')
+            engine.dispose()
+
+            class OldDbDao(AbstractDao):
+                def _getDbUrl(self):
+                    return dbUrl
+            dao = OldDbDao()
+            inspector = sqlalchemy.inspect(engine)
+            self.assertTrue(set(['fingerprint', 'configEtag']).issubset([column['name'] for column in inspector.get_columns('deviceConfig')]))
+            self.assertTrue('device_id_name_index' in [index['name'] for index in inspector.get_indexes('interface')])
+            with dao.getReadSession() as session:
+                deviceConfig = session.query(DeviceConfig).one()
+                self.assertEqual('config', deviceConfig.config)
+                self.assertIsNone(deviceConfig.fingerprint)
+            # already upgraded
+            OldDbDao()
+        finally:
+            engine.dispose()
+            shutil.rmtree(dbDir)
+
     @unittest.skip('manual test')        
     def testConnectionCleanup(self):
         import threading
@@ -0,0 +1,154 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import sys
+sys.path.insert(0,os.path.abspath(os.path.dirname(__file__) + '/' + '../..')) #trick to make it run from CLI
+
+import unittest
+import time
+from flexmock import flexmock
+
+from jnpr.openclos import deviceConnectionPool
+from jnpr.openclos.deviceConnectionPool import DeviceConnectionPool
+from jnpr.openclos.devicePlugin import L2DataCollector, L3DataCollector, TwoStageConfigurator
+from jnpr.openclos.exception import DeviceConnectFailed
+from jnpr.junos.exception import ConnectError
+
+class FakeConnection(object):
+    def __init__(self, host, user, password, port):
+        self.hostname = host
+        self.connected = False
+        self.healthy = True
+        self.closeCount = 0
+        self.rpc = flexmock(get_system_uptime_information = self.checkHealth)
+
+    def open(self):
+        self.connected = True
+
+    def close(self):
+        self.connected = False
+        self.closeCount += 1
+
+    def checkHealth(self):
+        if not self.healthy:
+            raise Exception('session broken')
+
+class TestDeviceConnectionPool(unittest.TestCase):
+    def setUp(self):
+        flexmock(deviceConnectionPool).should_receive('DeviceConnection').replace_with(FakeConnection)
+        self.pool = DeviceConnectionPool({'maxPerHost': 2, 'idleTimeout': 300, 'healthCheckIdle': 30, 'borrowTimeout': 0})
+
+    def tearDown(self):
+        self.pool.closeAll()
+
+    def testReuseSameKey(self):
+        connection = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.pool.release(connection)
+        self.assertEqual(connection, self.pool.borrow('1.2.3.4', 'root', 'abcd1234'))
+        self.assertEqual(0, connection.closeCount)
+        stats = self.pool.getStats()
+        self.assertEqual(1, stats['opened'])
+        self.assertEqual(1, stats['reused'])
+        self.assertEqual(1, stats['borrowed'])
+
+    def testDifferentCredentialsDoNotShare(self):
+        connection = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.pool.release(connection)
+        other = self.pool.borrow('1.2.3.4', 'root', 'changed')
+        self.assertNotEqual(connection, other)
+        self.assertEqual(2, self.pool.getStats()['opened'])
+
+    def testMaxPerHost(self):
+        self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        second = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        with self.assertRaises(DeviceConnectFailed):
+            self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        # other host is not limited
+        self.pool.borrow('1.2.3.5', 'root', 'abcd1234')
+
+        self.pool.release(second)
+        self.assertEqual(second, self.pool.borrow('1.2.3.4', 'root', 'abcd1234'))
+
+    def testNotReusableConnectionFreesSlot(self):
+        first = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.pool.release(first, reusable = False)
+        self.assertEqual(1, first.closeCount)
+        third = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.assertNotEqual(first, third)
+        self.assertEqual(0, self.pool.getStats()['idle'])
+
+    def testIdleTimeout(self):
+        connection = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.pool.release(connection)
+        self.pool._idle.values()[0][0].lastUsed = time.time() - 301
+
+        other = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.assertNotEqual(connection, other)
+        self.assertEqual(1, connection.closeCount)
+
+    def testIdleTimeoutWithoutBorrow(self):
+        self.pool.reapInterval = 0.05
+        connection = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.pool.release(connection)
+        self.pool._idle.values()[0][0].lastUsed = time.time() - 301
+
+        deadline = time.time() + 5
+        while connection.closeCount == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(1, connection.closeCount)
+        self.assertEqual(0, self.pool.getStats()['idle'])
+        self.assertIsNone(self.pool._reaper)
+
+    def testHealthCheck(self):
+        connection = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.pool.release(connection)
+        self.pool._idle.values()[0][0].lastUsed = time.time() - 31
+        self.assertEqual(connection, self.pool.borrow('1.2.3.4', 'root', 'abcd1234'))
+
+        self.pool.release(connection)
+        self.pool._idle.values()[0][0].lastUsed = time.time() - 31
+        connection.healthy = False
+        other = self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        self.assertNotEqual(connection, other)
+        self.assertEqual(1, connection.closeCount)
+
+    def testConnectErrorFreesSlot(self):
+        flexmock(FakeConnection).should_receive('open').and_raise(ConnectError(flexmock(hostname = '1.2.3.4')))
+        for i in xrange(3):
+            with self.assertRaises(DeviceConnectFailed) as de:
+                self.pool.borrow('1.2.3.4', 'root', 'abcd1234')
+            self.assertTrue(isinstance(de.exception.cause, ConnectError))
+        self.assertEqual({}, self.pool._hostCount)
+
+    def testDisabled(self):
+        pool = DeviceConnectionPool({'enabled': False})
+        connection = pool.borrow('1.2.3.4', 'root', 'abcd1234')
+        pool.release(connection)
+        self.assertEqual(1, connection.closeCount)
+        self.assertEqual(0, pool.getStats()['idle'])
+
+    def testCollectorsUsePool(self):
+        conf = {'deviceFamily': {}}
+        self.assertEqual(DeviceConnectionPool.getInstance(), L2DataCollector('1234', conf).connectionPool)
+        self.assertEqual(DeviceConnectionPool.getInstance(), L3DataCollector('1234', conf).connectionPool)
+        self.assertIsNone(TwoStageConfigurator('1.2.3.4', conf).connectionPool)
+
+    def testCollectorReleasesConnection(self):
+        collector = L2DataCollector('1234', {'deviceFamily': {}})
+        collector.connectionPool = self.pool
+        collector.device = flexmock(id = '1234', managementIp = '1.2.3.4/24', username = 'root', encryptedPassword = 'x',
+                                    getCleartextPassword = lambda: 'abcd1234')
+        connection = collector.connectToDevice()
+        collector.releaseDeviceConnection()
+        self.assertIsNone(collector.deviceConnectionHandle)
+        self.assertEqual(connection, collector.connectToDevice())
+
+        collector.deviceConnectionReusable = False
+        collector.releaseDeviceConnection()
+        self.assertEqual(1, connection.closeCount)
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
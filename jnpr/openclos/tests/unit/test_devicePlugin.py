@@ -5,8 +5,9 @@ Created on Oct 30, 2014
 '''
 import unittest
 
-from jnpr.openclos.devicePlugin import DeviceDataCollectorNetconf, L2DataCollector, L3DataCollector, DeviceOperationInProgressCache, TwoStageConfigurator 
-from jnpr.openclos.exception import DeviceConnectFailed, DeviceRpcFailed
+from jnpr.openclos.devicePlugin import DeviceDataCollectorNetconf, L2DataCollector, L3DataCollector, HealthDataCollector, DeviceOperationInProgressCache, TwoStageConfigurator 
+from jnpr.openclos import devicePlugin
+from jnpr.openclos.exception import DeviceConnectFailed, DeviceRpcFailed, HealthDataCollectionFailed
 from jnpr.openclos.model import Device, InterfaceDefinition, InterfaceLogical, BgpLink
 from jnpr.openclos import propLoader
 from test_dao import InMemoryDao 
@@ -15,6 +16,14 @@ from jnpr.junos.exception import ConnectError
 
 from flexmock import flexmock
 
+def writeStatusUpdates(dataCollector, session):
+    '''
+    Writes status updates of dataCollector, as the report does once collectors are done
+    '''
+    dataCollector.submitStatusUpdates()
+    dataCollector._dao.getStatusSink().flush()
+    session.expire_all()
+
 class TestDeviceDataCollectorNetconf(unittest.TestCase):
     def setUp(self):
         self._dao = InMemoryDao.getInstance()
@@ -50,6 +59,16 @@ class TestDeviceDataCollectorNetconf(unittest.TestCase):
         self.assertIsNotNone(de.exception.cause)
         self.assertTrue(issubclass(type(de.exception.cause), ConnectError))
 
+class TestJunosEzTable(unittest.TestCase):
+    def testTableLoadedOnce(self):
+        devicePlugin.junosEzTables.clear()
+        flexmock(devicePlugin).should_call('loadyaml').once()
+        lldpTable = devicePlugin.getJunosEzTable('lldp.yaml', 'LLDPNeighborTable')
+        self.assertEqual(lldpTable, devicePlugin.getJunosEzTable('lldp.yaml', 'LLDPNeighborTable'))
+        self.assertEqual('LLDPNeighborTable', lldpTable.__name__)
+        # views of the same file come from the same load
+        self.assertIsNotNone(devicePlugin.getJunosEzTable('lldp.yaml', 'LLDPNeighborView'))
+
 class TestL2DataCollector(unittest.TestCase):
 
     def setUp(self):
@@ -80,6 +99,7 @@ class TestL2DataCollector(unittest.TestCase):
             dataCollector._session = session
 
             dataCollector.updateDeviceL2Status("processing")
+            writeStatusUpdates(dataCollector, session)
             self.assertEqual(leaf.l2Status, "processing")
             self.assertIsNone(leaf.l2StatusReason)
 
@@ -92,6 +112,7 @@ class TestL2DataCollector(unittest.TestCase):
             dataCollector._session = session
 
             dataCollector.updateDeviceL2Status(None, error = DeviceRpcFailed("", cause=ValueError("test error")))
+            writeStatusUpdates(dataCollector, session)
             self.assertEqual("error", leaf.l2Status)
             self.assertEqual("test error", leaf.l2StatusReason)
 
@@ -104,6 +125,7 @@ class TestL2DataCollector(unittest.TestCase):
             dataCollector._session = session
 
             dataCollector.updateDeviceL2Status("error", "test reason")
+            writeStatusUpdates(dataCollector, session)
             self.assertEqual("error", leaf.l2Status)
             self.assertEqual("test reason", leaf.l2StatusReason)
 
@@ -335,6 +357,16 @@ class TestTwoStageConfigurator(TestL2DataCollector):
     def testCollectLldpAndMatchDevice(self):
         self.configurator.collectLldpAndMatchDevice()
 
+    def testFindPodByMgmtIp(self):
+        with self._dao.getReadWriteSession() as session:
+            from test_model import createPod
+            pod = createPod('pod1', session)
+            pod.managementPrefix = '192.168.48.216/25'
+            pod.updateManagementIpRange(4)
+
+        self.assertEqual('pod1', self.configurator.findPodByMgmtIp('192.168.48.219').name)
+        self.assertIsNone(self.configurator.findPodByMgmtIp('192.168.48.220'))
+
     def testFilterUplinkAppendRemotePortIfd(self):
         with self._dao.getReadSession() as session:
             IFDs = self.createTwoSpineTwoLeaf(session)
@@ -716,6 +748,7 @@ class TestL3DataCollector(unittest.TestCase):
             dataCollector._session = session
 
             dataCollector.updateDeviceL3Status("processing")
+            writeStatusUpdates(dataCollector, session)
             self.assertEqual(leaf.l3Status, "processing")
             self.assertIsNone(leaf.l3StatusReason)
 
@@ -728,6 +761,7 @@ class TestL3DataCollector(unittest.TestCase):
             dataCollector._session = session
 
             dataCollector.updateDeviceL3Status(None, error = DeviceRpcFailed("", cause=ValueError("test error")))
+            writeStatusUpdates(dataCollector, session)
             self.assertEqual("error", leaf.l3Status)
             self.assertEqual("test error", leaf.l3StatusReason)
 
@@ -740,6 +774,7 @@ class TestL3DataCollector(unittest.TestCase):
             dataCollector._session = session
 
             dataCollector.updateDeviceL3Status("error", "test reason")
+            writeStatusUpdates(dataCollector, session)
             self.assertEqual("error", leaf.l3Status)
             self.assertEqual("test reason", leaf.l3StatusReason)
 
@@ -761,11 +796,74 @@ class TestL3DataCollector(unittest.TestCase):
             bgpLinks = [{'device1': 'leaf1', 'device1as1': 401, 'device1Ip': '192.169.0.3+179', 'device2': None, 'device2as': 300, 'device2Ip': '192.169.0.2+57574', 'inputMsgCount': 16764, 'outputMsgCount': 16811, 'outQueueCount': 0 , 'linkState' : 'Established', 'active/receive/acceptCount': '3/3/3'},
                         {'device1': 'leaf1', 'device1as1': 401, 'device1Ip': '192.169.0.11+179', 'device2': None, 'device2as': 301, 'device2Ip': '192.169.0.10+49383','inputMsgCount': 16816, 'outputMsgCount': 16810, 'outQueueCount': 0 , 'linkState' : 'Established', 'active/receive/acceptCount': '2/2/2'}]
             dataCollector.persistBgpLinks(bgpLinks)
+            writeStatusUpdates(dataCollector, session)
 
             bgpLinks = session.query(BgpLink).filter(BgpLink.device_id == device_id).all()
             self.assertEqual('192.169.0.3+179', bgpLinks[0].device1Ip)
             self.assertEqual('192.169.0.11+179', bgpLinks[1].device1Ip)
 
+class TestHealthDataCollector(unittest.TestCase):
+
+    def setUp(self):
+        self._dao = InMemoryDao.getInstance()
+        with self._dao.getReadWriteSession() as session:
+            from test_model import createPod
+            pod = createPod('pod1', session)
+            spine = Device("spine1", "qfx5100-24q-2p", "root", "abcd1234", "spine", "11:12:13:14:15:17", "1.2.3.5/24", pod)
+            spine.asn = 300
+            leaf = Device("leaf1", "qfx5100-48s-6q", "root", "abcd1234", "leaf", "11:12:13:14:15:16", "1.2.3.4/24", pod)
+            session.add_all([spine, leaf])
+            session.flush()
+            self.leafId = leaf.id
+            self.deviceAsn2NameMap = {300: spine}
+        
+    def tearDown(self):
+        self._dao = None
+        InMemoryDao._destroy()
+
+    def createCollector(self, lldpData = {}, bgpLinks = []):
+        dataCollector = HealthDataCollector(self.leafId, {}, InMemoryDao, self.deviceAsn2NameMap)
+        flexmock(dataCollector).should_receive('connectToDevice').once()
+        flexmock(dataCollector.l2DataCollector).should_receive('collectLldpFromDevice').and_return(lldpData)
+        flexmock(dataCollector.l3DataCollector).should_receive('collectBgpFromDevice').and_return(bgpLinks)
+        # results of both collectors are written by the status sink, not per update
+        flexmock(self._dao).should_receive('updateObjectsAndCommitNow').never()
+        flexmock(self._dao).should_receive('createObjectsAndCommitNow').never()
+        return dataCollector
+
+    def testStartHealthReport(self):
+        bgpLinks = [{'device1': 'leaf1', 'device1as': 401, 'device1Ip': '192.169.0.3', 'device2': 'spine1', 'device2as': 300, 'device2Ip': '192.169.0.2',
+                     'inputMsgCount': 16764, 'outputMsgCount': 16811, 'outQueueCount': 0 , 'linkState' : 'Established', 'activeReceiveAcceptCount': '3/3/3', 'flapCount': 0}]
+        with self._dao.getReadSession() as session:
+            bgpLinks[0]['device2Obj'] = session.query(Device).filter(Device.name == 'spine1').one()
+            dataCollector = self.createCollector(bgpLinks = bgpLinks)
+            dataCollector.startHealthReport()
+        self._dao.getStatusSink().flush()
+
+        with self._dao.getReadSession() as session:
+            leaf = session.query(Device).filter(Device.id == self.leafId).one()
+            spine = session.query(Device).filter(Device.name == 'spine1').one()
+            # no uplink is connected
+            self.assertEqual('error', leaf.l2Status)
+            self.assertEqual('good', leaf.l3Status)
+            self.assertEqual('good', spine.l3Status)
+            self.assertEqual(1, session.query(BgpLink).filter(BgpLink.device_id == self.leafId).count())
+
+    def testStartHealthReportL2FailureDoesNotSkipL3(self):
+        dataCollector = self.createCollector()
+        dataCollector.l2DataCollector.should_receive('collectLldpFromDevice').and_raise(DeviceRpcFailed('LLDPNeighborTable', ValueError('test error')))
+
+        with self.assertRaises(HealthDataCollectionFailed):
+            dataCollector.startHealthReport()
+        self._dao.getStatusSink().flush()
+
+        with self._dao.getReadSession() as session:
+            leaf = session.query(Device).filter(Device.id == self.leafId).one()
+            self.assertEqual('error', leaf.l2Status)
+            self.assertEqual('good', leaf.l3Status)
+        self.assertFalse(dataCollector.l2DataCollector.collectionInProgressCache.isDeviceInProgress(self.leafId))
+        self.assertFalse(dataCollector.l3DataCollector.collectionInProgressCache.isDeviceInProgress(self.leafId))
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
@@ -0,0 +1,124 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import sys
+sys.path.insert(0,os.path.abspath(os.path.dirname(__file__) + '/' + '../..')) #trick to make it run from CLI
+
+import unittest
+import shutil
+from sqlalchemy import event
+
+from jnpr.openclos.l3Clos import L3ClosMediation
+from jnpr.openclos.fabricIndex import FabricIndex
+from jnpr.openclos.model import Pod, Device, InterfaceDefinition, InterfaceLogical, BgpLink
+from test_dao import InMemoryDao
+from test_l3Clos import getPodDict
+
+class TestFabricIndex(unittest.TestCase):
+    def setUp(self):
+        self._conf = {}
+        self._conf['outputDir'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'out')
+        self._conf['deviceFamily'] = {
+            "qfx5100-24q-2p": {
+                "ports": 'et-0/0/[0-23]'
+            },
+            "qfx5100-48s-6q": {
+                "uplinkPorts": 'et-0/0/[48-53]',
+                "downlinkPorts": 'xe-0/0/[0-47]'
+            }
+        }
+        self._dao = InMemoryDao.getInstance()
+        self.l3ClosMediation = L3ClosMediation(self._conf, InMemoryDao)
+        self.podId = self.l3ClosMediation.createPod('pod1', getPodDict()).id
+
+    def tearDown(self):
+        shutil.rmtree(self._conf['outputDir'], ignore_errors=True)
+        InMemoryDao._destroy()
+        self.l3ClosMediation = None
+
+    def countSelects(self, session):
+        statements = []
+        def beforeExecute(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT'):
+                statements.append(statement)
+        event.listen(session.get_bind(), 'before_cursor_execute', beforeExecute)
+        self.addCleanup(event.remove, session.get_bind(), 'before_cursor_execute', beforeExecute)
+        return statements
+
+    def testIndexMatchesQueries(self):
+        with self._dao.getReadSession() as session:
+            pod = session.query(Pod).one()
+            fabricIndex = FabricIndex(session, pod)
+            self.assertEqual(5, len(pod.devices))
+            for device in pod.devices:
+                self.assertEqual(device, fabricIndex.getDevice(device.id))
+                lo0 = session.query(InterfaceLogical).filter(InterfaceLogical.device_id == device.id).filter(InterfaceLogical.name == 'lo0.0').one()
+                self.assertEqual(lo0, fabricIndex.getIfl(device.id, 'lo0.0'))
+
+                expected = self._dao.getConnectedInterconnectIFDsFilterFakeOnes(session, device)
+                actual = fabricIndex.getConnectedInterconnectIFDsFilterFakeOnes(device)
+                self.assertEqual([ifd.id for ifd in expected], [ifd.id for ifd in actual])
+                for ifd in actual:
+                    self.assertEqual(ifd.peer, fabricIndex.getPeer(ifd))
+                    self.assertEqual(ifd.layerAboves, fabricIndex.getLayerAboves(ifd))
+
+            spine = session.query(Device).filter(Device.role == 'spine').first()
+            downlinks = fabricIndex.getIfds(spine.id, 'downlink')
+            self.assertEqual(session.query(InterfaceDefinition).filter(InterfaceDefinition.device_id == spine.id).filter(InterfaceDefinition.role == 'downlink').count(), len(downlinks))
+            self.assertEqual(sorted([ifd.sequenceNum for ifd in downlinks]), [ifd.sequenceNum for ifd in downlinks])
+            self.assertIsNone(fabricIndex.getIfl(spine.id, 'irb.1'))
+
+    def testConstantNumberOfQueries(self):
+        with self._dao.getReadSession() as session:
+            pod = session.query(Pod).one()
+            devices = list(pod.devices)
+            statements = self.countSelects(session)
+            fabricIndex = FabricIndex(session, pod)
+            for device in devices:
+                fabricIndex.getIfl(device.id, 'lo0.0')
+                for ifd in fabricIndex.getConnectedInterconnectIFDsFilterFakeOnes(device):
+                    peer = fabricIndex.getPeer(ifd)
+                    fabricIndex.getLayerAboves(peer)
+                    fabricIndex.getDevice(peer.device_id)
+                fabricIndex.getBgpLinks(device.id)
+            # devices, IFDs, IFLs and BgpLinks
+            self.assertEqual(4, len(statements))
+
+    def testIndexForSelectedDevices(self):
+        with self._dao.getReadSession() as session:
+            pod = session.query(Pod).one()
+            leaf = session.query(Device).filter(Device.name == 'leaf-01').one()
+            fabricIndex = FabricIndex(session, pod, [leaf.id])
+
+            self.assertIsNotNone(fabricIndex.getIfl(leaf.id, 'irb.1'))
+            ports = fabricIndex.getConnectedInterconnectIFDsFilterFakeOnes(leaf)
+            self.assertEqual(2, len(ports))
+            for port in ports:
+                peer = fabricIndex.getPeer(port)
+                self.assertEqual(port.peer, peer)
+                self.assertEqual('spine', fabricIndex.getDevice(peer.device_id).role)
+                self.assertEqual(1, len(fabricIndex.getLayerAboves(peer)))
+
+            # devices/IFLs not connected to the leaf are not loaded
+            leaf2 = session.query(Device).filter(Device.name == 'leaf-02').one()
+            self.assertIsNone(fabricIndex.getDevice(leaf2.id))
+            self.assertIsNone(fabricIndex.getIfl(leaf2.id, 'lo0.0'))
+
+    def testGetBgpLinks(self):
+        with self._dao.getReadWriteSession() as session:
+            pod = session.query(Pod).one()
+            leaf = session.query(Device).filter(Device.name == 'leaf-01').one()
+            self._dao.createObjects(session, [BgpLink(pod.id, leaf.id, {'device1': 'leaf-01', 'device2': 'spine-01'})])
+
+        with self._dao.getReadSession() as session:
+            pod = session.query(Pod).one()
+            leaf = session.query(Device).filter(Device.name == 'leaf-01').one()
+            fabricIndex = FabricIndex(session, pod)
+            self.assertEqual(1, len(fabricIndex.getBgpLinks(leaf.id)))
+            self.assertEqual('spine-01', fabricIndex.getBgpLinks(leaf.id)[0].device2)
+            self.assertEqual([], fabricIndex.getBgpLinks('unknown'))
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
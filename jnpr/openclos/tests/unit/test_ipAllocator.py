@@ -0,0 +1,44 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import sys
+sys.path.insert(0,os.path.abspath(os.path.dirname(__file__) + '/' + '../..')) #trick to make it run from CLI
+
+import unittest
+import itertools
+from netaddr import IPNetwork
+
+from jnpr.openclos import ipAllocator
+
+class TestIpAllocator(unittest.TestCase):
+    def testIterHostsSameAsNetaddr(self):
+        for cidr in ['10.0.0.0/24', '10.0.0.0/30', '10.0.0.0/31', '10.0.0.5/32', '192.168.48.0/22']:
+            block = IPNetwork(cidr)
+            expected = [str(ip) for ip in block.iter_hosts()]
+            self.assertEqual(expected, list(ipAllocator.iterHosts(block)))
+            self.assertEqual(len(expected), ipAllocator.hostCount(block))
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], list(ipAllocator.iterHosts('10.0.0.0/30')))
+
+    def testIterFirstHostOfSubnets(self):
+        block = IPNetwork('172.16.0.0/22')
+        for prefixlen in [24, 26, 30, 31]:
+            expected = ['%s/%d' % (subnet.iter_hosts().next(), prefixlen) for subnet in block.subnet(prefixlen)]
+            self.assertEqual(expected, list(ipAllocator.iterFirstHostOfSubnets(block, prefixlen)))
+        # subnet larger than block
+        self.assertEqual([], list(ipAllocator.iterFirstHostOfSubnets(block, 20)))
+
+    def testIterPointToPointSubnets(self):
+        block = IPNetwork('192.168.0.0/29')
+        self.assertEqual([('192.168.0.0/31', '192.168.0.1/31'), ('192.168.0.2/31', '192.168.0.3/31'), 
+                          ('192.168.0.4/31', '192.168.0.5/31'), ('192.168.0.6/31', '192.168.0.7/31')], 
+                         list(ipAllocator.iterPointToPointSubnets(block)))
+
+    def testLazy(self):
+        # a /8 would be 8M addresses if materialised
+        hosts = ipAllocator.iterHosts('10.0.0.0/8')
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], list(itertools.islice(hosts, 2)))
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,105 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import sys
+sys.path.insert(0,os.path.abspath(os.path.dirname(__file__) + '/' + '../..')) #trick to make it run from CLI
+
+import unittest
+from netaddr import IPAddress
+
+from jnpr.openclos.ipam import Ipam
+from jnpr.openclos.ipAllocator import ipToString
+from jnpr.openclos.model import IpAllocation
+from jnpr.openclos.exception import InsufficientLoopbackIp, InsufficientInterconnectIp
+from test_dao import InMemoryDao
+from test_model import createPod
+
+class TestIpam(unittest.TestCase):
+    def setUp(self):
+        self._dao = InMemoryDao.getInstance()
+        self.ipam = Ipam(self._dao)
+        with self._dao.getReadWriteSession() as session:
+            self.podId = createPod('pod1', session).id
+
+    def tearDown(self):
+        self._dao = None
+        InMemoryDao._destroy()
+
+    def allocate(self, pool, prefix, prefixlen, owners):
+        with self._dao.getReadWriteSession() as session:
+            return [ipToString(ip) for ip in self.ipam.allocate(session, self.podId, pool, prefix, prefixlen, owners)]
+
+    def testAllocateLoopback(self):
+        ips = self.allocate('loopback', '10.0.0.0/24', 32, [('d1', None), ('d2', None), ('d3', None)])
+        self.assertEqual(['10.0.0.1', '10.0.0.2', '10.0.0.3'], ips)
+
+        with self._dao.getReadSession() as session:
+            allocations = self.ipam.getAllocations(session, self.podId, 'loopback')
+            self.assertEqual([1, 2, 3], [allocation.offset for allocation in allocations])
+            self.assertEqual('10.0.0.2/32', allocations[1].ipaddress)
+            self.assertEqual('d2', allocations[1].device_id)
+            self.assertEqual(3, self.ipam.getHighWaterMark(session, self.podId, 'loopback'))
+            
+    def testAllocateSubnets(self):
+        ips = self.allocate('interconnect', '192.168.0.0/24', 31, [('s1', 'l1'), ('s1', 'l2')])
+        self.assertEqual(['192.168.0.0', '192.168.0.2'], ips)
+        ips = self.allocate('irb', '172.16.0.0/22', 24, [('l1', None), ('l2', None)])
+        self.assertEqual(['172.16.0.0', '172.16.1.0'], ips)
+
+    def testFreedReusedLowestFirst(self):
+        self.allocate('loopback', '10.0.0.0/24', 32, [('d1', None), ('d2', None), ('d3', None), ('d4', None)])
+        with self._dao.getReadWriteSession() as session:
+            self.assertEqual(2, self.ipam.free(session, self.podId, ['d3', 'd2']))
+
+        ips = self.allocate('loopback', '10.0.0.0/24', 32, [('d5', None), ('d6', None), ('d7', None)])
+        self.assertEqual(['10.0.0.2', '10.0.0.3', '10.0.0.5'], ips)
+        with self._dao.getReadSession() as session:
+            allocations = self.ipam.getAllocations(session, self.podId, 'loopback')
+            self.assertEqual(['d1', 'd5', 'd6', 'd4', 'd7'], [allocation.device_id for allocation in allocations])
+            self.assertEqual(0, session.query(IpAllocation).filter(IpAllocation.state == 'free').count())
+
+    def testFreeByPeerDevice(self):
+        self.allocate('interconnect', '192.168.0.0/24', 31, [('s1', 'l1'), ('s1', 'l2'), ('s2', 'l1'), ('s2', 'l2')])
+        with self._dao.getReadWriteSession() as session:
+            self.assertEqual(2, self.ipam.free(session, self.podId, ['l2']))
+            self.assertEqual(0, self.ipam.free(session, self.podId, []))
+        with self._dao.getReadSession() as session:
+            self.assertEqual(['s1', 's2'], [allocation.device_id for allocation in self.ipam.getAllocations(session, self.podId, 'interconnect', 'l1')])
+
+    def testInsufficientIp(self):
+        # /29: 6 hosts
+        self.allocate('loopback', '10.0.0.0/29', 32, [('d%d' % (i), None) for i in xrange(5)])
+        with self.assertRaises(InsufficientLoopbackIp):
+            self.allocate('loopback', '10.0.0.0/29', 32, [('d5', None), ('d6', None)])
+        self.assertEqual(['10.0.0.6'], self.allocate('loopback', '10.0.0.0/29', 32, [('d5', None)]))
+
+        with self.assertRaises(InsufficientInterconnectIp):
+            self.allocate('interconnect', '192.168.0.0/30', 31, [('s1', 'l1'), ('s1', 'l2'), ('s1', 'l3')])
+
+    def testImportAllocations(self):
+        units = [(int(IPAddress(ip)), device, None) for ip, device in [('10.0.0.1', 'd1'), ('10.0.0.2', 'd2'), ('10.0.0.4', 'd4'), 
+                                                                         ('10.0.0.4', 'd5'), ('10.1.0.1', 'd6')]]
+        with self._dao.getReadWriteSession() as session:
+            self.assertEqual(3, self.ipam.importAllocations(session, self.podId, 'loopback', '10.0.0.0/24', 32, units))
+            self.assertEqual(4, self.ipam.getHighWaterMark(session, self.podId, 'loopback'))
+        # free unit below the high-water mark is reused first
+        self.assertEqual(['10.0.0.3', '10.0.0.5'], self.allocate('loopback', '10.0.0.0/24', 32, [('d7', None), ('d8', None)]))
+
+        # any address of the unit, irb leaf address is first host of its subnet
+        with self._dao.getReadWriteSession() as session:
+            self.assertEqual(1, self.ipam.importAllocations(session, self.podId, 'irb', '172.16.0.0/22', 24, [(int(IPAddress('172.16.1.1')), 'l1', None)]))
+            self.assertEqual(['172.16.0.0/24', '172.16.1.0/24'], [allocation.ipaddress for allocation in self.ipam.getAllocations(session, self.podId, 'irb')])
+
+    def testReleasePod(self):
+        self.allocate('loopback', '10.0.0.0/24', 32, [('d1', None)])
+        self.allocate('irb', '172.16.0.0/22', 24, [('d1', None)])
+        with self._dao.getReadWriteSession() as session:
+            self.ipam.releasePod(session, self.podId)
+        with self._dao.getReadSession() as session:
+            self.assertEqual(0, session.query(IpAllocation).count())
+            self.assertIsNone(self.ipam.getHighWaterMark(session, self.podId, 'loopback'))
+        
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -11,9 +11,9 @@ import unittest
 import shutil
 from flexmock import flexmock
 from jnpr.openclos.l3Clos import L3ClosMediation
-from jnpr.openclos.model import Pod, Device, InterfaceLogical, InterfaceDefinition, TrapGroup
+from jnpr.openclos.model import Pod, Device, Interface, InterfaceLogical, InterfaceDefinition, TrapGroup, IpAllocation
 from test_dao import InMemoryDao 
-from jnpr.openclos.exception import PodNotFound
+from jnpr.openclos.exception import PodNotFound, CapacityCannotChange
 
 def getPodDict():
     return {"devicePassword": "abcd1234", "leafCount": 3, "leafSettings": [{"deviceType":"qfx5100-48s-6q"}], 
@@ -86,12 +86,179 @@ class TestL3Clos(unittest.TestCase):
         with self._dao.getReadSession() as session:
             pod = session.query(Pod).one()
             self.assertEqual(5, len(pod.devices))
+            # management ip range follows device count
+            self.assertEqual(pod, self._dao.getPodByManagementIp(session, '192.168.48.220'))
+            self.assertIsNone(self._dao.getPodByManagementIp(session, '192.168.48.221'))
             deployCount = 0
             for device in pod.devices:
                 if device.deployStatus == "deploy":
                     deployCount += 1
             self.assertEqual(2, deployCount)
 
+    def getPodSnapshot(self, session, podId):
+        pod = session.query(Pod).filter(Pod.id == podId).one()
+        devices = set()
+        for device in pod.devices:
+            devices.add((device.name, device.role, device.family, device.username, device.getCleartextPassword(), device.macAddress, 
+                         device.serialNumber, device.deployStatus, device.managementIp, device.asn))
+        interfaces = set()
+        for interface in session.query(Interface).join(Device).filter(Device.pod_id == podId).all():
+            peer = (interface.peer.device.name, interface.peer.name) if interface.peer is not None else None
+            layerBelow = interface.layer_below_id
+            if layerBelow is not None:
+                layerBelow = session.query(Interface).filter(Interface.id == layerBelow).one().name
+            interfaces.add((interface.device.name, interface.name, interface.type, interface.sequenceNum, interface.deployStatus,
+                            getattr(interface, 'role', None), getattr(interface, 'ipaddress', None), peer, layerBelow))
+        allocation = (pod.allocatedLoopbackBlock, pod.allocatedIrbBlock, pod.allocatedInterConnectBlock, pod.allocatedSpineAS, pod.allocatefLeafAS)
+        return (devices, interfaces, allocation)
+        
+    def testCreatePodBulkMatchesOrmBuild(self):
+        podDict = getPodDict()
+        ormPod = self.l3ClosMediation.createPod('pod1', podDict)
+
+        self._conf['bulkPodBuild'] = True
+        self.l3ClosMediation = L3ClosMediation(self._conf, InMemoryDao)
+        bulkPod = self.l3ClosMediation.createPod('pod2', getPodDict())
+
+        with self._dao.getReadSession() as session:
+            ormSnapshot = self.getPodSnapshot(session, ormPod.id)
+            bulkSnapshot = self.getPodSnapshot(session, bulkPod.id)
+            self.assertEqual(5, len(bulkSnapshot[0]))
+            self.assertEqual(ormSnapshot, bulkSnapshot)
+            for podId in [ormPod.id, bulkPod.id]:
+                allocations = session.query(IpAllocation).filter(IpAllocation.pod_id == podId)
+                self.assertEqual(5, allocations.filter(IpAllocation.pool == 'loopback').count())
+                self.assertEqual(3, allocations.filter(IpAllocation.pool == 'irb').count())
+                self.assertEqual(6, allocations.filter(IpAllocation.pool == 'interconnect').count())
+
+    def testUpdatePodRebuildBulk(self):
+        self._conf['bulkPodBuild'] = True
+        self.l3ClosMediation = L3ClosMediation(self._conf, InMemoryDao)
+        podDict = getPodDict()
+        pod = self.l3ClosMediation.createPod('pod1', podDict)
+        
+        podDict['loopbackPrefix'] = '10.0.1.0/24'
+        self.l3ClosMediation.updatePod(pod.id, podDict)
+
+        with self._dao.getReadSession() as session:
+            pod = session.query(Pod).one()
+            self.assertEqual(5, len(pod.devices))
+            self.assertEqual('10.0.1.0/29', pod.allocatedLoopbackBlock)
+            self.assertEqual(5, session.query(InterfaceLogical).filter(InterfaceLogical.name == 'lo0.0').count())
+
+    def getScaleInventory(self, spineNames, leafNames):
+        return {"spines": [{"name": name} for name in spineNames], 
+                "leafs": [{"name": name, "family": "qfx5100-48s-6q"} for name in leafNames]}
+
+    def getIfl(self, session, deviceName, name):
+        return session.query(InterfaceLogical).join(Device).filter(InterfaceLogical.name == name).filter(Device.name == deviceName).one()
+
+    def testScaleOutLeaf(self):
+        podDict = getPodDict()
+        pod = self.l3ClosMediation.createPod('pod1', podDict, self.getScaleInventory(['spine-01', 'spine-02'], ['leaf-01', 'leaf-02', 'leaf-03']))
+        self.l3ClosMediation.createDeviceConfig(pod.id)
+        with self._dao.getReadSession() as session:
+            deviceIds = set([device.id for device in session.query(Device).all()])
+        
+        podDict['leafCount'] = 4
+        self.l3ClosMediation.updatePod(pod.id, podDict, self.getScaleInventory(['spine-01', 'spine-02'], ['leaf-01', 'leaf-02', 'leaf-03', 'leaf-04']))
+
+        with self._dao.getReadWriteSession() as session:
+            pod = session.query(Pod).one()
+            self.assertEqual(6, len(pod.devices))
+            leaf = session.query(Device).filter(Device.name == 'leaf-04').one()
+            self.assertEqual(deviceIds, set([device.id for device in pod.devices if device.name != 'leaf-04']))
+            self.assertEqual('10.0.0.6/32', self.getIfl(session, 'leaf-04', 'lo0.0').ipaddress)
+            self.assertEqual('172.16.3.1/24', self.getIfl(session, 'leaf-04', 'irb.1').ipaddress)
+            self.assertEqual('192.168.0.12/31', self.getIfl(session, 'spine-01', 'et-0/0/3.0').ipaddress)
+            self.assertEqual('192.168.0.13/31', self.getIfl(session, 'leaf-04', 'et-0/0/48.0').ipaddress)
+            self.assertEqual('192.168.0.15/31', self.getIfl(session, 'leaf-04', 'et-0/0/49.0').ipaddress)
+            self.assertEqual(203, leaf.asn)
+            self.assertEqual('192.168.48.221/24', leaf.managementIp)
+            self.assertEqual(('10.0.0.0/29', '172.16.0.0/22', '192.168.0.0/28', 101, 203), 
+                             (pod.allocatedLoopbackBlock, pod.allocatedIrbBlock, pod.allocatedInterConnectBlock, pod.allocatedSpineAS, pod.allocatefLeafAS))
+            self.assertEqual(pod, self._dao.getPodByManagementIp(session, '192.168.48.221'))
+            
+            # existing leaves are not touched
+            self.assertEqual({'regenerated': 3, 'reused': 3}, self.l3ClosMediation.generateConfig(session, pod))
+
+    def testScaleInThenOutReusesSlot(self):
+        podDict = getPodDict()
+        pod = self.l3ClosMediation.createPod('pod1', podDict, self.getScaleInventory(['spine-01', 'spine-02'], ['leaf-01', 'leaf-02', 'leaf-03']))
+        
+        podDict['leafCount'] = 2
+        self.l3ClosMediation.updatePod(pod.id, podDict, self.getScaleInventory(['spine-01', 'spine-02'], ['leaf-01', 'leaf-03']))
+        with self._dao.getReadSession() as session:
+            self.assertEqual(4, session.query(Device).count())
+            spinePort = session.query(InterfaceDefinition).join(Device).filter(InterfaceDefinition.name == 'et-0/0/1').filter(Device.name == 'spine-01').one()
+            self.assertIsNone(spinePort.peer)
+            self.assertEqual([], spinePort.layerAboves)
+            self.assertEqual(4, session.query(IpAllocation).filter(IpAllocation.state == 'free').count())
+            self.assertEqual('10.0.0.0/29', session.query(Pod).one().allocatedLoopbackBlock)
+
+        podDict['leafCount'] = 3
+        self.l3ClosMediation.updatePod(pod.id, podDict, self.getScaleInventory(['spine-01', 'spine-02'], ['leaf-01', 'leaf-03', 'leaf-05']))
+        with self._dao.getReadSession() as session:
+            leaf = session.query(Device).filter(Device.name == 'leaf-05').one()
+            self.assertEqual('10.0.0.2/32', self.getIfl(session, 'leaf-05', 'lo0.0').ipaddress)
+            self.assertEqual('172.16.1.1/24', self.getIfl(session, 'leaf-05', 'irb.1').ipaddress)
+            self.assertEqual('192.168.0.2/31', self.getIfl(session, 'spine-01', 'et-0/0/1.0').ipaddress)
+            spinePort = session.query(InterfaceDefinition).join(Device).filter(InterfaceDefinition.name == 'et-0/0/1').filter(Device.name == 'spine-01').one()
+            self.assertEqual(('leaf-05', 'et-0/0/48'), (spinePort.peer.device.name, spinePort.peer.name))
+            self.assertEqual(201, leaf.asn)
+            self.assertEqual('192.168.48.219/24', leaf.managementIp)
+            self.assertEqual(0, session.query(IpAllocation).filter(IpAllocation.state == 'free').count())
+
+    def testScaleOutPodWithoutIpAllocations(self):
+        podDict = getPodDict()
+        pod = self.l3ClosMediation.createPod('pod1', podDict, self.getScaleInventory(['spine-01', 'spine-02'], ['leaf-01', 'leaf-02', 'leaf-03']))
+        with self._dao.getReadWriteSession() as session:
+            # pod built before IpAllocation existed
+            session.query(IpAllocation).delete()
+
+        podDict['leafCount'] = 4
+        self.l3ClosMediation.updatePod(pod.id, podDict, self.getScaleInventory(['spine-01', 'spine-02'], ['leaf-01', 'leaf-03', 'leaf-04', 'leaf-05']))
+        with self._dao.getReadSession() as session:
+            # new leaves get what leaf-02 freed, then grow the pools
+            self.assertEqual('10.0.0.2/32', self.getIfl(session, 'leaf-04', 'lo0.0').ipaddress)
+            self.assertEqual('172.16.1.1/24', self.getIfl(session, 'leaf-04', 'irb.1').ipaddress)
+            self.assertEqual('192.168.0.2/31', self.getIfl(session, 'spine-01', 'et-0/0/1.0').ipaddress)
+            self.assertEqual('10.0.0.6/32', self.getIfl(session, 'leaf-05', 'lo0.0').ipaddress)
+            self.assertEqual('172.16.3.1/24', self.getIfl(session, 'leaf-05', 'irb.1').ipaddress)
+            ips = [ifl.ipaddress for ifl in session.query(InterfaceLogical).filter(InterfaceLogical.ipaddress != None)]
+            self.assertEqual(len(ips), len(set(ips)))
+            self.assertEqual(0, session.query(IpAllocation).filter(IpAllocation.state == 'free').count())
+
+    def testScaleOutSpine(self):
+        podDict = getPodDict()
+        pod = self.l3ClosMediation.createPod('pod1', podDict)
+        
+        podDict['spineCount'] = 3
+        inventory = self.l3ClosMediation._resolveInventory(podDict, None)
+        inventory['spines'].append({"name": "spine-03"})
+        self.l3ClosMediation.updatePod(pod.id, podDict, inventory)
+        
+        with self._dao.getReadSession() as session:
+            spine = session.query(Device).filter(Device.name == 'spine-03').one()
+            self.assertEqual(102, spine.asn)
+            self.assertEqual('10.0.0.6/32', self.getIfl(session, 'spine-03', 'lo0.0').ipaddress)
+            leafPort = session.query(InterfaceDefinition).join(Device).filter(InterfaceDefinition.name == 'et-0/0/50').filter(Device.name == 'leaf-01').one()
+            self.assertEqual(('spine-03', 'et-0/0/0'), (leafPort.peer.device.name, leafPort.peer.name))
+            # leaf of unknown family gets one more fake uplink
+            leafPort = session.query(InterfaceDefinition).join(Device).filter(InterfaceDefinition.name == 'uplink-2').filter(Device.name == 'leaf-03').one()
+            self.assertEqual(('spine-03', 'et-0/0/2'), (leafPort.peer.device.name, leafPort.peer.name))
+            self.assertEqual(3, session.query(InterfaceLogical).filter(InterfaceLogical.device_id == spine.id).filter(InterfaceLogical.name.like('et-%')).count())
+
+    def testScaleOutBeyondSpinePorts(self):
+        podDict = getPodDict()
+        podDict['vlanPrefix'] = '172.16.0.0/16'
+        pod = self.l3ClosMediation.createPod('pod1', podDict)
+        
+        # qfx5100-24q-2p spine has 32 ports
+        podDict['leafCount'] = 33
+        with self.assertRaises(CapacityCannotChange):
+            self.l3ClosMediation.updatePod(pod.id, podDict, self.getScaleInventory(['spine-01', 'spine-02'], ['leaf-%02d' % (i) for i in xrange(33)]))
+
     def testUpdatePodInvalidId(self):
         with self.assertRaises(PodNotFound) as ve:
             self.l3ClosMediation.updatePod("invalid_id", None)
@@ -108,6 +275,90 @@ class TestL3Clos(unittest.TestCase):
         self.assertEqual(True, self.l3ClosMediation.createCablingPlan(pod.id))
         self.assertEqual(True, self.l3ClosMediation.createDeviceConfig(pod.id))
 
+    def getDeviceConfigs(self, podId):
+        with self._dao.getReadSession() as session:
+            pod = session.query(Pod).filter(Pod.id == podId).one()
+            return dict([(device.name, device.config.config) for device in pod.devices if device.config is not None])
+
+    def testDeviceConfigSerialAndParallelRendering(self):
+        self._conf['deploymentMode'] = {'ztpStaged': False}
+        self.l3ClosMediation = L3ClosMediation(self._conf, InMemoryDao)
+        podId = self.createPodSpineLeaf().id
+        self.assertEqual(True, self.l3ClosMediation.createDeviceConfig(podId))
+        serialConfigs = self.getDeviceConfigs(podId)
+        self.assertEqual(4, len(serialConfigs))
+
+        for executor in ['thread', 'process']:
+            self._conf['configRendering'] = {'executor': executor, 'workerCount': 2}
+            with self._dao.getReadWriteSession() as session:
+                pod = session.query(Pod).one()
+                # no fingerprint to force rendering all devices
+                for device in pod.devices:
+                    if device.config is not None:
+                        device.config.fingerprint = None
+                self.assertEqual(4, self.l3ClosMediation.generateConfig(session, pod)['regenerated'])
+            self.assertEqual(serialConfigs, self.getDeviceConfigs(podId))
+
+    def testDeviceConfigIncrementalRegeneration(self):
+        self._conf['deploymentMode'] = {'ztpStaged': False}
+        self.l3ClosMediation = L3ClosMediation(self._conf, InMemoryDao)
+        podId = self.createPodSpineLeaf().id
+        with self._dao.getReadWriteSession() as session:
+            pod = session.query(Pod).one()
+            self.assertEqual({'regenerated': 4, 'reused': 0}, self.l3ClosMediation.generateConfig(session, pod))
+        configs = self.getDeviceConfigs(podId)
+
+        with self._dao.getReadWriteSession() as session:
+            pod = session.query(Pod).one()
+            self.assertEqual({'regenerated': 0, 'reused': 4}, self.l3ClosMediation.generateConfig(session, pod))
+        self.assertEqual(configs, self.getDeviceConfigs(podId))
+            
+        # only changed leaf gets new config
+        with self._dao.getReadWriteSession() as session:
+            pod = session.query(Pod).one()
+            leaf = session.query(Device).filter(Device.name == 'leaf-01').one()
+            leaf.update(leaf.name, leaf.family, leaf.username, 'newPassword', leaf.macAddress, leaf.deployStatus, leaf.serialNumber)
+            self.assertEqual({'regenerated': 1, 'reused': 3}, self.l3ClosMediation.generateConfig(session, pod))
+        newConfigs = self.getDeviceConfigs(podId)
+        self.assertNotEqual(configs['leaf-01'], newConfigs['leaf-01'])
+        self.assertEqual(configs['spine-01'], newConfigs['spine-01'])
+
+        # pod level input changes every device
+        with self._dao.getReadWriteSession() as session:
+            pod = session.query(Pod).one()
+            pod.allocatedIrbBlock = '172.16.0.0/21'
+            self.assertEqual({'regenerated': 4, 'reused': 0}, self.l3ClosMediation.generateConfig(session, pod))
+
+    def testGetConfigletsFingerprint(self):
+        from jnpr.openclos.l3Clos import getConfigletsFingerprint
+        configlets = [('routingOptionsStatic.txt', {'oob': {'networks': set(['1.2.3.0/24', '1.2.4.0/24']), 'gateway': '1.2.3.1'}})]
+        sameConfiglets = [('routingOptionsStatic.txt', {'oob': {'gateway': '1.2.3.1', 'networks': set(['1.2.4.0/24', '1.2.3.0/24'])}})]
+        otherConfiglets = [('routingOptionsStatic.txt', {'oob': {'gateway': '1.2.3.2', 'networks': set(['1.2.4.0/24', '1.2.3.0/24'])}})]
+        self.assertEqual(64, len(getConfigletsFingerprint(configlets)))
+        self.assertEqual(getConfigletsFingerprint(configlets), getConfigletsFingerprint(sameConfiglets))
+        self.assertNotEqual(getConfigletsFingerprint(configlets), getConfigletsFingerprint(otherConfiglets))
+
+    def testRenderDeviceConfigsKeepsOrder(self):
+        from jnpr.openclos.l3Clos import renderDeviceConfigs
+        deviceConfiglets = [[(None, 'device%d\n' % (i)), ('protocolLldp.txt', {})] for i in xrange(10)]
+        self._conf['configRendering'] = {'executor': 'thread', 'workerCount': 3}
+        configs = self.l3ClosMediation._renderDeviceConfigs(deviceConfiglets)
+        self.assertEqual(renderDeviceConfigs(deviceConfiglets), configs)
+        self.assertTrue(configs[7].startswith('device7\n'))
+        self.assertTrue('lldp' in configs[7])
+
+    def testRenderingPoolLongLived(self):
+        from jnpr.openclos.l3Clos import getRenderingPool
+        self.assertIsNone(getRenderingPool({}))
+        self.assertIsNone(getRenderingPool({'configRendering': {'executor': 'serial'}}))
+        conf = {'configRendering': {'executor': 'thread', 'workerCount': 2}}
+        pool = getRenderingPool(conf)
+        self.assertIs(pool, getRenderingPool(conf))
+        # forked child gets its own pool
+        childPid = os.getpid() + 1
+        flexmock(os).should_receive('getpid').and_return(childPid)
+        self.assertIsNot(pool, getRenderingPool(conf))
+
     def testCreateLinks(self):
         pod = self.createPodSpineLeaf()
         
@@ -237,6 +488,22 @@ class TestL3Clos(unittest.TestCase):
             self.assertTrue('lo0_out' not in configlet and '12.0.0.0/28' in configlet)
             self.assertTrue('irb_out' not in configlet)
   
+    def testConfigWithFabricIndexMatchesQueries(self):
+        from jnpr.openclos.fabricIndex import FabricIndex
+        self.createPodSpineLeaf()
+        with self._dao.getReadSession() as session:
+            pod = session.query(Pod).one()
+            fabricIndex = FabricIndex(session, pod)
+            for device in pod.devices:
+                self.assertEqual(self.l3ClosMediation._createInterfaces(session, device), 
+                                 self.l3ClosMediation._createInterfaces(session, device, fabricIndex))
+                self.assertEqual(self.l3ClosMediation._createRoutingOptionsBgp(session, device), 
+                                 self.l3ClosMediation._createRoutingOptionsBgp(session, device, fabricIndex))
+                self.assertEqual(self.l3ClosMediation._createProtocolBgp(session, device), 
+                                 self.l3ClosMediation._createProtocolBgp(session, device, fabricIndex))
+                self.assertEqual(self.l3ClosMediation._createPolicyOption(session, device), 
+                                 self.l3ClosMediation._createPolicyOption(session, device, fabricIndex))
+  
     def testInitWithTemplate(self):
         from jinja2 import TemplateNotFound
 
@@ -244,6 +244,19 @@ class TestCablingPlan(TestOrm):
         self.session.commit()
         self.assertEqual(0, self.session.query(CablingPlan).count())
 
+    def testBlobColumnsDeferred(self):
+        podOne = createPod('testpod', self.session)
+        podOne.cablingPlan = CablingPlan(podOne.id, 'cabling json', 'cabling dot')
+        self.session.commit()
+        self.session.expunge_all()
+
+        fetched = self.session.query(Pod).one()
+        self.assertEqual(set(['inventoryData']), sqlalchemy.inspect(fetched).unloaded & set(['inventoryData', 'name']))
+        cablingPlan = fetched.cablingPlan
+        self.assertEqual(set(['json', 'dot']), sqlalchemy.inspect(cablingPlan).unloaded)
+        self.assertEqual('cabling json', cablingPlan.json)
+        self.assertEqual(set(['dot']), sqlalchemy.inspect(cablingPlan).unloaded)
+
 class TestDevice(TestOrm):
     def testConstructorPass(self):
         podOne = createPod('testpod', self.session)
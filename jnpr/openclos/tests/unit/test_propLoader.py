@@ -5,8 +5,10 @@ Created on Apr 16, 2015
 '''
 import unittest
 import os
+import shutil
+import tempfile
 
-from jnpr.openclos.propLoader import PropertyLoader, OpenClosProperty, DeviceSku, loadLoggingConfig
+from jnpr.openclos.propLoader import PropertyLoader, OpenClosProperty, FrozenDict, DeviceSku, loadLoggingConfig
 from jnpr.openclos.exception import InvalidConfiguration
 
 class TestPropertyLoader(unittest.TestCase):
@@ -56,6 +58,34 @@ class TestOpenClosProperty(unittest.TestCase):
     def testGetDbUrl(self):
         self.assertTrue('sqlite:' in self.openClosProperty.getDbUrl())
 
+    def testPropertiesSharedAndReadOnly(self):
+        properties = self.openClosProperty.getProperties()
+        self.assertIs(properties, OpenClosProperty().getProperties())
+        with self.assertRaises(TypeError):
+            properties['outputDir'] = '/tmp'
+        with self.assertRaises(TypeError):
+            properties.update({'outputDir': '/tmp'})
+        # nested lists become tuples
+        self.assertTrue(all(not isinstance(value, (list, dict)) or isinstance(value, FrozenDict) for value in properties.itervalues()))
+
+    def testReloadOnFileChange(self):
+        fileName = os.path.join(tempfile.mkdtemp(), 'openclos.yaml')
+        try:
+            with open(fileName, 'w') as stream:
+                stream.write("dbUrl: sqlite:////tmp/test1.db\n")
+            stats = OpenClosProperty.getStats()
+            self.assertEqual('sqlite:////tmp/test1.db', OpenClosProperty(fileName).getDbUrl())
+            self.assertEqual(stats['loads'] + 1, OpenClosProperty.getStats()['loads'])
+
+            with open(fileName, 'w') as stream:
+                stream.write("dbUrl: sqlite:////tmp/test2.db\n")
+            modificationTime = os.path.getmtime(fileName) + 10
+            os.utime(fileName, (modificationTime, modificationTime))
+            self.assertEqual('sqlite:////tmp/test2.db', OpenClosProperty(fileName).getDbUrl())
+            self.assertEqual(stats['reloads'] + 1, OpenClosProperty.getStats()['reloads'])
+        finally:
+            shutil.rmtree(os.path.dirname(fileName))
+
 
 
 class TestDeviceSku(unittest.TestCase):
@@ -164,6 +194,46 @@ class TestDeviceSku(unittest.TestCase):
         deviceFamilyList = self.deviceSku.getSupportedDeviceFamily()
         self.assertEqual(11, len(deviceFamilyList))
 
+    def testPortNamesSharedAndImmutable(self):
+        ports = self.deviceSku.getPortNamesForDeviceFamily('qfx5100-48s-6q', 'leaf')
+        self.assertIs(ports, DeviceSku().getPortNamesForDeviceFamily('qfx5100-48s-6q', 'leaf'))
+        self.assertEqual(('et-0/0/48', 'et-0/0/49', 'et-0/0/50', 'et-0/0/51', 'et-0/0/52', 'et-0/0/53'), ports['uplinkPorts'])
+        self.assertTrue('et-0/0/53' in ports['uplinkPortSet'])
+        self.assertFalse('xe-0/0/0' in ports['uplinkPortSet'])
+        with self.assertRaises(AttributeError):
+            ports['uplinkPorts'].append('et-0/0/54')
+        with self.assertRaises(TypeError):
+            ports['uplinkPorts'] = ()
+        with self.assertRaises(TypeError):
+            self.deviceSku.getPortNamesForDeviceFamily('unknown', 'leaf').update({'uplinkPorts': ('et-0/0/0', )})
+        
+        # device families added to one instance are not seen by others
+        self.deviceSku.skuDetail['test-family'] = {}
+        self.assertFalse('test-family' in DeviceSku().skuDetail)
+
+    def testReloadOnFileChange(self):
+        fileName = os.path.join(tempfile.mkdtemp(), 'deviceFamily.yaml')
+        try:
+            with open(fileName, 'w') as stream:
+                stream.write("deviceFamily:\n    test-family:\n        leaf:\n            uplinkPorts: 'et-0/0/[0-1]'\n")
+            ports = DeviceSku(fileName).getPortNamesForDeviceFamily('test-family', 'leaf')
+            self.assertEqual(('et-0/0/0', 'et-0/0/1'), ports['uplinkPorts'])
+            self.assertIs(ports, DeviceSku(fileName).getPortNamesForDeviceFamily('test-family', 'leaf'))
+
+            with open(fileName, 'w') as stream:
+                stream.write("deviceFamily:\n    test-family:\n        leaf:\n            uplinkPorts: 'et-0/0/[0-2]'\n")
+            modificationTime = os.path.getmtime(fileName) + 10
+            os.utime(fileName, (modificationTime, modificationTime))
+            self.assertEqual(3, len(DeviceSku(fileName).getPortNamesForDeviceFamily('test-family', 'leaf')['uplinkPorts']))
+            # existing instances see the change too
+            deviceSku = DeviceSku(fileName)
+            with open(fileName, 'w') as stream:
+                stream.write("deviceFamily:\n    test-family:\n        leaf:\n            uplinkPorts: 'et-0/0/[0-3]'\n")
+            os.utime(fileName, (modificationTime + 10, modificationTime + 10))
+            self.assertEqual(4, len(deviceSku.getPortNamesForDeviceFamily('test-family', 'leaf')['uplinkPorts']))
+        finally:
+            shutil.rmtree(os.path.dirname(fileName))
+
 
 class TestMethod(unittest.TestCase):
     def testLoadLoggingConfig(self):
@@ -6,7 +6,7 @@ Created on Sep 9, 2014
 import unittest
 import os
 
-from jnpr.openclos.report import ResourceAllocationReport, L2Report, L3Report
+from jnpr.openclos.report import ResourceAllocationReport, L2Report, L3Report, HealthReport
 from test_dao import InMemoryDao 
 
 class Test(unittest.TestCase):
@@ -75,6 +75,37 @@ class Test(unittest.TestCase):
             pod = createPod("test", session)
             l3Report.generateReport(pod.id, True, False)
 
+    def testResetSpineStatus(self):
+        healthReport = HealthReport(self.__conf, self._dao)
+        from test_model import createPod, createPodDevice
+        with self._dao.getReadSession() as session:
+            pod = createPod("test", session)
+            spine = createPodDevice(session, "spine-01", pod)
+            leaf = createPodDevice(session, "leaf-01", pod)
+            leaf.role = 'leaf'
+            for device in [spine, leaf]:
+                device.l2Status = device.l3Status = device.configStatus = 'good'
+                device.l3StatusReason = 'reason'
+            session.commit()
+            healthReport.resetSpineStatus(pod.devices, ['l3Status'])
+        with self._dao.getReadSession() as session:
+            spine = session.query(spine.__class__).filter_by(name = 'spine-01').one()
+            self.assertEqual('unknown', spine.l3Status)
+            self.assertIsNone(spine.l3StatusReason)
+            self.assertEqual('good', spine.l2Status)
+            leaf = session.query(leaf.__class__).filter_by(name = 'leaf-01').one()
+            self.assertEqual('good', leaf.l3Status)
+
+    def testGenerateHealthReport(self):
+        import json
+        healthReport = HealthReport(self.__conf, self._dao)
+        from test_model import createPod
+        with self._dao.getReadSession() as session:
+            pod = createPod("test", session)
+            report = json.loads(healthReport.generateReport(pod.id, True, False))
+            self.assertEqual([], report['healthReport']['devices'])
+            self.assertEqual([], report['healthReport']['peers'])
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
@@ -8,8 +8,12 @@ import os
 import shutil
 import json
 from webtest import TestApp, AppError
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
-from jnpr.openclos.rest import RestServer, webServerRoot, junosImageRoot
+from jnpr.openclos.rest import RestServer, ThreadPoolWSGIServer, webServerRoot, junosImageRoot
+from jnpr.openclos.exception import InvalidConfiguration
+from jnpr.openclos import util
 from test_dao import InMemoryDao 
 
 
@@ -37,6 +41,50 @@ class TestRest(unittest.TestCase):
         self.assertEqual(9090, self.restServer.port)
         self.assertEqual('http://1.2.3.4:9090', self.restServer.baseUrl)
         
+    def testGetServerOptions(self):
+        self.assertEqual(('wsgiref', {}), self.restServer.getServerOptions())
+        self._conf['restServer'] = {'server': 'paste', 'threadCount': 20}
+        self.assertEqual(('paste', {'use_threadpool': True, 'threadpool_workers': 20, 'threadpool_options': {'spawn_if_under': 10}}), 
+                         self.restServer.getServerOptions())
+        self._conf['restServer'] = {'server': 'threadPool', 'threadCount': 3}
+        server, options = self.restServer.getServerOptions()
+        self.assertEqual('wsgiref', server)
+        self.assertEqual(3, options['server_class'].threadCount)
+        self._conf['restServer'] = {'server': 'gunicorn'}
+        server, options = self.restServer.getServerOptions()
+        self.assertEqual((4, 10), (options['workers'], options['threads']))
+        self._conf['restServer'] = {'server': 'unknown'}
+        with self.assertRaises(InvalidConfiguration):
+            self.restServer.getServerOptions()
+
+    def testThreadPoolServerConcurrentRequests(self):
+        from wsgiref.simple_server import make_server
+        import threading
+        import urllib2
+        release = threading.Event()
+        def app(environ, startResponse):
+            if environ['PATH_INFO'] == '/slow':
+                release.wait(10)
+            startResponse('200 OK', [('Content-Type', 'text/plain')])
+            return [environ['PATH_INFO']]
+        
+        server = make_server('127.0.0.1', 0, app, server_class = ThreadPoolWSGIServer)
+        thread = threading.Thread(target = server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%d' % (server.server_port)
+            slow = threading.Thread(target = urllib2.urlopen, args = (url + '/slow', ))
+            slow.start()
+            # served while /slow is in progress
+            self.assertEqual('/fast', urllib2.urlopen(url + '/fast', timeout = 5).read())
+            release.set()
+            slow.join()
+        finally:
+            release.set()
+            server.shutdown()
+            server.server_close()
+
     def testGetIndexNoPodNoDevice(self):
         response = self.restServerTestApp.get('/openclos')
         self.assertEqual(200, response.status_int)
@@ -85,6 +133,90 @@ class TestRest(unittest.TestCase):
         self.assertEqual(1, len(response.json['devices']['device']))
         self.assertTrue("/openclos/pods/"+device1PodId+"/devices/"+device1Id in response.json['devices']['device'][0]['uri'])
     
+    def countSelects(self, url):
+        statements = []
+        def beforeExecute(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT'):
+                statements.append(statement)
+        event.listen(Engine, 'before_cursor_execute', beforeExecute)
+        try:
+            response = self.restServerTestApp.get(url)
+        finally:
+            event.remove(Engine, 'before_cursor_execute', beforeExecute)
+        return response, statements
+
+    def testGetDevicesQueryCount(self):
+        from test_model import createPod, createPodDevice
+        from jnpr.openclos.model import DeviceConfig
+        with self._dao.getReadWriteSession() as session:
+            pod = createPod('test1', session)
+            podId = pod.id
+            for i in xrange(20):
+                device = createPodDevice(session, 'leaf%02d' % (i), pod)
+                session.add(DeviceConfig(device.id, 'config' * 100))
+
+        response, statements = self.countSelects('/openclos/pods/' + podId + '/devices')
+        self.assertEqual(20, len(response.json['devices']['device']))
+        self.assertEqual('leaf00', response.json['devices']['device'][0]['name'])
+        # devices and their count, no query per device, no config
+        self.assertEqual(2, len(statements))
+        self.assertFalse(any('deviceConfig' in statement for statement in statements))
+
+    def setupPodWithDevices(self, count):
+        from test_model import createPod, createPodDevice
+        with self._dao.getReadWriteSession() as session:
+            pod = createPod('test1', session)
+            for i in xrange(count):
+                device = createPodDevice(session, 'leaf%02d' % (i), pod)
+                device.l2Status = 'good' if i % 2 == 0 else 'error'
+            return pod.id
+
+    def testGetDevicesPaginated(self):
+        podId = self.setupPodWithDevices(5)
+
+        response = self.restServerTestApp.get('/openclos/pods/' + podId + '/devices?limit=2')
+        devices = response.json['devices']
+        self.assertEqual(['leaf00', 'leaf01'], [device['name'] for device in devices['device']])
+        self.assertEqual(5, devices['total'])
+        self.assertTrue(devices['device'][0]['uri'].endswith('/openclos/pods/' + podId + '/devices/' + devices['device'][0]['id']))
+
+        names = [device['name'] for device in devices['device']]
+        while 'next' in devices:
+            devices = self.restServerTestApp.get(devices['next'][len('http://localhost:80'):]).json['devices']
+            names += [device['name'] for device in devices['device']]
+        self.assertEqual(['leaf00', 'leaf01', 'leaf02', 'leaf03', 'leaf04'], names)
+
+    def testGetDevicesFilterAndFields(self):
+        podId = self.setupPodWithDevices(5)
+
+        response = self.restServerTestApp.get('/openclos/pods/' + podId + '/devices?l2Status=error&role=spine,leaf&fields=name,l2Status')
+        devices = response.json['devices']
+        self.assertEqual(2, devices['total'])
+        self.assertEqual([{'name': 'leaf01', 'l2Status': 'error'}, {'name': 'leaf03', 'l2Status': 'error'}], devices['device'])
+
+        response = self.restServerTestApp.get('/openclos/pods/' + podId + '/devices?l2Status=unknown')
+        self.assertEqual(0, response.json['devices']['total'])
+        with self.assertRaises(AppError) as e:
+            self.restServerTestApp.get('/openclos/pods/nonExisting/devices?l2Status=unknown')
+        self.assertTrue('404 Not Found' in e.exception.message)
+
+    def testGetDevicesBadRequest(self):
+        podId = self.setupPodWithDevices(1)
+        for query in ['limit=0', 'limit=abc', 'fields=name,config']:
+            with self.assertRaises(AppError) as e:
+                self.restServerTestApp.get('/openclos/pods/' + podId + '/devices?' + query)
+            self.assertTrue('400 Bad Request' in e.exception.message)
+
+    def testGetPodsQueryCount(self):
+        with self._dao.getReadWriteSession() as session:
+            self.setupRestWithTwoPods(session)
+
+        response, statements = self.countSelects('/openclos/pods')
+        self.assertEqual(2, len(response.json['pods']['pod']))
+        self.assertEqual([{'deviceType': 'qfx-5100-48s-6q', 'junosImage': None}], response.json['pods']['pod'][0]['leafSettings'])
+        # pods and leaf settings of all pods
+        self.assertEqual(2, len(statements))
+
     def testGetDeviceNonExistingDevice(self):
         with self._dao.getReadWriteSession() as session:
             self.setupRestWithTwoPods(session)
@@ -144,6 +276,26 @@ class TestRest(unittest.TestCase):
         response = self.restServerTestApp.get('/openclos/pods/'+podId+'/devices/'+deviceId+'/config')
         self.assertEqual(200, response.status_int)
         self.assertEqual("testconfig", response.body)
+
+    def testGetConfigNotModified(self):
+        from jnpr.openclos.model import DeviceConfig
+        with self._dao.getReadWriteSession() as session:
+            self.setupRestWithTwoDevices(session)
+            self.device1.config = DeviceConfig(self.device1.id, "testconfig")
+            url = '/openclos/pods/' + self.device1.pod_id + '/devices/' + self.device1.id + '/config'
+            
+        etag = self.restServerTestApp.get(url).headers['ETag']
+        response = self.restServerTestApp.get(url, headers = {'If-None-Match': etag}, status = 304)
+        self.assertEqual('', response.body)
+        self.assertEqual(etag, response.headers['ETag'])
+        self.restServerTestApp.get(url, headers = {'If-None-Match': 'W/"abc", W/' + etag}, status = 304)
+
+        with self._dao.getReadWriteSession() as session:
+            session.query(DeviceConfig).one().config = "newconfig"
+        response = self.restServerTestApp.get(url, headers = {'If-None-Match': etag})
+        self.assertEqual(200, response.status_int)
+        self.assertEqual("newconfig", response.body)
+        self.assertNotEqual(etag, response.headers['ETag'])
         
     def testGetDeviceConfigsInZip(self):
         from jnpr.openclos.model import DeviceConfig
@@ -163,6 +315,28 @@ class TestRest(unittest.TestCase):
         archive = zipfile.ZipFile(buff, "r")
         self.assertEqual(1, len(archive.namelist()))
 
+    def testCreateZipArchiveStream(self):
+        from jnpr.openclos.model import DeviceConfig, LeafSetting
+        import StringIO
+        import zipfile
+        with self._dao.getReadWriteSession() as session:
+            self.setupRestWithTwoDevices(session)
+            self.device1.config = DeviceConfig(self.device1.id, "testconfig1")
+            self.device2.pod = self.device1.pod
+            self.device2.config = DeviceConfig(self.device2.id, "testconfig2")
+            self.device1.pod.leafSettings = [LeafSetting('qfx5100-48s-6q', self.device1.pod_id, config = "leafconfig")]
+            podId = self.device1.pod_id
+            device1Id = self.device1.id
+            device2Id = self.device2.id
+
+        chunks = list(self.restServer.createZipArchiveStream(podId))
+        # one chunk per entry and central directory at the end
+        self.assertEqual(4, len(chunks))
+        archive = zipfile.ZipFile(StringIO.StringIO(''.join(chunks)), "r")
+        self.assertEqual([device1Id + '__test1.conf', device2Id + '__test2.conf', 'qfx5100-48s-6q.conf'], archive.namelist())
+        self.assertEqual("testconfig2", archive.read(device2Id + '__test2.conf'))
+        self.assertEqual("leafconfig", archive.read('qfx5100-48s-6q.conf'))
+
     def testGetDeviceConfigsInZipUnknownPod(self):
         with self._dao.getReadWriteSession() as session:
             self.setupRestWithTwoDevices(session)
@@ -228,6 +402,9 @@ class TestRest(unittest.TestCase):
         response = self.restServerTestApp.get('/openclos/pods/'+pod1Id+'/cabling-plan',headers = {'Accept':'application/json'})
         self.assertEqual(200, response.status_int)
         self.assertEqual('cabling json', response.body)
+
+        headers = {'Accept':'application/json', 'If-None-Match': response.headers['ETag']}
+        self.restServerTestApp.get('/openclos/pods/'+pod1Id+'/cabling-plan', headers = headers, status = 304)
         
     def testGetCablingPlanDot(self):
         with self._dao.getReadWriteSession() as session:
@@ -256,6 +433,23 @@ class TestRest(unittest.TestCase):
         self.assertEqual(200, response.status_int)
         ls.close()
         shutil.rmtree(ztpConfigLocation, ignore_errors=True)
+
+    def testGetZtpConfigNotModified(self):
+        from jnpr.openclos.writer import DhcpConfWriter
+        with self._dao.getReadWriteSession() as session:
+            self.setupRestWithTwoPods(session)
+            DhcpConfWriter({'outputDir': configLocation}, self.pod1, self._dao).write('dhcp conf')
+            url = '/openclos/pods/' + self.pod1.id + '/ztp-configuration'
+            ztpConfigLocation = os.path.join(configLocation, self.pod1.id+'-'+self.pod1.name)
+       
+        try:
+            response = self.restServerTestApp.get(url)
+            etag = response.headers['ETag']
+            self.assertEqual(util.getContentEtag('dhcp conf'), etag)
+            self.assertEqual('dhcp conf', response.body)
+            self.restServerTestApp.get(url, headers = {'If-None-Match': etag}, status = 304)
+        finally:
+            shutil.rmtree(ztpConfigLocation, ignore_errors=True)
         
     def testGetNonExistingZtpConfig(self):
         with self._dao.getReadWriteSession() as session:
@@ -428,6 +622,9 @@ class TestRest(unittest.TestCase):
         response = self.restServerTestApp.get('/openclos/pods/'+pod1Id+'/leaf-generic-configurations/qfx5100-48s-6q')
         self.assertEqual(200, response.status_int) 
         self.assertTrue('testConfig abcd' in response.body)
+        
+        headers = {'If-None-Match': response.headers['ETag']}
+        self.restServerTestApp.get('/openclos/pods/'+pod1Id+'/leaf-generic-configurations/qfx5100-48s-6q', headers = headers, status = 304)
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -0,0 +1,156 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import sys
+sys.path.insert(0,os.path.abspath(os.path.dirname(__file__) + '/' + '../..')) #trick to make it run from CLI
+
+import unittest
+import threading
+from flexmock import flexmock
+
+from jnpr.openclos.statusSink import StatusSink, UPDATE, UPDATE_WHERE, REPLACE
+from jnpr.openclos.model import Device, BgpLink, AdditionalLink
+from test_dao import InMemoryDao
+from test_model import createPod, createPodDevice
+
+class TestStatusSink(unittest.TestCase):
+    def setUp(self):
+        self._dao = InMemoryDao.getInstance()
+        self.sink = StatusSink(self._dao, {'batchSize': 100, 'flushInterval': 0})
+        with self._dao.getReadWriteSession() as session:
+            pod = createPod('pod1', session)
+            self.podId = pod.id
+            self.deviceIds = [createPodDevice(session, 'leaf%d' % (i), pod).id for i in xrange(3)]
+
+    def tearDown(self):
+        self.sink.stop()
+        self._dao = None
+        InMemoryDao._destroy()
+
+    def getDevices(self, session):
+        return dict((device.id, device) for device in session.query(Device).all())
+
+    def testUpdatesCoalescedPerRow(self):
+        leaf0, leaf1, leaf2 = self.deviceIds
+        self.sink.submit([(UPDATE, Device, leaf0, {'l2Status': 'processing'}),
+                          (UPDATE, Device, leaf1, {'l2Status': 'processing'})])
+        self.sink.submit([(UPDATE, Device, leaf0, {'l2Status': 'good', 'l2StatusReason': None}),
+                          (UPDATE, Device, leaf1, {'l2Status': 'error', 'l2StatusReason': 'no uplink'}),
+                          (UPDATE, Device, leaf2, {'l3Status': 'good'})])
+
+        # one executemany per table and set of columns
+        flexmock(self._dao).should_call('bulkUpdate').twice()
+        self.assertEqual(5, self.sink.flush())
+        self.assertEqual(1, self.sink.flushCount)
+
+        with self._dao.getReadSession() as session:
+            devices = self.getDevices(session)
+            self.assertEqual('good', devices[leaf0].l2Status)
+            self.assertEqual('error', devices[leaf1].l2Status)
+            self.assertEqual('no uplink', devices[leaf1].l2StatusReason)
+            self.assertEqual('good', devices[leaf2].l3Status)
+            self.assertEqual('unknown', devices[leaf2].l2Status)
+
+    def testReplaceAndUpdateWhere(self):
+        leaf0, leaf1 = self.deviceIds[:2]
+        with self._dao.getReadWriteSession() as session:
+            session.add(BgpLink(self.podId, leaf0, {'device1': 'leaf0', 'linkState': 'Established'}))
+            session.add(BgpLink(self.podId, leaf1, {'device1': 'leaf1', 'linkState': 'Established'}))
+            session.add(AdditionalLink('leaf0', 'et-0/0/48', 'spine9', 'et-0/0/0', 'error'))
+
+        self.sink.submit([(REPLACE, BgpLink, 'device_id', leaf0, [BgpLink(self.podId, leaf0, {'device1': 'leaf0', 'device1Ip': '192.169.0.3'}),
+                                                                  BgpLink(self.podId, leaf0, {'device1': 'leaf0', 'device1Ip': '192.169.0.11'})]),
+                          (REPLACE, AdditionalLink, 'device1', 'leaf0', []),
+                          (UPDATE_WHERE, BgpLink, 'device_id', leaf1, {'link_state': 'unknown'})])
+        self.sink.flush()
+
+        with self._dao.getReadSession() as session:
+            links = session.query(BgpLink).filter(BgpLink.device_id == leaf0).all()
+            self.assertEqual(set(['192.169.0.3', '192.169.0.11']), set([link.device1Ip for link in links]))
+            self.assertEqual('unknown', session.query(BgpLink).filter(BgpLink.device_id == leaf1).one().link_state)
+            self.assertEqual(0, session.query(AdditionalLink).count())
+
+    def testRowUpdatesWrittenBeforeUpdateWhereOfSameTable(self):
+        leaf0, leaf1 = self.deviceIds[:2]
+        self.sink.submit([(UPDATE, Device, leaf0, {'l2Status': 'good'}),
+                          (UPDATE_WHERE, Device, 'pod_id', self.podId, {'l2Status': 'unknown'}),
+                          (UPDATE, Device, leaf1, {'l2Status': 'error'})])
+        self.sink.flush()
+
+        with self._dao.getReadSession() as session:
+            devices = self.getDevices(session)
+            self.assertEqual('unknown', devices[leaf0].l2Status)
+            self.assertEqual('error', devices[leaf1].l2Status)
+
+    def testFlushAtBatchSize(self):
+        self.sink.batchSize = 3
+        self.sink.submit([(UPDATE, Device, self.deviceIds[0], {'l2Status': 'good'})])
+        self.assertEqual(0, self.sink.flushCount)
+        self.sink.submit([(UPDATE, Device, id, {'l2Status': 'good'}) for id in self.deviceIds])
+        self.assertEqual(1, self.sink.flushCount)
+        self.assertEqual(4, self.sink.updateCount)
+
+    def testFailedFlushDoesNotRaise(self):
+        self.sink.submit([(UPDATE, Device, self.deviceIds[0], {'noSuchColumn': 'good'})])
+        self.assertEqual(0, self.sink.flush())
+        self.assertEqual(1, self.sink.failedCount)
+        self.assertEqual(0, self.sink.flush())
+
+    def testFailedFlushRetriedPerSubmit(self):
+        leaf0, leaf1, leaf2 = self.deviceIds
+        self.sink.submit([(UPDATE, Device, leaf0, {'l2Status': 'good'})])
+        self.sink.submit([(UPDATE, Device, leaf1, {'l2Status': 'good'}), (UPDATE, Device, leaf1, {'noSuchColumn': 'good'})])
+        self.sink.submit([(UPDATE, Device, leaf2, {'l3Status': 'good'})])
+        self.assertEqual(2, self.sink.flush())
+        self.assertEqual(2, self.sink.failedCount)
+        self.assertEqual(2, self.sink.updateCount)
+
+        with self._dao.getReadSession() as session:
+            devices = self.getDevices(session)
+            self.assertEqual('good', devices[leaf0].l2Status)
+            self.assertEqual('unknown', devices[leaf1].l2Status)
+            self.assertEqual('good', devices[leaf2].l3Status)
+
+    def testStopWritesPending(self):
+        self.sink.submit([(UPDATE, Device, self.deviceIds[0], {'l2Status': 'good'})])
+        self.sink.stop()
+        with self._dao.getReadSession() as session:
+            self.assertEqual('good', self.getDevices(session)[self.deviceIds[0]].l2Status)
+
+class TestStatusSinkThread(unittest.TestCase):
+    def setUp(self):
+        self.written = []
+        self.flushed = threading.Event()
+        self.sink = StatusSink(flexmock(getReadWriteSession = FakeSession), {'batchSize': 2, 'flushInterval': 0.05})
+        flexmock(self.sink).should_receive('_write').replace_with(self.write)
+
+    def tearDown(self):
+        self.sink.stop()
+
+    def write(self, session, updates):
+        self.written.append(updates)
+        self.flushed.set()
+
+    def testFlushInterval(self):
+        self.sink.submit([(UPDATE, Device, '1', {'l2Status': 'good'})])
+        self.assertTrue(self.flushed.wait(5))
+        self.assertEqual([[(UPDATE, Device, '1', {'l2Status': 'good'})]], self.written)
+
+    def testSubmitNotSplit(self):
+        self.sink.flushInterval = 3600
+        # batchSize is reached in the middle of the submit
+        updates = [(UPDATE, Device, str(i), {'l2Status': 'good'}) for i in xrange(3)]
+        self.sink.submit(updates)
+        self.assertTrue(self.flushed.wait(5))
+        self.assertEqual([updates], self.written)
+
+class FakeSession(object):
+    def __enter__(self):
+        return None
+    def __exit__(self, *args):
+        return False
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,66 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import sys
+sys.path.insert(0,os.path.abspath(os.path.dirname(__file__) + '/' + '../..')) #trick to make it run from CLI
+
+import unittest
+import shutil
+from flexmock import flexmock
+from jinja2 import TemplateNotFound
+
+from jnpr.openclos.templateRegistry import TemplateRegistry, junosTemplates, cablingPlanTemplates
+from jnpr.openclos.propLoader import OpenClosProperty
+
+class TestTemplateRegistry(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'out', 'templateCache')
+        # registry is process-wide, other tests might have created it already
+        TemplateRegistry.getInstance()
+        TemplateRegistry._destroy()
+
+    def tearDown(self):
+        TemplateRegistry._destroy()
+        shutil.rmtree(os.path.dirname(self.cacheDir), ignore_errors=True)
+
+    def testGetTemplateCompilesOnce(self):
+        registry = TemplateRegistry.getInstance()
+        template = registry.getTemplate(junosTemplates, 'protocolBgp.txt')
+        self.assertIsNotNone(template)
+        self.assertIs(template, registry.getTemplate(junosTemplates, 'protocolBgp.txt'))
+        self.assertEqual({'hits': 1, 'misses': 1, 'templates': 1}, registry.getStats())
+
+    def testGetTemplateUnknown(self):
+        registry = TemplateRegistry.getInstance()
+        with self.assertRaises(TemplateNotFound) as e:
+            registry.getTemplate(cablingPlanTemplates, 'unknown-template')
+        self.assertTrue('unknown-template' in e.exception.message)
+        self.assertEqual(0, registry.getStats()['templates'])
+
+    def testWarmUp(self):
+        registry = TemplateRegistry.getInstance()
+        registry.warmUp()
+        stats = registry.getStats()
+        self.assertEqual(0, stats['hits'])
+        self.assertEqual(stats['templates'], stats['misses'])
+        self.assertEqual(len(registry.getEnvironment(junosTemplates).list_templates()) + 
+                         len(registry.getEnvironment(cablingPlanTemplates).list_templates()), stats['templates'])
+
+        registry.getTemplate(cablingPlanTemplates, 'threeStage.json')
+        self.assertEqual(1, registry.getStats()['hits'])
+        
+    def testEnvironmentSettings(self):
+        registry = TemplateRegistry.getInstance()
+        self.assertTrue(registry.getEnvironment(junosTemplates).keep_trailing_newline)
+        self.assertTrue(registry.getEnvironment(cablingPlanTemplates).lstrip_blocks)
+
+    def testBytecodeCache(self):
+        flexmock(OpenClosProperty).should_receive('getProperties').and_return({'templateBytecodeCache': self.cacheDir})
+        registry = TemplateRegistry.getInstance()
+        registry.getTemplate(junosTemplates, 'protocolBgp.txt')
+        self.assertEqual(1, len(os.listdir(self.cacheDir)))
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
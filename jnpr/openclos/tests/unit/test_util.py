@@ -28,6 +28,18 @@ class TestFunctions(unittest.TestCase):
         mgmtIps = getMgmtIps("192.168.48.216/25", None, None, 5)
         self.assertEqual(mgmtIpList, mgmtIps)
 
+        # never past end of the network
+        self.assertEqual(["1.2.3.254/24", "1.2.3.255/24"], getMgmtIps("1.2.3.254/24", None, None, 5))
+        self.assertEqual(["10.0.1.10/16", "10.0.1.11/16"], getMgmtIps(None, "10.0.1.10", 16, 2))
+        self.assertEqual([], getMgmtIps(None, None, None, 2))
+
+    def testGetMgmtIpRange(self):
+        self.assertEqual((int(IPAddress('1.2.3.1')), int(IPAddress('1.2.3.6'))), getMgmtIpRange("1.2.3.1/24", None, None, 6))
+        self.assertEqual((int(IPAddress('1.2.3.254')), int(IPAddress('1.2.3.255'))), getMgmtIpRange("1.2.3.254/24", None, None, 5))
+        self.assertEqual((int(IPAddress('10.0.1.10')), int(IPAddress('10.0.1.10'))), getMgmtIpRange("1.2.3.1/24", "10.0.1.10", 16, 1))
+        self.assertIsNone(getMgmtIpRange("1.2.3.1/24", None, None, 0))
+        self.assertIsNone(getMgmtIpRange(None, None, None, 5))
+
     def testIsZtpStaged(self):
         self.assertFalse(isZtpStaged(None))
         self.assertFalse(isZtpStaged({}))
@@ -77,6 +89,30 @@ class TestFunctions(unittest.TestCase):
         self.assertEqual(93000100, interfaceNameToUniqueSequenceNumber('access-1.0'))
         self.assertEqual(93000101, interfaceNameToUniqueSequenceNumber('access-1.1'))
 
+    def testInterfaceNameToUniqueSequenceNumberCached(self):
+        interfaceNameToUniqueSequenceNumber.cacheClear()
+        for name in ['et-0/0/0.0', 'uplink-1.1', 'lo0', 'et-0/0/0.0', None, '', '-']:
+            self.assertEqual(interfaceNameToUniqueSequenceNumber.uncached(name), interfaceNameToUniqueSequenceNumber(name))
+        self.assertEqual(6, interfaceNameToUniqueSequenceNumber.cacheSize())
+        self.assertIsNone(interfaceNameToUniqueSequenceNumber('-'))
+
+    def testLruCacheEvictsLeastRecentlyUsed(self):
+        calls = []
+        @lruCache(4)
+        def square(value):
+            calls.append(value)
+            return value * value
+        
+        for value in [1, 2, 3, 4, 1, 1]:
+            self.assertEqual(value * value, square(value))
+        self.assertEqual([1, 2, 3, 4], calls)
+        # over maxSize: least recently used half goes, 1 was used last
+        square(5)
+        self.assertEqual(2, square.cacheSize())
+        square(1)
+        square(2)
+        self.assertEqual([1, 2, 3, 4, 5, 2], calls)
+
     def testLo0IrbVmeToUniqueSequenceNumber(self):
         seqNumSet = set()
         
@@ -89,6 +125,13 @@ class TestFunctions(unittest.TestCase):
         
         self.assertEqual(6, len(seqNumSet))
 
+    def testLoadClosDefinitionCached(self):
+        closDefinition = loadClosDefinition()
+        self.assertIs(closDefinition, loadClosDefinition())
+        with self.assertRaises(TypeError):
+            closDefinition['ztp']['dhcpSubnet'] = '10.0.0.0/24'
+        self.assertIsNone(loadClosDefinition('non-existing.yaml'))
+
     def testGetOutFolderPath(self):
         from test_model import createPodObj
         pod = createPodObj('testPod')
@@ -138,6 +138,19 @@ class TestZtp(unittest.TestCase):
         self.assertEquals('10.20.30.1', globalSetting['defaultRoute'])
         self.assertEquals('10.20.30.2', globalSetting['rangeStart'])
         self.assertEquals('10.20.30.126', globalSetting['rangeEnd'])
+
+    def testPopulateDhcpGlobalSettingsLargeSubnet(self):
+        from jnpr.openclos.l3Clos import util
+        flexmock(util, loadClosDefinition = {'ztp': {'dhcpSubnet': '10.20.0.0/16'}})
+        globalSetting = self.ztpServer.populateDhcpGlobalSettings()
+        
+        self.assertEquals('10.20.255.255', globalSetting['broadcast'])
+        self.assertEquals('10.20.0.1', globalSetting['defaultRoute'])
+        self.assertEquals('10.20.0.2', globalSetting['rangeStart'])
+        self.assertEquals('10.20.255.254', globalSetting['rangeEnd'])
+        # each call gets its own copy of the cached subnet settings
+        globalSetting['devices'] = []
+        self.assertNotIn('devices', self.ztpServer.populateDhcpGlobalSettings())
         
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
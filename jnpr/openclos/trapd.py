@@ -14,8 +14,9 @@ import util
 import signal
 import sys
 import subprocess
-import concurrent.futures
 from devicePlugin import TwoStageConfigurator 
+from collectorEngine import CollectorEngine
+from templateRegistry import TemplateRegistry
 from propLoader import OpenClosProperty, loadLoggingConfig
 from exception import TrapDaemonError
 
@@ -90,7 +91,7 @@ def onTrap(transportDispatcher, transportDomain, transportAddress, wholeMsg):
                 return
             
         configurator = TwoStageConfigurator(deviceIp=transportAddress[0], stopEvent=trapReceiver.stopEvent)
-        trapReceiver.executor.submit(configurator.start2StageConfiguration)        
+        trapReceiver.collectorEngine.submit(configurator.start2StageConfiguration)        
 
 class TrapReceiver():
     def __init__(self, conf = {}):
@@ -114,10 +115,11 @@ class TrapReceiver():
         else:
             logger.info("snmpTrap:openclos_trap_group:port is missing from configuration. using %d" % (self.port))                
             
+        # own engine, 2-stage configuration holds a slot while waiting for the device
         if 'snmpTrap' in self.__conf and 'threadCount' in self.__conf['snmpTrap']:
-            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = self.__conf['snmpTrap']['threadCount'])
+            self.collectorEngine = CollectorEngine({'maxInFlight': self.__conf['snmpTrap']['threadCount']})
         else:
-            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = DEFAULT_MAX_THREADS)
+            self.collectorEngine = CollectorEngine({'maxInFlight': DEFAULT_MAX_THREADS})
 
         # event to stop from sleep
         self.stopEvent = Event()
@@ -148,6 +150,8 @@ class TrapReceiver():
 
     def start(self):
         logger.info("Starting trap receiver...")
+        # compile leaf config templates before first trap
+        TemplateRegistry.getInstance().warmUp()
         self.thread = Thread(target=self.threadFunction, args=())
         self.thread.start()
         logger.info("Trap receiver started on %s:%d" % (self.target, self.port))
@@ -155,7 +159,8 @@ class TrapReceiver():
     def stop(self):
         logger.info("Stopping trap receiver...")
         self.stopEvent.set()
-        self.executor.shutdown()
+        # devices waiting for a slot are not configured
+        self.collectorEngine.shutdown()
         self.transportDispatcher.jobFinished(1)  
         self.thread.join()
         logger.info("Trap receiver stopped")
@@ -10,23 +10,41 @@ import yaml
 import platform
 import datetime
 import shutil
-from netaddr import IPNetwork
+import itertools
+import functools
+import threading
+import hashlib
+from netaddr import IPNetwork, IPAddress
 import netifaces
-from propLoader import propertyFileLocation
+from propLoader import propertyFileLocation, freeze
 
 TWO_STAGE_CONFIGURATOR_DEFAULT_ATTEMPT=5
 TWO_STAGE_CONFIGURATOR_DEFAULT_INTERVAL=30 # in seconds
 TWO_STAGE_CONFIGURATOR_DEFAULT_VCP_LLDP_DELAY=40 # in seconds
 
     
+# file name with path -> (modification time, clos definition)
+_closDefinitionCache = {}
+_closDefinitionCacheLock = threading.Lock()
+
 def loadClosDefinition(closDefination = os.path.join(propertyFileLocation, 'closTemplate.yaml')):
     '''
-    Loads clos definition from yaml file
+    Loads clos definition from yaml file, parsed once and shared read-only
+    until the file modification time changes
     '''
     try:
+        modificationTime = os.path.getmtime(closDefination)
+        with _closDefinitionCacheLock:
+            cached = _closDefinitionCache.get(closDefination)
+            if cached is not None and cached[0] == modificationTime:
+                return cached[1]
+
         stream = open(closDefination, 'r')
-        yamlStream = yaml.load(stream)
+        yamlStream = freeze(yaml.load(stream))
+        stream.close()
         
+        with _closDefinitionCacheLock:
+            _closDefinitionCache[closDefination] = (modificationTime, yamlStream)
         return yamlStream
     except (OSError, IOError) as e:
         print "File error:", e
@@ -68,23 +86,36 @@ def getMgmtIps(prefix, startingIP, mask, count):
     count -- number of devices
     '''
     mgmtIps = []
-    cidr = None
-    if startingIP is not None and mask is not None:
-        cidr = startingIP + '/' + str(mask)
-    else:
-        cidr = prefix
-        
-    if cidr is not None:
+    cidr = _getMgmtCidr(prefix, startingIP, mask)
+    ipRange = getMgmtIpRange(prefix, startingIP, mask, count)
+    if ipRange is not None:
         ipNetwork = IPNetwork(cidr)
-        ipNetworkList = list(ipNetwork)
-        start = ipNetworkList.index(ipNetwork.ip)
-        end = start + count
-        ipList = ipNetworkList[start:end]
-        for ip in ipList:
-            mgmtIps.append(str(ip) + '/' + str(ipNetwork.prefixlen))
+        for value in xrange(ipRange[0], ipRange[1] + 1):
+            mgmtIps.append(str(IPAddress(value, ipNetwork.version)) + '/' + str(ipNetwork.prefixlen))
 
     return mgmtIps
 
+def _getMgmtCidr(prefix, startingIP, mask):
+    if startingIP is not None and mask is not None:
+        return startingIP + '/' + str(mask)
+    else:
+        return prefix
+
+def getMgmtIpRange(prefix, startingIP, mask, count):
+    '''
+    returns (first, last) management IP as integers for given number of devices,
+    same IPs as getMgmtIps, None if there is no IP
+    '''
+    cidr = _getMgmtCidr(prefix, startingIP, mask)
+    if cidr is None or count <= 0:
+        return None
+    
+    ipNetwork = IPNetwork(cidr)
+    start = ipNetwork.value
+    # never past end of the network
+    end = min(start + count - 1, ipNetwork.last)
+    return (start, end)
+
 def getMgmtIpsForLeaf():
     return []
 
@@ -139,7 +170,49 @@ def getImageNameForDevice(pod, device):
     
     return None
 
-otherPortRegx = re.compile(r"[0-9A-Za-z]+\.?(\d{0,2})")
+def lruCache(maxSize):
+    '''
+    Memoizes a function of hashable positional arguments, python 2.7 has no
+    functools.lru_cache. A hit only stamps the entry, when size goes over maxSize
+    the least recently used half is evicted at once, so a hit costs a dict lookup.
+    Decorated function has cacheClear() and uncached (the original function).
+    '''
+    def decorator(function):
+        cache = {}
+        clock = itertools.count()
+        lock = threading.Lock()
+        
+        def wrapper(*args):
+            entry = cache.get(args)
+            if entry is not None:
+                entry[1] = next(clock)
+                return entry[0]
+            result = function(*args)
+            with lock:
+                cache[args] = [result, next(clock)]
+                if len(cache) > maxSize:
+                    leastRecentlyUsed = sorted(cache.items(), key=lambda item: item[1][1])
+                    for key, entry in leastRecentlyUsed[:len(cache) - maxSize / 2]:
+                        del cache[key]
+            return result
+        
+        def cacheClear():
+            with lock:
+                cache.clear()
+        wrapper = functools.wraps(function)(wrapper)
+        wrapper.cacheClear = cacheClear
+        wrapper.cacheSize = lambda: len(cache)
+        wrapper.uncached = function
+        return wrapper
+    return decorator
+
+# IFD/IFL of FPC/PIC/port, IFD/IFL with fake name, anything else starting with alphanumeric
+interfaceNameRegx = re.compile(r"([a-z]+)-(\d)\/(\d)\/(\d{1,3})\.?(\d{0,2})|(uplink|access)-(\d{1,3})\.?(\d{0,2})|[0-9A-Za-z]")
+fakeNameSequenceNumberStart = {'uplink': (90000000, 91000000), 'access': (92000000, 93000000)}
+# a pod uses few distinct names, repeated on every device
+interfaceSequenceNumberCacheSize = 10000
+
+@lruCache(interfaceSequenceNumberCacheSize)
 def interfaceNameToUniqueSequenceNumber(interfaceName):
     '''    
     :param str: name, examples: 
@@ -151,64 +224,36 @@ def interfaceNameToUniqueSequenceNumber(interfaceName):
     if interfaceName is None or interfaceName == '':
         return None
     
-    sequenceNum = _matchFpcPicPort(interfaceName)
-    if sequenceNum != None:
-        return sequenceNum
-    sequenceNum = _matchFakeName(interfaceName)
-    if sequenceNum != None:
-        return sequenceNum
-
-    match = otherPortRegx.match(interfaceName)
-    if match is not None:
-        return int(interfaceName.encode('hex'), 16)
-
-fpcPicPortRegx = re.compile(r"([a-z]+)-(\d)\/(\d)\/(\d{1,3})\.?(\d{0,2})")
-def _matchFpcPicPort(interfaceName):
-    match = fpcPicPortRegx.match(interfaceName)
-    if match is not None:
-        speed = match.group(1)
-        fpc = match.group(2)
-        pic = match.group(3)
-        port = match.group(4)
-        unit = match.group(5)
-        if not unit:
-            unit = 0
-            
-        if 'et' in speed:
-            speedInt = 1
-        elif 'xe' in speed:
-            speedInt = 2
-        elif 'ge' in speed:
-            speedInt = 3
-        else:
-            speedInt = 4
-        
-        sequenceNum = 100000 * speedInt + 10000 * int(fpc) + 1000 * int(pic) + int(port)
-        
-        if unit != 0:
+    match = interfaceNameRegx.match(interfaceName)
+    if match is None:
+        return None
+    speed, fpc, pic, port, unit, fakeName, fakePort, fakeUnit = match.groups()
+    
+    if speed is not None:
+        sequenceNum = 100000 * _speedToInt(speed) + 10000 * int(fpc) + 1000 * int(pic) + int(port)
+        if unit:
             sequenceNum = 100 * sequenceNum + int(unit)
-        
         return sequenceNum
     
-fakeNameRegxList = [(re.compile(r"uplink-(\d{1,3})\.?(\d{0,2})"), 90000000, 91000000),
-                    (re.compile(r"access-(\d{1,3})\.?(\d{0,2})"), 92000000, 93000000)
-                    ]
-def _matchFakeName(interfaceName):
-    for fakeNameRegx, intfStart, subIntfStart in fakeNameRegxList:
-        match = fakeNameRegx.match(interfaceName)
-        if match is not None:
-            port = match.group(1)
-            unit = match.group(2)
-            if not unit:
-                unit = 0
-            
-            sequenceNum = intfStart + int(port)
-            
-            if unit != 0:
-                sequenceNum = subIntfStart + 100 * int(port) + int(unit)
-            
-            return sequenceNum
+    if fakeName is not None:
+        intfStart, subIntfStart = fakeNameSequenceNumberStart[fakeName]
+        if fakeUnit:
+            return subIntfStart + 100 * int(fakePort) + int(fakeUnit)
+        return intfStart + int(fakePort)
+
+    return int(interfaceName.encode('hex'), 16)
+
+def _speedToInt(speed):
+    if 'et' in speed:
+        return 1
+    elif 'xe' in speed:
+        return 2
+    elif 'ge' in speed:
+        return 3
+    else:
+        return 4
 
+fpcPicPortRegx = re.compile(r"([a-z]+)-(\d)\/(\d)\/(\d{1,3})\.?(\d{0,2})")
 def getPortNumberFromName(interfaceName):
     match = fpcPicPortRegx.match(interfaceName)
     if match is not None:
@@ -229,6 +274,16 @@ def replaceFpcNumberOfInterface(interfaceName, newFpc):
         return match.group(1) + '-' + newFpc + '/' + match.group(3)
     
     
+def getContentEtag(content):
+    '''
+    :returns str: quoted sha1 of the content for ETag header, None if content is None
+    '''
+    if content is None:
+        return None
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return '"' + hashlib.sha1(content).hexdigest() + '"'
+
 def getOutFolderPath(conf, ipFabric):
     if 'outputDir' in conf:
         outputDir = os.path.join(conf['outputDir'], ipFabric.id+'-'+ipFabric.name)
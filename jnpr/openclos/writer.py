@@ -6,18 +6,20 @@ Created on Aug 14, 2014
 import pydot
 import os
 import logging
-from jinja2 import Environment, PackageLoader
 
-from model import InterfaceDefinition, AdditionalLink, BgpLink
+from model import InterfaceDefinition, AdditionalLink
+from fabricIndex import FabricIndex
+from templateRegistry import TemplateRegistry, cablingPlanTemplates
 import util
 from propLoader import loadLoggingConfig
 
-templateLocation = os.path.join('conf', 'cablingPlanTemplates')
-
 moduleName = 'writer'
 loadLoggingConfig(appName = moduleName)
 logger = logging.getLogger(moduleName)
 
+# ETag of a generated file is written next to it, <file name><etagFileSuffix>
+etagFileSuffix = '.etag'
+
 class WriterBase():
     def __init__(self, conf, pod, dao):       
         self._dao = dao
@@ -59,6 +61,9 @@ class DhcpConfWriter(WriterBase):
             logger.info('Writing dhcpd.conf for pod: %s' % (self._pod.name))
             with open(os.path.join(self.outputDir, 'dhcpd.conf'), 'w') as f:
                     f.write(dhcpConf)
+            # served as ETag of dhcpd.conf
+            with open(os.path.join(self.outputDir, 'dhcpd.conf' + etagFileSuffix), 'w') as f:
+                    f.write(util.getContentEtag(dhcpConf))
         else:
             logger.error('No content, skipping writing dhcpd.conf for pod: %s' % (self._pod.name))
 
@@ -70,15 +75,12 @@ class DhcpConfWriter(WriterBase):
         else:
             logger.error('No content, skipping writing single dhcpd.conf for all pods')
 
-cablingPlanTemplatePackage = 'jnpr.openclos'
-
 class CablingPlanWriter(WriterBase):
     def __init__(self, conf, pod, dao):
         WriterBase.__init__(self, conf, pod, dao)
-        self.templateEnv = Environment(loader=PackageLoader(cablingPlanTemplatePackage, templateLocation))
-        #self.templateEnv.trim_blocks = True
-        self.templateEnv.lstrip_blocks = True
-        self.template = self.templateEnv.get_template(self._pod.topologyType + '.json')
+        templateRegistry = TemplateRegistry.getInstance()
+        self.templateEnv = templateRegistry.getEnvironment(cablingPlanTemplates)
+        self.template = templateRegistry.getTemplate(cablingPlanTemplates, self._pod.topologyType + '.json')
 
     def writeJSON(self):
         if self._pod.topologyType == 'threeStage':
@@ -91,18 +93,19 @@ class CablingPlanWriter(WriterBase):
     def getDataFor3StageCablingPlan(self):            
         devices = []
         links = []
-        for device in self._pod.devices:
-            devices.append({'id': device.id, 'name': device.name, 'family': device.family, 'role': device.role, 'deployStatus': device.deployStatus})
-            if device.role == 'spine':
-                continue
-            with self._dao.getReadSession() as session:
-                leafPeerPorts = self._dao.getConnectedInterconnectIFDsFilterFakeOnes(session, device)
+        with self._dao.getReadSession() as session:
+            fabricIndex = FabricIndex(session, self._pod)
+            for device in self._pod.devices:
+                devices.append({'id': device.id, 'name': device.name, 'family': device.family, 'role': device.role, 'deployStatus': device.deployStatus})
+                if device.role == 'spine':
+                    continue
+                leafPeerPorts = fabricIndex.getConnectedInterconnectIFDsFilterFakeOnes(device)
                 for port in leafPeerPorts:
-                    leafInterconnectIp = port.layerAboves[0].ipaddress #there is single IFL as layerAbove, so picking first one
-                    spinePeerPort = port.peer
-                    spineInterconnectIp = spinePeerPort.layerAboves[0].ipaddress #there is single IFL as layerAbove, so picking first one
+                    leafInterconnectIp = fabricIndex.getLayerAboves(port)[0].ipaddress #there is single IFL as layerAbove, so picking first one
+                    spinePeerPort = fabricIndex.getPeer(port)
+                    spineInterconnectIp = fabricIndex.getLayerAboves(spinePeerPort)[0].ipaddress #there is single IFL as layerAbove, so picking first one
                     links.append({'linkType': 'interconnect', 'device1': device.name, 'port1': port.name, 'ip1': leafInterconnectIp, 
-                                  'device2': spinePeerPort.device.name, 'port2': spinePeerPort.name, 'ip2': spineInterconnectIp})
+                                  'device2': fabricIndex.getDevice(spinePeerPort.device_id).name, 'port2': spinePeerPort.name, 'ip2': spineInterconnectIp})
 
         return {'devices': devices, 'links': links}
     
@@ -242,41 +245,47 @@ class CablingPlanWriter(WriterBase):
 class L2ReportWriter(WriterBase):
     def __init__(self, conf, pod, dao):
         WriterBase.__init__(self, conf, pod, dao)
-        self.templateEnv = Environment(loader=PackageLoader('jnpr.openclos', templateLocation))
-        #self.templateEnv.trim_blocks = True
-        self.templateEnv.lstrip_blocks = True
         # load L2Report template
-        self.l2ReportTemplate = self.templateEnv.get_template(self._pod.topologyType + 'L2Report.json')
+        self.l2ReportTemplate = TemplateRegistry.getInstance().getTemplate(cablingPlanTemplates, self._pod.topologyType + 'L2Report.json')
 
     def getDataFor3StageL2Report(self):            
         devices = []
         links = []
-        for device in self._pod.devices:
-            if device.deployStatus == 'deploy':
-                devices.append({'id': device.id, 'name': device.name, 'family': device.family, 'role': device.role, 'status': device.l2Status, 'reason': device.l2StatusReason, 'deployStatus': device.deployStatus})
-                if device.role == 'spine':
-                    continue
-                with self._dao.getReadSession() as session:
-                    leafPeerPorts = self._dao.getConnectedInterconnectIFDsFilterFakeOnes(session, device)
-                    for port in leafPeerPorts:
-                        leafInterconnectIp = port.layerAboves[0].ipaddress #there is single IFL as layerAbove, so picking first one
-                        spinePeerPort = port.peer
-                        spineInterconnectIp = spinePeerPort.layerAboves[0].ipaddress #there is single IFL as layerAbove, so picking first one
-                        if spinePeerPort.device.deployStatus == 'deploy':
-                            links.append({'linkType': 'interconnect', 'device1': device.name, 'port1': port.name, 'ip1': leafInterconnectIp, 
-                                          'device2': spinePeerPort.device.name, 'port2': spinePeerPort.name, 'ip2': spineInterconnectIp, 'status': port.status})
-
         with self._dao.getReadSession() as session:
-            # additional links
-            additionalLinkList = []
-            additionalLinks = session.query(AdditionalLink).all()
-            if additionalLinks is not None:
-                for link in additionalLinks:
-                    additionalLinkList.append({'device1': link.device1, 'port1': link.port1, 
-                                               'device2': link.device2, 'port2': link.port2, 
-                                               'lldpStatus': link.lldpStatus})
+            fabricIndex = FabricIndex(session, self._pod)
+            for device in self._pod.devices:
+                if device.deployStatus == 'deploy':
+                    devices.append({'id': device.id, 'name': device.name, 'family': device.family, 'role': device.role, 'status': device.l2Status, 'reason': device.l2StatusReason, 'deployStatus': device.deployStatus})
+                    if device.role == 'spine':
+                        continue
+                    links += self.getLeafLinks(fabricIndex, device)
+
+            additionalLinkList = self.getAdditionalLinks(session)
 
         return {'devices': devices, 'links': links, 'additionalLinks': additionalLinkList}
+
+    def getLeafLinks(self, fabricIndex, device):
+        links = []
+        leafPeerPorts = fabricIndex.getConnectedInterconnectIFDsFilterFakeOnes(device)
+        for port in leafPeerPorts:
+            leafInterconnectIp = fabricIndex.getLayerAboves(port)[0].ipaddress #there is single IFL as layerAbove, so picking first one
+            spinePeerPort = fabricIndex.getPeer(port)
+            spineInterconnectIp = fabricIndex.getLayerAboves(spinePeerPort)[0].ipaddress #there is single IFL as layerAbove, so picking first one
+            spineDevice = fabricIndex.getDevice(spinePeerPort.device_id)
+            if spineDevice.deployStatus == 'deploy':
+                links.append({'linkType': 'interconnect', 'device1': device.name, 'port1': port.name, 'ip1': leafInterconnectIp, 
+                              'device2': spineDevice.name, 'port2': spinePeerPort.name, 'ip2': spineInterconnectIp, 'status': port.status})
+        return links
+
+    def getAdditionalLinks(self, session):
+        additionalLinkList = []
+        additionalLinks = session.query(AdditionalLink).all()
+        if additionalLinks is not None:
+            for link in additionalLinks:
+                additionalLinkList.append({'device1': link.device1, 'port1': link.port1, 
+                                           'device2': link.device2, 'port2': link.port2, 
+                                           'lldpStatus': link.lldpStatus})
+        return additionalLinkList
         
     def getThreeStageL2ReportJson(self):
         '''
@@ -299,27 +308,30 @@ class L2ReportWriter(WriterBase):
 class L3ReportWriter(WriterBase):
     def __init__(self, conf, pod, dao):
         WriterBase.__init__(self, conf, pod, dao)
-        self.templateEnv = Environment(loader=PackageLoader('jnpr.openclos', templateLocation))
-        #self.templateEnv.trim_blocks = True
-        self.templateEnv.lstrip_blocks = True
-        self.l3ReportTemplate = self.templateEnv.get_template(self._pod.topologyType + 'L3Report.json')
+        self.l3ReportTemplate = TemplateRegistry.getInstance().getTemplate(cablingPlanTemplates, self._pod.topologyType + 'L3Report.json')
 
     def getDataFor3StageL3Report(self):            
         devices = []
         links = []
-        for device in self._pod.devices:
-            if device.deployStatus == 'deploy':
-                devices.append({'id': device.id, 'name': device.name, 'family': device.family, 'role': device.role, 'status': device.l3Status, 'reason': device.l3StatusReason, 'deployStatus': device.deployStatus})
-                if device.role == 'spine':
-                    continue
-                with self._dao.getReadSession() as session:
-                    bgpLinks = session.query(BgpLink).filter(BgpLink.device_id == device.id).all()
-                    for bgpLink in bgpLinks:
-                        links.append({'device1': bgpLink.device1, 'asn1': bgpLink.device1As, 'ip1': bgpLink.device1Ip, 
-                                      'device2': bgpLink.device2, 'asn2': bgpLink.device2As, 'ip2': bgpLink.device2Ip, 
-                                      'inPacket': bgpLink.input_msg_count, 'outPacket': bgpLink.output_msg_count, 'outQueue': bgpLink.out_queue_count, 'lastFlap': bgpLink.flap_count,
-                                      'status': bgpLink.link_state, 'routes': bgpLink.act_rx_acc_route_count})
+        with self._dao.getReadSession() as session:
+            fabricIndex = FabricIndex(session, self._pod)
+            for device in self._pod.devices:
+                if device.deployStatus == 'deploy':
+                    devices.append({'id': device.id, 'name': device.name, 'family': device.family, 'role': device.role, 'status': device.l3Status, 'reason': device.l3StatusReason, 'deployStatus': device.deployStatus})
+                    if device.role == 'spine':
+                        continue
+                    links += self.getLeafPeers(fabricIndex, device)
         return {'devices': devices, 'links': links}
+
+    def getLeafPeers(self, fabricIndex, device):
+        links = []
+        bgpLinks = fabricIndex.getBgpLinks(device.id)
+        for bgpLink in bgpLinks:
+            links.append({'device1': bgpLink.device1, 'asn1': bgpLink.device1As, 'ip1': bgpLink.device1Ip, 
+                          'device2': bgpLink.device2, 'asn2': bgpLink.device2As, 'ip2': bgpLink.device2Ip, 
+                          'inPacket': bgpLink.input_msg_count, 'outPacket': bgpLink.output_msg_count, 'outQueue': bgpLink.out_queue_count, 'lastFlap': bgpLink.flap_count,
+                          'status': bgpLink.link_state, 'routes': bgpLink.act_rx_acc_route_count})
+        return links
         
     def getThreeStageL3ReportJson(self):
         '''
@@ -337,3 +349,48 @@ class L3ReportWriter(WriterBase):
         with open(path, 'w') as f:
                 f.write(l3ReportJson)
         return l3ReportJson
+
+class HealthReportWriter(L2ReportWriter, L3ReportWriter):
+    '''
+    Combined L2 and L3 report, device status of both layers, interconnect links
+    (LLDP) and BGP peers read from a single FabricIndex
+    '''
+    def __init__(self, conf, pod, dao):
+        WriterBase.__init__(self, conf, pod, dao)
+        self.healthReportTemplate = TemplateRegistry.getInstance().getTemplate(cablingPlanTemplates, self._pod.topologyType + 'HealthReport.json')
+
+    def getDataFor3StageHealthReport(self):
+        devices = []
+        links = []
+        peers = []
+        with self._dao.getReadSession() as session:
+            fabricIndex = FabricIndex(session, self._pod)
+            for device in self._pod.devices:
+                if device.deployStatus == 'deploy':
+                    devices.append({'id': device.id, 'name': device.name, 'family': device.family, 'role': device.role, 
+                                    'l2Status': device.l2Status, 'l2Reason': device.l2StatusReason, 
+                                    'l3Status': device.l3Status, 'l3Reason': device.l3StatusReason, 'deployStatus': device.deployStatus})
+                    if device.role == 'spine':
+                        continue
+                    links += self.getLeafLinks(fabricIndex, device)
+                    peers += self.getLeafPeers(fabricIndex, device)
+
+            additionalLinkList = self.getAdditionalLinks(session)
+
+        return {'devices': devices, 'links': links, 'additionalLinks': additionalLinkList, 'peers': peers}
+
+    def getThreeStageHealthReportJson(self):
+        '''
+        This method will be called by REST layer
+        :returns str: healthReport in json format.
+        '''
+        data = self.getDataFor3StageHealthReport()
+        return self.healthReportTemplate.render(devices = data['devices'], links = data['links'], additionalLinks = data['additionalLinks'], peers = data['peers'])
+
+    def writeThreeStageHealthReportJson(self):
+        healthReportJson = self.getThreeStageHealthReportJson()
+        path = os.path.join(self.outputDir, 'healthReport.json')
+        logger.info('Writing HealthReport: %s' % (path))
+        with open(path, 'w') as f:
+                f.write(healthReportJson)
+        return healthReportJson
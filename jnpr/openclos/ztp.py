@@ -10,6 +10,7 @@ from jinja2 import Environment, PackageLoader
 from netaddr import IPNetwork
 
 import util
+from ipAllocator import ipToString
 from model import Pod
 from dao import Dao
 from writer import DhcpConfWriter
@@ -24,6 +25,23 @@ logger = logging.getLogger(moduleName)
 
 ztpTemplateLocation = os.path.join('conf', 'ztp')
 
+@util.lruCache(maxSize = 100)
+def getDhcpSubnetSettings(dhcpSubnet):
+    '''
+    Network settings and default route/range of the dhcp subnet, computed from
+    first/last address of the subnet, hosts are not iterated
+    :returns dict: shared, do not modify
+    '''
+    dhcpBlock = IPNetwork(dhcpSubnet)
+    firstHost = dhcpBlock.first
+    lastHost = dhcpBlock.last
+    if dhcpBlock.prefixlen <= 30:
+        # same as iter_hosts(), no network and broadcast address
+        firstHost += 1
+        lastHost -= 1
+    return {'network': str(dhcpBlock.network), 'netmask': str(dhcpBlock.netmask), 'broadcast': str(dhcpBlock.broadcast),
+            'defaultRoute': ipToString(firstHost), 'rangeStart': ipToString(firstHost + 1), 'rangeEnd': ipToString(lastHost)}
+
 
 class ZtpServer():
     def __init__(self, conf = {}, templateEnv = None, daoClass = Dao):
@@ -107,27 +125,14 @@ class ZtpServer():
         return conf
 
     def populateDhcpGlobalSettings(self):
-        ztp = {}
         ztpGlobalSettings = util.loadClosDefinition()['ztp']
-        subnet = ztpGlobalSettings['dhcpSubnet']
-        dhcpBlock = IPNetwork(subnet)
-        ipList = list(dhcpBlock.iter_hosts())
-        ztp['network'] = str(dhcpBlock.network)
-        ztp['netmask'] = str(dhcpBlock.netmask)
-
-        ztp['defaultRoute'] = ztpGlobalSettings.get('dhcpOptionRoute')
-        if  ztp['defaultRoute'] is None or ztp['defaultRoute'] == '': 
-            ztp['defaultRoute'] = str(ipList[0])
-
-        ztp['rangeStart'] = ztpGlobalSettings.get('dhcpOptionRangeStart')
-        if  ztp['rangeStart'] is None or ztp['rangeStart'] == '': 
-            ztp['rangeStart'] = str(ipList[1])
+        ztp = dict(getDhcpSubnetSettings(ztpGlobalSettings['dhcpSubnet']))
 
-        ztp['rangeEnd'] = ztpGlobalSettings.get('dhcpOptionRangeEnd')
-        if  ztp['rangeEnd'] is None or ztp['rangeEnd'] == '': 
-            ztp['rangeEnd'] = str(ipList[-1])
+        for key, option in [('defaultRoute', 'dhcpOptionRoute'), ('rangeStart', 'dhcpOptionRangeStart'), ('rangeEnd', 'dhcpOptionRangeEnd')]:
+            value = ztpGlobalSettings.get(option)
+            if value is not None and value != '':
+                ztp[key] = value
 
-        ztp['broadcast'] = str(dhcpBlock.broadcast)
         ztp['httpServerIp'] = self.__conf['httpServer']['ipAddr']
         if ztpGlobalSettings.get('junosImage') is not None:
             # don't start url as /openclos/... first / causes ZTP problem